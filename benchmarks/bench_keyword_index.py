@@ -0,0 +1,145 @@
+"""
+关键词匹配基准测试
+对比逐条目匹配（check_keyword_match）与 KeywordIndex 一次性匹配的耗时
+
+用法: python benchmarks/bench_keyword_index.py [--sizes 1000 5000 20000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'fichara'))
+
+from models import WorldBookEntry  # noqa: E402
+from keyword_index import KeywordIndex  # noqa: E402
+
+WORDS = ['dragon', 'castle', 'sword', 'magic', 'forest', 'river', 'knight', 'queen',
+         '魔法', '法术', '王国', '骑士', '森林', '龙', '城堡', '精灵']
+
+
+def check_keyword_match(entry: WorldBookEntry, user_message: str) -> bool:
+    """逐条目检查关键词是否匹配（PromptBuilder 原来的实现，作为对照基准和正确性参考）"""
+    if not user_message:
+        return False
+
+    all_keywords = entry.keys + entry.secondary_keys
+
+    if not all_keywords:
+        return False
+
+    search_text = user_message
+
+    case_sensitive = entry.extensions.case_sensitive
+    if case_sensitive is None:
+        case_sensitive = False
+
+    if not case_sensitive:
+        search_text = search_text.lower()
+        all_keywords = [k.lower() for k in all_keywords]
+
+    use_regex = entry.use_regex
+    match_whole_words = entry.extensions.match_whole_words
+    if match_whole_words is None:
+        match_whole_words = False
+
+    for keyword in all_keywords:
+        if not keyword.strip():
+            continue
+
+        if use_regex:
+            try:
+                flags = 0 if case_sensitive else re.IGNORECASE
+                if re.search(keyword, user_message, flags):
+                    return True
+            except re.error:
+                if keyword in search_text:
+                    return True
+        else:
+            if match_whole_words:
+                pattern = r'\b' + re.escape(keyword) + r'\b'
+                flags = 0 if case_sensitive else re.IGNORECASE
+                if re.search(pattern, user_message, flags):
+                    return True
+            else:
+                if keyword in search_text:
+                    return True
+
+    return False
+
+
+def make_entries(n: int, seed: int = 0) -> list:
+    """生成 n 个条目，关键词混合普通文本、纯文本正则和真正的正则"""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(n):
+        word = rng.choice(WORDS)
+        kind = i % 5
+        if kind == 0:
+            keys, use_regex = [f'{word}{i}'], False
+        elif kind == 1:
+            keys, use_regex = [f'{word}{i}', f'别名{i}'], True
+        elif kind == 2:
+            keys, use_regex = [f'{word}{i}s?', f'(?:{word}|名字){i}'], True
+        elif kind == 3:
+            keys, use_regex = [f'{word}_{i}|{rng.choice(WORDS)}_{i}'], True
+        else:
+            keys, use_regex = [rf'\b{word}{i}\b'], True
+        entry = WorldBookEntry(id=i, keys=keys, use_regex=use_regex)
+        entry.extensions.match_whole_words = i % 7 == 0
+        entry.extensions.case_sensitive = i % 11 == 0
+        entries.append(entry)
+    return entries
+
+
+def make_text(n: int, words: int, seed: int = 1) -> str:
+    """生成包含少量命中关键词的扫描文本"""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(words):
+        word = rng.choice(WORDS)
+        parts.append(f'{word}{rng.randrange(n)}' if rng.random() < 0.05 else word)
+    return ' '.join(parts)
+
+
+def bench(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--words', type=int, default=200, help='扫描文本的词数')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'条目数':>8} | {'构建(ms)':>9} | {'逐条(ms)':>9} | {'索引(ms)':>9} | {'加速比':>6} | {'命中':>5}")
+    print("-" * 64)
+
+    for n in args.sizes:
+        entries = make_entries(n)
+        text = make_text(n, args.words)
+
+        start = time.perf_counter()
+        index = KeywordIndex(entries)
+        build = time.perf_counter() - start
+
+        expected = {i for i, e in enumerate(entries) if check_keyword_match(e, text)}
+        assert index.match(text) == expected
+
+        old = bench(lambda: [check_keyword_match(e, text) for e in entries], args.repeat)
+        new = bench(lambda: index.match(text), args.repeat)
+        print(f"{n:>8} | {build * 1000:>9.1f} | {old * 1000:>9.2f} | {new * 1000:>9.2f} | "
+              f"{old / new:>5.1f}x | {len(expected):>5}")
+
+
+if __name__ == '__main__':
+    main()
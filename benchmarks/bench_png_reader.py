@@ -0,0 +1,73 @@
+"""
+PNG 角色卡读取基准测试
+对比 Pillow 全量解码路径与直接遍历 PNG 块的读取路径
+
+用法: python benchmarks/bench_png_reader.py [--size 2048] [--repeat 20]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'fichara'))
+
+from PIL import Image  # noqa: E402
+from png_handler import load_card_data, save_card_data, _load_card_text_with_pillow  # noqa: E402
+
+
+def make_card(path: str, size: int):
+    """生成一张带噪声（难以压缩）的大尺寸角色卡"""
+    noise = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    carrier = path + '.carrier.png'
+    noise.save(carrier, 'PNG')
+
+    card = {
+        'spec': 'chara_card_v2',
+        'spec_version': '2.0',
+        'name': 'Bench',
+        'description': 'x' * 4096,
+    }
+    save_card_data(carrier, path, card)
+    os.remove(carrier)
+
+
+def load_with_pillow(path: str) -> dict:
+    """旧读取路径：Image.open + image.load()"""
+    return json.loads(base64.b64decode(_load_card_text_with_pillow(path)).decode('utf-8'))
+
+
+def bench(func, path: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(path)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=2048, help='图片边长（像素）')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'card.png')
+        make_card(path, args.size)
+        file_mb = os.path.getsize(path) / 1024 / 1024
+
+        assert load_with_pillow(path) == load_card_data(path)
+
+        pillow = bench(load_with_pillow, path, args.repeat)
+        chunks = bench(load_card_data, path, args.repeat)
+
+    print(f"图片: {args.size}x{args.size}, {file_mb:.1f} MB")
+    print(f"Pillow 解码:   {pillow * 1000:8.2f} ms/次")
+    print(f"PNG 块遍历:    {chunks * 1000:8.2f} ms/次")
+    print(f"加速比:        {pillow / chunks:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
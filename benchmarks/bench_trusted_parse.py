@@ -0,0 +1,97 @@
+"""
+可信构建基准测试
+对比 pydantic 完整校验与免校验构建（trusted=True）解析大型世界书的耗时
+
+用法: python benchmarks/bench_trusted_parse.py [--sizes 100 10000 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'fichara'))
+
+from models import parse_character_card  # noqa: E402
+from lorebook_handler import LorebookHandler  # noqa: E402
+
+
+def make_card(n: int) -> dict:
+    """生成包含 n 个条目的 V3 角色卡数据"""
+    entries = []
+    for i in range(n):
+        entries.append({
+            'id': i,
+            'keys': [f'key{i}', f'别名{i}'],
+            'secondary_keys': [],
+            'comment': f'条目 {i}',
+            'content': f'这是第 {i} 个条目的内容。' * 4,
+            'constant': i % 10 == 0,
+            'insertion_order': 100 + i % 50,
+            'position': 'before_char' if i % 2 else 'after_char',
+            'extensions': {
+                'position': i % 2,
+                'depth': i % 8,
+                'role': i % 3,
+                'probability': 100,
+                'case_sensitive': None,
+                'triggers': [],
+            },
+        })
+    return {
+        'spec': 'chara_card_v3',
+        'spec_version': '3.0',
+        'name': 'Bench',
+        'data': {
+            'name': 'Bench',
+            'character_book': {'name': 'book', 'entries': entries},
+        },
+    }
+
+
+def make_standalone(n: int) -> dict:
+    """生成包含 n 个条目的独立世界书数据"""
+    return {
+        'entries': {
+            str(i): {'uid': i, 'key': [f'key{i}'], 'content': f'内容 {i}', 'order': i, 'depth': 4}
+            for i in range(n)
+        }
+    }
+
+
+def bench(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'条目数':>8} | {'场景':<18} | {'校验(ms)':>10} | {'可信(ms)':>10} | {'加速比':>6}")
+    print("-" * 66)
+
+    for n in args.sizes:
+        # 可信数据来自自有存储，即已校验角色卡的完整导出
+        card = parse_character_card(make_card(n)).model_dump(by_alias=True)
+        validated = parse_character_card(card)
+        assert parse_character_card(card, trusted=True).model_dump() == validated.model_dump()
+
+        v = bench(lambda: parse_character_card(card), args.repeat)
+        t = bench(lambda: parse_character_card(card, trusted=True), args.repeat)
+        print(f"{n:>8} | {'parse_character_card':<18} | {v * 1000:>10.2f} | {t * 1000:>10.2f} | {v / t:>5.1f}x")
+
+        standalone = make_standalone(n)
+        v = bench(lambda: LorebookHandler.parse_standalone_lorebook(standalone), args.repeat)
+        t = bench(lambda: LorebookHandler.parse_standalone_lorebook(standalone, trusted=True), args.repeat)
+        print(f"{n:>8} | {'standalone lorebook':<18} | {v * 1000:>10.2f} | {t * 1000:>10.2f} | {v / t:>5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
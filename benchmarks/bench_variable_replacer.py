@@ -0,0 +1,83 @@
+"""
+变量替换基准测试
+对比旧实现（每次调用 re.sub + 闭包回调）与 VariableReplacer.replace 的耗时
+
+用法: python benchmarks/bench_variable_replacer.py [--repeat 5] [--calls 20000]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'fichara'))
+
+from variable_replacer import VariableReplacer  # noqa: E402
+
+
+def baseline_replace(replacer: VariableReplacer, text: str, context=None) -> str:
+    """旧实现：每次重新扫描文本，每次构建上下文字典"""
+    if not text:
+        return text
+
+    ctx = {
+        "user_name": replacer.user_name,
+        "char_name": replacer.char_name,
+    }
+    if context:
+        ctx.update(context)
+
+    def replace_match(match):
+        var_name = match.group(1).strip()
+        if var_name in replacer.variable_callbacks:
+            try:
+                return str(replacer.variable_callbacks[var_name](ctx))
+            except Exception:
+                return f"{{{{{var_name}}}}}"
+        return f"{{{{{var_name}}}}}"
+
+    return re.sub(r'\{\{([^}]+)\}\}', replace_match, text)
+
+
+PARAGRAPH = "{{char}} 是一名旅行者，总是和 {{user}} 一起行动。{{char}} 喜欢在夜晚讲故事。\n"
+
+CASES = {
+    '纯文本': "这是一段没有任何变量的角色描述。" * 20,
+    'pure 变量': PARAGRAPH * 10,
+    'render 变量': PARAGRAPH * 10 + "现在是 {{time}}。",
+    'volatile 变量': PARAGRAPH * 10 + "骰子: {{random}}",
+}
+
+
+def bench(func, calls: int, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    replacer = VariableReplacer(user_name="小明", char_name="爱丽丝")
+
+    print(f"{'模板':<12} | {'旧实现(us)':>10} | {'replace(us)':>11} | {'加速比':>6}")
+    print("-" * 50)
+
+    for name, text in CASES.items():
+        if 'random' not in text and 'time' not in text:
+            assert replacer.replace(text) == baseline_replace(replacer, text)
+        old = bench(lambda: baseline_replace(replacer, text), args.calls, args.repeat)
+        new = bench(lambda: replacer.replace(text), args.calls, args.repeat)
+        print(f"{name:<12} | {old * 1e6:>10.2f} | {new * 1e6:>11.2f} | {old / new:>5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+世界书激活基准测试
+测量大型世界书下 build_messages 的耗时（首次调用包含构建激活计划与关键词索引）
+
+用法: python benchmarks/bench_world_info.py [--sizes 1000 5000 20000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'fichara'))
+
+from models import parse_character_card  # noqa: E402
+from prompt_builder import PromptBuilder  # noqa: E402
+
+WORDS = ['dragon', 'castle', 'sword', 'magic', '魔法', '骑士', '森林']
+
+
+def make_card(n: int, seed: int = 0):
+    """生成包含 n 个条目的角色卡（混合常驻、禁用、延迟递归和自带扫描深度的条目）"""
+    rng = random.Random(seed)
+    entries = [{
+        'id': i,
+        'keys': [f'{rng.choice(WORDS)}{i}'],
+        'content': f'内容 {i}',
+        'constant': i % 500 == 0,
+        'enabled': i % 13 != 0,
+        'extensions': {
+            'position': i % 2,
+            'delay_until_recursion': 1 if i % 97 == 0 else 0,
+            'scan_depth': 3 if i % 7 == 0 else None,
+        },
+    } for i in range(n)]
+    return parse_character_card({
+        'spec': 'chara_card_v3',
+        'spec_version': '3.0',
+        'name': 'Bench',
+        'data': {
+            'name': 'Bench',
+            'description': '描述',
+            'character_book': {'scan_depth': 2, 'recursive_scanning': True, 'entries': entries},
+        },
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    history = [{'role': 'user' if j % 2 == 0 else 'assistant', 'content': f'dragon{j * 37} 魔法{j} 森林'}
+               for j in range(20)]
+    message = 'castle5 dragon12 magic100 魔法700 骑士'
+
+    print(f"{'条目数':>8} | {'首次(ms)':>9} | {'之后(ms)':>9} | {'激活':>5}")
+    print("-" * 42)
+
+    for n in args.sizes:
+        builder = PromptBuilder(make_card(n))
+
+        start = time.perf_counter()
+        builder.build_messages(user_message=message, chat_history=history)
+        first = time.perf_counter() - start
+
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            builder.build_messages(user_message=message, chat_history=history)
+            best = min(best, time.perf_counter() - start)
+
+        print(f"{n:>8} | {first * 1000:>9.1f} | {best * 1000:>9.2f} | {len(builder.last_activation):>5}")
+
+
+if __name__ == '__main__':
+    main()
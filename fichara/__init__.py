@@ -4,25 +4,59 @@ FiChara - SillyTavern Character Card Parser
 
 __version__ = "0.1.0"
 
-from .png_handler import load_card_data, save_card_data
-from .models import parse_character_card, CharacterCardV2, CharacterCardV3
+from .png_handler import load_card_data, save_card_data, read_card_data
+from .models import parse_character_card, CharacterCardV2, CharacterCardV3, CardView, card_view
 from .validator import CharacterCardValidator
 from .exporter import CharacterCardExporter
 from .lorebook_handler import LorebookHandler
 from .lorebook_manager import LorebookManager
+from .columnar_lorebook import ColumnarLorebook
+from .keyword_index import KeywordIndex
 from .variable_replacer import VariableReplacer
 from .prompt_builder import PromptBuilder
+from .card_loader import load_cards, CardLoadResult
+from .card_cache import CardCache
+from .card_stream import iter_lorebook_entries
+from .snapshot import dumps_snapshot, loads_snapshot, save_snapshot, load_snapshot
+from .instrumentation import metrics, Metrics
+from .tokenizer import (
+    Tokenizer, EncodingTokenizer, EstimateTokenizer, BPETokenizer, CachedTokenizer,
+    count_tokens, get_default_tokenizer, set_default_tokenizer,
+)
 
 __all__ = [
     'load_card_data',
     'save_card_data',
+    'read_card_data',
     'parse_character_card',
     'CharacterCardV2',
     'CharacterCardV3',
+    'CardView',
+    'card_view',
     'CharacterCardValidator',
     'CharacterCardExporter',
     'LorebookHandler',
     'LorebookManager',
+    'ColumnarLorebook',
+    'KeywordIndex',
     'VariableReplacer',
     'PromptBuilder',
+    'load_cards',
+    'CardLoadResult',
+    'CardCache',
+    'iter_lorebook_entries',
+    'dumps_snapshot',
+    'loads_snapshot',
+    'save_snapshot',
+    'load_snapshot',
+    'metrics',
+    'Metrics',
+    'Tokenizer',
+    'EncodingTokenizer',
+    'EstimateTokenizer',
+    'BPETokenizer',
+    'CachedTokenizer',
+    'count_tokens',
+    'get_default_tokenizer',
+    'set_default_tokenizer',
 ]
@@ -0,0 +1,218 @@
+# card_cache.py
+"""
+解析结果持久化缓存
+使用本地 SQLite 文件缓存已解析的角色卡（二进制快照格式），按文件身份（路径+大小+修改时间+inode）失效
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Union
+
+from card_loader import FileIdentity, file_identity
+from models import CharacterCardV2, CharacterCardV3, parse_character_card
+from png_handler import read_card_data
+from snapshot import dumps_snapshot, loads_snapshot
+from instrumentation import metrics, CARD_CACHE_HITS, CARD_CACHE_MISSES
+
+
+class CardCache:
+    """角色卡解析缓存（LRU 淘汰）"""
+
+    def __init__(self,
+                 db_path: str,
+                 max_entries: int = 10000,
+                 max_bytes: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            db_path: SQLite 文件路径（':memory:' 为内存缓存）
+            max_entries: 最大缓存条目数
+            max_bytes: 最大缓存数据总字节数（None 为不限制）
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cards (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                last_access INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_access ON cards(last_access)")
+        self._conn.commit()
+
+    # ============ 基础操作 ============
+
+    def get(self, path: str) -> Optional[Union[CharacterCardV2, CharacterCardV3]]:
+        """
+        读取缓存，文件已变化时视为未命中
+
+        Args:
+            path: 图片路径
+
+        Returns:
+            角色卡对象，未命中返回None
+        """
+        path = os.path.abspath(path)
+        try:
+            identity = file_identity(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode, payload FROM cards WHERE path = ?",
+                (path,)
+            ).fetchone()
+
+            if row is None or tuple(row[:3]) != identity:
+                self.misses += 1
+                metrics.increment(CARD_CACHE_MISSES)
+                return None
+
+            self._conn.execute(
+                "UPDATE cards SET last_access = ? WHERE path = ?",
+                (time.time_ns(), path)
+            )
+            self._conn.commit()
+            self.hits += 1
+            metrics.increment(CARD_CACHE_HITS)
+
+        try:
+            return loads_snapshot(row[3])[0]
+        except ValueError:
+            # 快照版本不匹配或数据已损坏，视为未命中，重新解析
+            self.invalidate(path)
+            return None
+
+    def put(self,
+            path: str,
+            card: Union[CharacterCardV2, CharacterCardV3],
+            identity: Optional[FileIdentity] = None) -> bool:
+        """
+        写入缓存
+
+        Args:
+            path: 图片路径
+            card: 角色卡对象
+            identity: 读取文件之前记录的文件身份（card_loader.file_identity）；None 时使用当前文件状态。
+                      文件在读取之后被修改（当前身份不同）时不写入，旧的解析结果不会以新身份缓存
+
+        Returns:
+            是否写入
+        """
+        path = os.path.abspath(path)
+        try:
+            current = file_identity(path)
+        except OSError:
+            return False
+        if identity is None:
+            identity = current
+        elif tuple(identity) != current:
+            return False
+
+        size, mtime_ns, inode = identity
+        payload = dumps_snapshot(card)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, inode, payload, time.time_ns())
+            )
+            self._evict()
+            self._conn.commit()
+        return True
+
+    def load(self, path: str) -> Union[CharacterCardV2, CharacterCardV3]:
+        """
+        读取并解析角色卡（优先使用缓存）
+
+        Args:
+            path: 图片路径
+
+        Returns:
+            角色卡对象
+        """
+        card = self.get(path)
+        if card is None:
+            identity = file_identity(os.path.abspath(path))
+            card = parse_character_card(read_card_data(path))
+            self.put(path, card, identity)
+        return card
+
+    def invalidate(self, path: str):
+        """
+        删除指定文件的缓存
+
+        Args:
+            path: 图片路径
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM cards WHERE path = ?", (os.path.abspath(path),))
+            self._conn.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cards")
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ============ 淘汰 ============
+
+    def _evict(self):
+        """按最近访问时间淘汰超出限制的条目（调用方持有锁）"""
+        count = self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cards WHERE path IN "
+                "(SELECT path FROM cards ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+        if self.max_bytes is None:
+            return
+
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM cards"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # 从最久未访问的开始删除，直到总大小回到限制以内
+        excess = total - self.max_bytes
+        victims = []
+        for path, length in self._conn.execute(
+                "SELECT path, LENGTH(payload) FROM cards ORDER BY last_access"):
+            victims.append((path,))
+            excess -= length
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM cards WHERE path = ?", victims)
@@ -0,0 +1,189 @@
+# card_loader.py
+"""
+批量角色卡加载
+使用进程池并行读取、解析目录中的角色卡
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple, Union
+
+from models import CharacterCardV2, CharacterCardV3, parse_character_card
+from png_handler import read_card_data
+
+if TYPE_CHECKING:
+    from card_cache import CardCache
+
+PathLike = Union[str, os.PathLike]
+
+# 文件身份：(大小, 修改时间(ns), inode)
+FileIdentity = Tuple[int, int, int]
+
+
+@dataclass
+class CardLoadResult:
+    """单个文件的加载结果"""
+    path: str  # 文件路径
+    card: Optional[Union[CharacterCardV2, CharacterCardV3]] = None  # 解析后的角色卡
+    error: Optional[str] = None  # 错误描述
+    error_type: Optional[str] = None  # 异常类名
+    identity: Optional[FileIdentity] = None  # 读取前记录的文件身份（写入缓存时使用）
+
+    @property
+    def ok(self) -> bool:
+        """是否加载成功"""
+        return self.error is None
+
+
+def file_identity(path: str) -> FileIdentity:
+    """
+    文件身份（大小、修改时间、inode），任一变化都说明文件已被修改或替换
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        (大小, 修改时间(ns), inode)
+    """
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def load_card(path: PathLike) -> CardLoadResult:
+    """
+    加载单个角色卡，异常会被记录到结果中而不是抛出
+
+    Args:
+        path: 图片路径
+
+    Returns:
+        CardLoadResult 对象
+    """
+    path = os.fspath(path)
+    try:
+        # 先记录身份再读取：读取之后文件被修改时，身份与缓存写入时的状态不一致
+        identity = file_identity(path)
+        data = read_card_data(path)
+        return CardLoadResult(path=path, card=parse_character_card(data), identity=identity)
+    except Exception as e:
+        return CardLoadResult(path=path, error=str(e), error_type=type(e).__name__)
+
+
+def _load_chunk(paths: List[str]) -> List[CardLoadResult]:
+    """进程池任务：加载一组文件"""
+    return [load_card(path) for path in paths]
+
+
+def iter_card_paths(paths_or_dir: Union[PathLike, Iterable[PathLike]],
+                    pattern: str = "*.png") -> Iterator[str]:
+    """
+    展开路径参数，目录会被递归搜索
+
+    Args:
+        paths_or_dir: 单个文件/目录，或它们的列表
+        pattern: 目录中匹配的文件名模式
+
+    Returns:
+        文件路径迭代器
+    """
+    if isinstance(paths_or_dir, (str, os.PathLike)):
+        paths_or_dir = [paths_or_dir]
+
+    for item in paths_or_dir:
+        item = Path(item)
+        if item.is_dir():
+            for path in sorted(item.rglob(pattern)):
+                if path.is_file():
+                    yield str(path)
+        else:
+            yield str(item)
+
+
+def load_cards(paths_or_dir: Union[PathLike, Iterable[PathLike]],
+               workers: Optional[int] = None,
+               chunksize: int = 32,
+               pattern: str = "*.png",
+               cache: Optional["CardCache"] = None) -> Iterator[CardLoadResult]:
+    """
+    并行批量加载角色卡，按完成顺序逐个返回结果
+
+    Args:
+        paths_or_dir: 单个文件/目录，或它们的列表
+        workers: 进程数（None 为 CPU 核数，1 或 0 为当前进程串行加载）
+        chunksize: 每个进程任务处理的文件数
+        pattern: 目录中匹配的文件名模式
+        cache: 解析缓存（可选），命中的文件不会再交给进程池
+
+    Returns:
+        CardLoadResult 迭代器（成功时 card 有值，失败时 error 有值）
+
+    Example:
+        for result in load_cards("cards/", workers=8):
+            if result.ok:
+                print(result.card.name)
+            else:
+                print(f"{result.path}: {result.error}")
+    """
+    paths = iter_card_paths(paths_or_dir, pattern)
+
+    if cache is not None:
+        yield from _load_cards_cached(paths, workers, chunksize, cache)
+        return
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        for path in paths:
+            yield load_card(path)
+        return
+
+    def chunks() -> Iterator[List[str]]:
+        chunk = []
+        for path in paths:
+            chunk.append(path)
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # 限制同时提交的任务数，避免一次性把所有路径都放进队列
+    max_pending = workers * 2
+    pending_chunks = chunks()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in pending_chunks:
+            pending.add(executor.submit(_load_chunk, chunk))
+            if len(pending) >= max_pending:
+                break
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+                next_chunk = next(pending_chunks, None)
+                if next_chunk is not None:
+                    pending.add(executor.submit(_load_chunk, next_chunk))
+
+
+def _load_cards_cached(paths: Iterator[str],
+                       workers: Optional[int],
+                       chunksize: int,
+                       cache: "CardCache") -> Iterator[CardLoadResult]:
+    """先查缓存，未命中的文件再并行加载并写回缓存"""
+    misses = []
+    for path in paths:
+        card = cache.get(path)
+        if card is not None:
+            yield CardLoadResult(path=path, card=card)
+        else:
+            misses.append(path)
+
+    for result in load_cards(misses, workers=workers, chunksize=chunksize):
+        if result.ok:
+            cache.put(result.path, result.card, result.identity)
+        yield result
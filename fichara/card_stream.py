@@ -0,0 +1,327 @@
+# card_stream.py
+"""
+角色卡流式读取
+增量解码 base64 并增量解析 JSON，逐个返回世界书条目，避免同时持有整个负载的多份副本
+"""
+
+import binascii
+import codecs
+import json
+import re
+import zlib
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from models import WorldBookEntry
+from png_handler import find_card_chunk
+
+# 世界书条目数组在角色卡 JSON 中的位置（V2 顶层 / V3 及标准 V2 的 data 对象）
+ENTRY_PATHS = (
+    ('character_book', 'entries'),
+    ('data', 'character_book', 'entries'),
+)
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# 字符串内容中完整的部分（不含未配对的结尾反斜杠），后面紧跟引号时字符串结束
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_LITERAL = re.compile(r'[^ \t\n\r{}\[\]:,"]+')
+_B64_IGNORED = re.compile(rb'[^A-Za-z0-9+/=]')
+
+
+# ============ PNG 文本块 → 文本片段 ============
+
+def _iter_chunk_text(stream: BinaryIO,
+                     chunk_type: bytes,
+                     length: int,
+                     data_offset: int,
+                     block_size: int) -> Iterator[bytes]:
+    """
+    分块读取文本块的文本部分（压缩块会增量解压）
+
+    Args:
+        stream: PNG 文件对象
+        chunk_type: tEXt / iTXt / zTXt
+        length: 块数据长度
+        data_offset: 块数据起始偏移
+        block_size: 每次读取的字节数
+
+    Returns:
+        文本字节片段迭代器
+    """
+    stream.seek(data_offset)
+    # 关键字(最长79) + 各类头部字段都很短，一次读入后再解析
+    head = stream.read(min(length, 1024))
+    _, _, rest = head.partition(b'\x00')
+
+    compressed = False
+    if chunk_type == b'zTXt':
+        compressed = True
+        rest = rest[1:]
+    elif chunk_type == b'iTXt':
+        compressed = bool(rest[0])
+        _, _, rest = rest[2:].partition(b'\x00')
+        _, _, rest = rest.partition(b'\x00')
+
+    remaining = length - len(head)
+    decompressor = zlib.decompressobj() if compressed else None
+
+    def blocks() -> Iterator[bytes]:
+        nonlocal remaining
+        yield rest
+        while remaining > 0:
+            block = stream.read(min(block_size, remaining))
+            if not block:
+                raise ValueError("PNG 文件不完整")
+            remaining -= len(block)
+            yield block
+
+    for block in blocks():
+        if decompressor is not None:
+            block = decompressor.decompress(block)
+        if block:
+            yield block
+
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def _iter_decoded_text(pieces: Iterator[bytes]) -> Iterator[str]:
+    """
+    增量 base64 解码 + 增量 UTF-8 解码
+
+    Args:
+        pieces: base64 文本字节片段
+
+    Returns:
+        JSON 文本片段迭代器
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = b''
+
+    for piece in pieces:
+        pending += _B64_IGNORED.sub(b'', piece)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            text = decoder.decode(binascii.a2b_base64(pending[:usable]))
+            pending = pending[usable:]
+            if text:
+                yield text
+
+    if pending:
+        raise ValueError("base64 数据长度不正确")
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+# ============ 增量 JSON 解析 ============
+
+class _Frame:
+    """容器帧"""
+    __slots__ = ('is_object', 'path', 'key', 'expect_key', 'is_target')
+
+    def __init__(self, is_object: bool, path: Tuple[str, ...], is_target: bool):
+        self.is_object = is_object
+        self.path = path
+        self.key: Optional[str] = None
+        self.expect_key = is_object
+        self.is_target = is_target
+
+
+class JsonArrayStreamer:
+    """
+    增量 JSON 解析器
+    只跟踪容器结构，把指定路径数组中的元素逐个切出并解析，其它内容读过即丢弃
+    """
+
+    def __init__(self, target_paths: Tuple[Tuple[str, ...], ...] = ENTRY_PATHS):
+        """
+        Args:
+            target_paths: 目标数组的键路径
+        """
+        self.target_paths = set(target_paths)
+        self.buf = ''
+        self.pos = 0
+        self.stack: List[_Frame] = []
+        # 正在截取的元素：(起始位置, 所在栈深度)
+        self.capture: Optional[Tuple[int, int]] = None
+        # 未结束的字符串已扫描到的位置（下次从这里继续，不从引号处重新扫描）
+        self.string_resume: Optional[int] = None
+        # 未结束的字符串是否需要保留内容（键名或截取中的元素）
+        self.string_keep = False
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        输入一段 JSON 文本
+
+        Args:
+            text: 文本片段
+
+        Returns:
+            本次完整解析出的目标数组元素
+        """
+        self.buf += text
+
+        items = []
+        self._scan(items, final=False)
+
+        # 不需要保留的字符串值（例如很长的头像、开场白）：丢弃已扫描的内容，只留开头的引号
+        if self.string_resume is not None and not self.string_keep:
+            self.buf = '"' + self.buf[self.string_resume:]
+            self.pos = 0
+            self.string_resume = 1
+            return items
+
+        # 丢弃已处理的文本（截取中的元素需要保留）
+        keep_from = self.capture[0] if self.capture is not None else self.pos
+        if keep_from:
+            self.buf = self.buf[keep_from:]
+            self.pos -= keep_from
+            if self.capture is not None:
+                self.capture = (0, self.capture[1])
+            if self.string_resume is not None:
+                self.string_resume -= keep_from
+        return items
+
+    def close(self) -> List[Any]:
+        """输入结束，返回剩余元素并检查 JSON 是否完整"""
+        items = []
+        self._scan(items, final=True)
+        if self.stack or self.buf[self.pos:].strip():
+            raise ValueError("JSON 数据不完整")
+        return items
+
+    def _scan(self, items: List[Any], final: bool):
+        buf = self.buf
+        end = len(buf)
+
+        while True:
+            pos = _WHITESPACE.match(buf, self.pos).end()
+            if pos >= end:
+                self.pos = pos
+                return
+
+            ch = buf[pos]
+            top = self.stack[-1] if self.stack else None
+
+            # 目标数组中新元素的开始
+            if (top is not None and top.is_target and self.capture is None
+                    and not top.expect_key and ch not in ',]'):
+                self.capture = (pos, len(self.stack))
+
+            if ch == '"':
+                is_key = top is not None and top.is_object and top.expect_key
+                start = self.string_resume if self.string_resume is not None else pos + 1
+                body_end = _STRING_BODY.match(buf, start).end()
+                if body_end >= end or buf[body_end] != '"':
+                    # 字符串未结束（或以未配对的反斜杠结尾），记录扫描位置，等待更多数据
+                    self.pos = pos
+                    self.string_resume = body_end
+                    self.string_keep = is_key or self.capture is not None
+                    return
+                self.string_resume = None
+                token_end = body_end + 1
+                if is_key:
+                    top.key = json.loads(buf[pos:token_end])
+                    top.expect_key = False
+                    self.pos = token_end
+                    continue
+                self.pos = token_end
+                self._value_done(items)
+            elif ch == '{' or ch == '[':
+                path = self._child_path(top)
+                is_target = ch == '[' and path in self.target_paths
+                self.stack.append(_Frame(ch == '{', path, is_target))
+                self.pos = pos + 1
+            elif ch == '}' or ch == ']':
+                self.stack.pop()
+                self.pos = pos + 1
+                self._value_done(items)
+            elif ch == ',':
+                if top is not None and top.is_object:
+                    top.expect_key = True
+                self.pos = pos + 1
+            elif ch == ':':
+                self.pos = pos + 1
+            else:
+                m = _LITERAL.match(buf, pos)
+                if m.end() >= end and not final:
+                    # 数字可能被截断，等待更多数据
+                    self.pos = pos
+                    return
+                self.pos = m.end()
+                self._value_done(items)
+
+    def _child_path(self, top: Optional[_Frame]) -> Tuple[str, ...]:
+        """计算新容器的键路径（数组元素记为 '*'）"""
+        if top is None:
+            return ()
+        if top.is_object:
+            return top.path + (top.key,)
+        return top.path + ('*',)
+
+    def _value_done(self, items: List[Any]):
+        """一个值解析完成"""
+        if self.capture is not None and self.capture[1] == len(self.stack):
+            start = self.capture[0]
+            items.append(json.loads(self.buf[start:self.pos]))
+            self.capture = None
+
+
+# ============ 对外接口 ============
+
+def iter_card_json_text(image_path: str, block_size: int = 1 << 16) -> Iterator[str]:
+    """
+    流式读取角色卡 JSON 文本
+
+    Args:
+        image_path: PNG 图片路径
+        block_size: 每次读取的字节数
+
+    Returns:
+        JSON 文本片段迭代器
+    """
+    with open(image_path, 'rb') as f:
+        chunk = find_card_chunk(f)
+        if chunk is None:
+            raise ValueError("图片中未找到 chara 或 ccv3 元数据")
+        chunk_type, length, data_offset = chunk
+        yield from _iter_decoded_text(_iter_chunk_text(f, chunk_type, length, data_offset, block_size))
+
+
+def iter_lorebook_entries_raw(image_path: str, block_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取角色卡中的世界书条目（原始字典）
+
+    Args:
+        image_path: PNG 图片路径
+        block_size: 每次读取的字节数
+
+    Returns:
+        条目字典迭代器
+    """
+    streamer = JsonArrayStreamer()
+    for text in iter_card_json_text(image_path, block_size):
+        yield from streamer.feed(text)
+    yield from streamer.close()
+
+
+def iter_lorebook_entries(image_path: str, block_size: int = 1 << 16) -> Iterator[WorldBookEntry]:
+    """
+    流式读取角色卡中的世界书条目
+    峰值内存约为单个条目的大小，而不是整个角色卡负载的数倍
+
+    Args:
+        image_path: PNG 图片路径
+        block_size: 每次读取的字节数
+
+    Returns:
+        WorldBookEntry 迭代器
+
+    Example:
+        for entry in iter_lorebook_entries("huge_card.png"):
+            print(entry.id, entry.comment)
+    """
+    for entry_data in iter_lorebook_entries_raw(image_path, block_size):
+        yield WorldBookEntry(**entry_data)
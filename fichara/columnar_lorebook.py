@@ -0,0 +1,437 @@
+# columnar_lorebook.py
+"""
+列式世界书
+把条目字段按列存放在 array 中，字符串放入共享字符串表，适合条目非常多的世界书
+"""
+
+import sys
+from array import array
+from collections import Counter
+from itertools import compress, repeat
+from operator import eq, ge, le, ne
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from models import CharacterBook, WorldBookEntry, WorldBookEntryExtensions, construct_model
+from tokenizer import Tokenizer, count_tokens
+
+# 可选整数的空值标记
+_NONE_INT = -(1 << 63)
+
+# 列定义：(字段名, 是否属于 extensions)
+_INT_FIELDS = (
+    ('id', False), ('insertion_order', False),
+    ('position', True), ('display_index', True), ('depth', True), ('probability', True),
+    ('selectiveLogic', True), ('delay_until_recursion', True), ('group_weight', True), ('role', True),
+)
+_OPTIONAL_INT_FIELDS = (
+    ('scan_depth', True), ('sticky', True), ('cooldown', True), ('delay', True),
+)
+_BOOL_FIELDS = (
+    ('constant', False), ('selective', False), ('enabled', False), ('use_regex', False),
+    ('useProbability', True), ('exclude_recursion', True), ('prevent_recursion', True),
+    ('group_override', True), ('use_group_scoring', True), ('vectorized', True),
+    ('match_persona_description', True), ('match_character_description', True),
+    ('match_character_personality', True), ('match_character_depth_prompt', True),
+    ('match_scenario', True), ('match_creator_notes', True), ('ignore_budget', True),
+)
+_OPTIONAL_BOOL_FIELDS = (
+    ('match_whole_words', True), ('case_sensitive', True),
+)
+_STRING_FIELDS = (
+    ('comment', False), ('content', False), ('entry_position', False),
+    ('group', True), ('outlet_name', True), ('automation_id', True),
+)
+_STRING_LIST_FIELDS = ('keys', 'secondary_keys')
+
+# 0/1 字节掩码取反
+_INVERT = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+
+def _bytes_or(a, b) -> bytes:
+    """两个等长 0/1 字节掩码按位或（借助大整数一次完成）"""
+    return (int.from_bytes(a, 'little') | int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+def _bytes_and(a, b) -> bytes:
+    """两个等长 0/1 字节掩码按位与"""
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+# 与 LorebookManager.get_statistics 一致的位置名称
+POSITION_NAMES = {
+    0: "角色定义之前",
+    1: "角色定义之后",
+    2: "作者注释之前",
+    3: "作者注释之后",
+    4: "@D 在深度",
+    5: "示例消息前",
+    6: "示例消息后",
+    7: "Outlet"
+}
+
+
+class StringTable:
+    """共享字符串表（相同字符串只保存一份）"""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        """添加字符串，返回其编号"""
+        index = self._index.get(value)
+        if index is None:
+            index = len(self.strings)
+            self._index[value] = index
+            self.strings.append(value)
+        return index
+
+    def __getitem__(self, index: int) -> str:
+        return self.strings[index]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class _EntryViews(Sequence):
+    """按需生成 WorldBookEntry 的只读序列"""
+
+    def __init__(self, book: "ColumnarLorebook"):
+        self._book = book
+
+    def __len__(self) -> int:
+        return len(self._book)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._book.entry(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self._book.entry(index)
+
+    def __iter__(self) -> Iterator[WorldBookEntry]:
+        for i in range(len(self)):
+            yield self._book.entry(i)
+
+
+class ColumnarLorebook:
+    """
+    列式世界书
+    数值、布尔字段存放在 array 中，字符串存放在共享字符串表中，
+    按需生成 WorldBookEntry 视图（视图是快照，修改不会写回）
+    """
+
+    def __init__(self,
+                 name: Optional[str] = None,
+                 description: Optional[str] = None,
+                 scan_depth: Optional[int] = None,
+                 token_budget: Optional[int] = None,
+                 recursive_scanning: Optional[bool] = None):
+        """
+        初始化空的列式世界书
+
+        Args:
+            name: 世界书名称
+            description: 世界书描述
+            scan_depth: 扫描深度
+            token_budget: Token 预算
+            recursive_scanning: 是否递归扫描
+        """
+        self.name = name
+        self.description = description
+        self.scan_depth = scan_depth
+        self.token_budget = token_budget
+        self.recursive_scanning = recursive_scanning
+
+        self.strings = StringTable()
+        self.columns: Dict[str, array] = {}
+        for field, _ in _INT_FIELDS + _OPTIONAL_INT_FIELDS:
+            self.columns[field] = array('q')
+        for field, _ in _BOOL_FIELDS + _OPTIONAL_BOOL_FIELDS:
+            self.columns[field] = array('b')
+        for field, _ in _STRING_FIELDS:
+            self.columns[field] = array('l')
+        for field in _STRING_LIST_FIELDS:
+            # 第 i 个条目的字符串编号位于 values[offsets[i]:offsets[i + 1]]
+            self.columns[field + '_offsets'] = array('l', [0])
+            self.columns[field + '_values'] = array('l')
+
+        # triggers 极少非空，稀疏保存
+        self.triggers: Dict[int, List[Any]] = {}
+
+        # 条目修改版本号（追加条目时递增，与 CharacterBook.version 含义相同）
+        self.version = 0
+
+    # ============ 构建与转换 ============
+
+    @classmethod
+    def from_book(cls, book: CharacterBook) -> "ColumnarLorebook":
+        """
+        从 CharacterBook 构建
+
+        Args:
+            book: 世界书对象
+
+        Returns:
+            ColumnarLorebook 对象
+        """
+        columnar = cls(
+            name=book.name,
+            description=book.description,
+            scan_depth=book.scan_depth,
+            token_budget=book.token_budget,
+            recursive_scanning=book.recursive_scanning
+        )
+        for entry in book.entries:
+            columnar.append(entry)
+        return columnar
+
+    def to_book(self) -> CharacterBook:
+        """
+        转换回 CharacterBook（生成所有条目）
+
+        Returns:
+            CharacterBook 对象
+        """
+        return construct_model(CharacterBook, {
+            'name': self.name,
+            'description': self.description,
+            'scan_depth': self.scan_depth,
+            'token_budget': self.token_budget,
+            'recursive_scanning': self.recursive_scanning,
+            'entries': [self.entry(i) for i in range(len(self))],
+        })
+
+    def append(self, entry: WorldBookEntry):
+        """
+        追加条目
+
+        Args:
+            entry: 世界书条目
+        """
+        cols = self.columns
+        ext = entry.extensions
+
+        for field, in_ext in _INT_FIELDS:
+            cols[field].append(getattr(ext if in_ext else entry, field))
+        for field, in_ext in _OPTIONAL_INT_FIELDS:
+            value = getattr(ext if in_ext else entry, field)
+            cols[field].append(_NONE_INT if value is None else value)
+        for field, in_ext in _BOOL_FIELDS:
+            cols[field].append(bool(getattr(ext if in_ext else entry, field)))
+        for field, in_ext in _OPTIONAL_BOOL_FIELDS:
+            value = getattr(ext if in_ext else entry, field)
+            cols[field].append(-1 if value is None else bool(value))
+        for field, in_ext in _STRING_FIELDS:
+            source = 'position' if field == 'entry_position' else field
+            cols[field].append(self.strings.add(getattr(ext if in_ext else entry, source)))
+        for field in _STRING_LIST_FIELDS:
+            values = cols[field + '_values']
+            values.extend(self.strings.add(k) for k in getattr(entry, field))
+            cols[field + '_offsets'].append(len(values))
+
+        if ext.triggers:
+            self.triggers[len(self) - 1] = list(ext.triggers)
+        self.version += 1
+
+    def __len__(self) -> int:
+        return len(self.columns['id'])
+
+    # ============ 条目视图 ============
+
+    def _string_list(self, field: str, index: int) -> List[str]:
+        offsets = self.columns[field + '_offsets']
+        values = self.columns[field + '_values']
+        strings = self.strings.strings
+        return [strings[i] for i in values[offsets[index]:offsets[index + 1]]]
+
+    def entry(self, index: int) -> WorldBookEntry:
+        """
+        生成第 index 个条目的 WorldBookEntry 视图
+
+        Args:
+            index: 条目下标
+
+        Returns:
+            WorldBookEntry 对象
+        """
+        cols = self.columns
+        strings = self.strings.strings
+        entry_data: Dict[str, Any] = {}
+        ext_data: Dict[str, Any] = {}
+
+        for field, in_ext in _INT_FIELDS:
+            (ext_data if in_ext else entry_data)[field] = cols[field][index]
+        for field, in_ext in _OPTIONAL_INT_FIELDS:
+            value = cols[field][index]
+            (ext_data if in_ext else entry_data)[field] = None if value == _NONE_INT else value
+        for field, in_ext in _BOOL_FIELDS:
+            (ext_data if in_ext else entry_data)[field] = bool(cols[field][index])
+        for field, in_ext in _OPTIONAL_BOOL_FIELDS:
+            value = cols[field][index]
+            (ext_data if in_ext else entry_data)[field] = None if value < 0 else bool(value)
+        for field, in_ext in _STRING_FIELDS:
+            key = 'position' if field == 'entry_position' else field
+            (ext_data if in_ext else entry_data)[key] = strings[cols[field][index]]
+        for field in _STRING_LIST_FIELDS:
+            entry_data[field] = self._string_list(field, index)
+
+        ext_data['triggers'] = list(self.triggers.get(index, ()))
+        entry_data['extensions'] = construct_model(WorldBookEntryExtensions, ext_data)
+        return construct_model(WorldBookEntry, entry_data)
+
+    @property
+    def entries(self) -> Sequence[WorldBookEntry]:
+        """条目视图序列（与 CharacterBook.entries 的只读用法兼容）"""
+        return _EntryViews(self)
+
+    def entries_at(self, indices) -> List[WorldBookEntry]:
+        """
+        生成指定下标的条目视图
+
+        Args:
+            indices: 下标序列
+
+        Returns:
+            条目列表
+        """
+        return [self.entry(i) for i in indices]
+
+    # ============ 列式查询 ============
+
+    def indices_where(self, field: str, value) -> List[int]:
+        """
+        查找某列等于指定值的条目下标
+
+        Args:
+            field: 列名（如 'role'、'depth'、'constant'）
+            value: 值
+
+        Returns:
+            下标列表
+        """
+        column = self.columns[field]
+        return list(compress(range(len(column)), map(eq, column, repeat(value))))
+
+    def find_by_role(self, role: int) -> List[WorldBookEntry]:
+        """根据角色类型查找条目"""
+        return self.entries_at(self.indices_where('role', role))
+
+    def find_by_position(self, position: int) -> List[WorldBookEntry]:
+        """根据插入位置查找条目"""
+        return self.entries_at(self.indices_where('position', position))
+
+    def find_by_depth(self, min_depth: int = None, max_depth: int = None) -> List[WorldBookEntry]:
+        """根据深度范围查找条目"""
+        depth = self.columns['depth']
+        indices = range(len(depth))
+        values = depth
+        if min_depth is not None:
+            indices = list(compress(indices, map(le, repeat(min_depth), values)))
+            values = list(map(depth.__getitem__, indices))
+        if max_depth is not None:
+            indices = compress(indices, map(ge, repeat(max_depth), values))
+        return self.entries_at(indices)
+
+    def type_masks(self) -> Dict[str, bytes]:
+        """
+        条目类型掩码（每个条目一个字节，1 表示属于该类型）
+
+        Returns:
+            {'green': ..., 'blue': ..., 'vector': ...}
+        """
+        constant = self.columns['constant']
+        vectorized = self.columns['vectorized']
+        green = _bytes_or(constant, vectorized).translate(_INVERT)
+        return {
+            'green': green,
+            'blue': constant.tobytes(),
+            'vector': vectorized.tobytes(),
+        }
+
+    def find_by_type(self, entry_type: str) -> List[WorldBookEntry]:
+        """根据类型查找条目（'green'、'blue'、'vector'）"""
+        mask = self.type_masks().get(entry_type)
+        if mask is None:
+            return []
+        return self.entries_at(compress(range(len(self)), mask))
+
+    def _no_keywords_mask(self, green: bytes) -> bytes:
+        keys = self.columns['keys_offsets']
+        secondary = self.columns['secondary_keys_offsets']
+        # 偏移量不变的条目没有关键词
+        has_keys = bytes(map(ne, keys, keys[1:]))
+        has_secondary = bytes(map(ne, secondary, secondary[1:]))
+        return _bytes_and(green, _bytes_or(has_keys, has_secondary).translate(_INVERT))
+
+    def get_statistics(self, tokenizer: Optional[Tokenizer] = None) -> Dict:
+        """
+        获取统计信息（结构与 LorebookManager.get_statistics 相同）
+
+        Args:
+            tokenizer: 统计 token 数的分词器（None 时使用默认分词器）
+
+        Returns:
+            统计信息字典
+        """
+        cols = self.columns
+        total = len(self)
+        masks = self.type_masks()
+        enabled = sum(cols['enabled'])
+
+        # Counter 直接在 C 层统计 array 中的值
+        position_stats = {}
+        for pos, count in Counter(cols['position']).items():
+            pos_name = POSITION_NAMES.get(pos, f"位置{pos}")
+            position_stats[pos_name] = position_stats.get(pos_name, 0) + count
+
+        role_stats = Counter(cols['role'])
+        depth_distribution = dict(Counter(cols['depth']))
+
+        strings = self.strings.strings
+        # 只处理内容列引用到的字符串（关键词等其它字符串不参与）
+        content_counts = Counter(cols['content'])
+        total_content_length = sum(len(strings[i]) * n for i, n in content_counts.items())
+        # 相同内容在字符串表中只保存一次，每个只计算一次
+        estimated_tokens = sum(count_tokens(strings[i], tokenizer) * n for i, n in content_counts.items())
+        empty_entries = sum(n for i, n in content_counts.items() if not strings[i].strip())
+
+        return {
+            "total": total,
+            "by_type": {
+                "green": masks['green'].count(1),
+                "blue": masks['blue'].count(1),
+                "vector": masks['vector'].count(1)
+            },
+            "by_status": {
+                "enabled": enabled,
+                "disabled": total - enabled
+            },
+            "by_position": position_stats,
+            "by_role": {
+                "system": role_stats.get(0, 0),
+                "user": role_stats.get(1, 0),
+                "assistant": role_stats.get(2, 0)
+            },
+            "depth_distribution": depth_distribution,
+            "issues": {
+                "empty_entries": empty_entries,
+                "no_keywords": self._no_keywords_mask(masks['green']).count(1),
+                "has_duplicates": len(set(cols['id'])) < total
+            },
+            "content": {
+                "total_characters": total_content_length,
+                "estimated_tokens": estimated_tokens
+            }
+        }
+
+    def memory_usage(self) -> int:
+        """
+        估算占用的字节数（列数据 + 字符串表）
+
+        Returns:
+            字节数
+        """
+        size = sum(col.buffer_info()[1] * col.itemsize for col in self.columns.values())
+        size += sum(sys.getsizeof(s) for s in self.strings.strings)
+        return size
@@ -8,8 +8,11 @@ import json
 from typing import Union, Optional
 from pathlib import Path
 from PIL import Image
-from models import CharacterCardV2, CharacterCardV3
+from models import CharacterCardV2, CharacterCardV3, card_view
 from png_handler import save_card_data
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
 
 
 class CharacterCardExporter:
@@ -36,7 +39,7 @@ class CharacterCardExporter:
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=indent, ensure_ascii=ensure_ascii)
 
-        print(f"✅ 已导出JSON: {output_path}")
+        logger.info("已导出JSON: %s", output_path)
 
     @staticmethod
     def to_png(card: Union[CharacterCardV2, CharacterCardV3],
@@ -56,7 +59,7 @@ class CharacterCardExporter:
         # 写入PNG
         save_card_data(image_path, output_path, card_data)
 
-        print(f"✅ 已导出PNG: {output_path}")
+        logger.info("已导出PNG: %s", output_path)
 
     @staticmethod
     def from_json_to_png(json_path: str,
@@ -77,7 +80,7 @@ class CharacterCardExporter:
         # 写入PNG
         save_card_data(image_path, output_path, card_data)
 
-        print(f"✅ 已从JSON创建PNG: {output_path}")
+        logger.info("已从JSON创建PNG: %s", output_path)
 
     @staticmethod
     def change_image(original_png: str,
@@ -102,7 +105,7 @@ class CharacterCardExporter:
         # 使用新图片保存数据
         save_card_data(new_image, output_path, card_data)
 
-        print(f"✅ 已更换图片: {output_path}")
+        logger.info("已更换图片: %s", output_path)
 
     @staticmethod
     def create_png_from_scratch(card: Union[CharacterCardV2, CharacterCardV3],
@@ -160,7 +163,7 @@ class CharacterCardExporter:
         # 保存
         img.save(output_path, 'PNG')
 
-        print(f"✅ 已创建默认图片: {output_path}")
+        logger.info("已创建默认图片: %s", output_path)
 
         return output_path
 
@@ -175,65 +178,59 @@ class CharacterCardExporter:
         Returns:
             Markdown格式的字符串
         """
+        view = card_view(card)
+        # 基础字段读取角色卡顶层（V3 顶层与 data 不一致时以顶层为准，与之前的导出结果保持一致）
+        base = view.card
         lines = []
 
         # 标题
-        lines.append(f"# {card.name}")
+        lines.append(f"# {view.name}")
         lines.append("")
 
         # 基本信息
         lines.append("## 📋 基本信息")
         lines.append("")
-        lines.append(f"- **版本**: {card.spec} {card.spec_version}")
-
-        if isinstance(card, CharacterCardV3):
-            if card.data.creator:
-                lines.append(f"- **作者**: {card.data.creator}")
-            if card.data.character_version:
-                lines.append(f"- **角色版本**: {card.data.character_version}")
-        elif isinstance(card, CharacterCardV2):
-            if card.creator:
-                lines.append(f"- **作者**: {card.creator}")
-            if card.character_version:
-                lines.append(f"- **角色版本**: {card.character_version}")
-
-        if card.tags:
-            lines.append(f"- **标签**: {', '.join(card.tags)}")
+        lines.append(f"- **版本**: {view.spec} {view.spec_version}")
+
+        if view.creator:
+            lines.append(f"- **作者**: {view.creator}")
+        if view.character_version:
+            lines.append(f"- **角色版本**: {view.character_version}")
+
+        if base.tags:
+            lines.append(f"- **标签**: {', '.join(base.tags)}")
 
         lines.append("")
 
         # 角色描述
         lines.append("## 📝 角色描述")
         lines.append("")
-        lines.append(card.description if card.description else "*无描述*")
+        lines.append(base.description if base.description else "*无描述*")
         lines.append("")
 
         # 角色设定
-        if card.personality:
+        if base.personality:
             lines.append("## 🎭 角色设定")
             lines.append("")
-            lines.append(card.personality)
+            lines.append(base.personality)
             lines.append("")
 
         # 情景
-        if card.scenario:
+        if base.scenario:
             lines.append("## 🌍 情景设定")
             lines.append("")
-            lines.append(card.scenario)
+            lines.append(base.scenario)
             lines.append("")
 
         # 第一条消息
-        if card.first_mes:
+        if base.first_mes:
             lines.append("## 💬 开场白")
             lines.append("")
-            lines.append(f"> {card.first_mes}")
+            lines.append(f"> {base.first_mes}")
             lines.append("")
 
         # 额外开场白
-        if isinstance(card, CharacterCardV3):
-            alt_greetings = card.data.alternate_greetings
-        else:
-            alt_greetings = card.alternate_greetings
+        alt_greetings = view.alternate_greetings
 
         if alt_greetings:
             lines.append("### 额外开场白")
@@ -243,58 +240,35 @@ class CharacterCardExporter:
                 lines.append("")
 
         # 对话示例
-        if card.mes_example:
+        if base.mes_example:
             lines.append("## 💭 对话示例")
             lines.append("")
             lines.append("```")
-            lines.append(card.mes_example)
+            lines.append(base.mes_example)
             lines.append("```")
             lines.append("")
 
         # 提示词
-        if isinstance(card, CharacterCardV3):
-            if card.data.system_prompt:
-                lines.append("## ⚙️ 系统提示词")
-                lines.append("")
-                lines.append(f"```\n{card.data.system_prompt}\n```")
-                lines.append("")
-
-            if card.data.post_history_instructions:
-                lines.append("## 📌 底部提示词")
-                lines.append("")
-                lines.append(f"```\n{card.data.post_history_instructions}\n```")
-                lines.append("")
-
-            if card.data.creator_notes:
-                lines.append("## 📖 作者注释")
-                lines.append("")
-                lines.append(card.data.creator_notes)
-                lines.append("")
-        elif isinstance(card, CharacterCardV2):
-            if card.system_prompt:
-                lines.append("## ⚙️ 系统提示词")
-                lines.append("")
-                lines.append(f"```\n{card.system_prompt}\n```")
-                lines.append("")
+        if view.system_prompt:
+            lines.append("## ⚙️ 系统提示词")
+            lines.append("")
+            lines.append(f"```\n{view.system_prompt}\n```")
+            lines.append("")
 
-            if card.post_history_instructions:
-                lines.append("## 📌 底部提示词")
-                lines.append("")
-                lines.append(f"```\n{card.post_history_instructions}\n```")
-                lines.append("")
+        if view.post_history_instructions:
+            lines.append("## 📌 底部提示词")
+            lines.append("")
+            lines.append(f"```\n{view.post_history_instructions}\n```")
+            lines.append("")
 
-            if card.creator_notes:
-                lines.append("## 📖 作者注释")
-                lines.append("")
-                lines.append(card.creator_notes)
-                lines.append("")
+        if view.creator_notes:
+            lines.append("## 📖 作者注释")
+            lines.append("")
+            lines.append(view.creator_notes)
+            lines.append("")
 
         # 世界书统计
-        lorebook = None
-        if isinstance(card, CharacterCardV3):
-            lorebook = card.data.character_book
-        elif isinstance(card, CharacterCardV2):
-            lorebook = card.character_book
+        lorebook = view.character_book
 
         if lorebook and lorebook.entries:
             lines.append("## 📚 世界书")
@@ -363,7 +337,7 @@ class CharacterCardExporter:
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(markdown)
 
-        print(f"✅ 已导出Markdown: {output_path}")
+        logger.info("已导出Markdown: %s", output_path)
 
     @staticmethod
     def export_lorebook(card: Union[CharacterCardV2, CharacterCardV3],
@@ -378,14 +352,10 @@ class CharacterCardExporter:
         from lorebook_handler import LorebookHandler
 
         # 获取世界书
-        lorebook = None
-        if isinstance(card, CharacterCardV3):
-            lorebook = card.data.character_book
-        elif isinstance(card, CharacterCardV2):
-            lorebook = card.character_book
+        lorebook = card_view(card).character_book
 
         if not lorebook:
-            print("❌ 该角色卡没有世界书")
+            logger.warning("该角色卡没有世界书")
             return
 
         # 保存为独立格式
@@ -0,0 +1,140 @@
+# instrumentation.py
+"""
+日志与指标
+所有模块通过 logging 输出（默认不输出，由调用方配置 "fichara" 日志器），
+并把关键事件计入全局计数器，调用方可以随时读取或导出
+"""
+
+import itertools
+import logging
+import threading
+import weakref
+from collections import Counter
+from typing import Dict
+
+# 包日志器：默认不输出任何内容，需要时由调用方配置，例如
+#     logging.getLogger("fichara").setLevel(logging.DEBUG)
+#     logging.basicConfig()
+logger = logging.getLogger("fichara")
+logger.addHandler(logging.NullHandler())
+
+# ============ 指标名 ============
+
+UNKNOWN_VARIABLES = "variables.unknown"                  # 未知变量
+VARIABLE_ERRORS = "variables.errors"                     # 变量回调失败/超时
+VARIABLE_DEPTH_LIMIT = "variables.depth_limit"           # 达到最大嵌套深度
+VARIABLE_CACHE_HITS = "variables.cache_hits"             # pure/render 变量缓存命中
+TEMPLATE_CACHE_HITS = "variables.template_cache_hits"    # 模板编译缓存命中
+TEMPLATE_CACHE_MISSES = "variables.template_cache_misses"
+ENTRIES_ACTIVATED = "lorebook.entries_activated"         # 被激活的世界书条目
+INVALID_REGEX_KEYS = "lorebook.invalid_regex_keys"       # 无效的正则关键词（构建索引时计数）
+CARD_CACHE_HITS = "card_cache.hits"                      # 角色卡解析缓存命中
+CARD_CACHE_MISSES = "card_cache.misses"
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取模块日志器（统一挂在 "fichara" 下）
+
+    Args:
+        name: 模块名（通常为 __name__，包内和平铺导入时结果相同）
+
+    Returns:
+        Logger 对象
+    """
+    return logger.getChild(name.rpartition('.')[2])
+
+
+class _ThreadCounts:
+    """一个线程的计数字典（线程结束、对象被回收时合并到总数）"""
+    __slots__ = ('counts', '__weakref__')
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+
+class Metrics:
+    """
+    线程安全的计数器集合
+    每个线程只写自己的计数字典，计数时不加锁；读取时再把各线程的计数合并。
+    线程结束时它的计数合并到总数并释放字典；清零只记录基准值，不修改其它线程正在写入的字典
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        # 存活线程的计数字典（编号 -> 字典）
+        self._live: Dict[int, Dict[str, int]] = {}
+        # 已结束线程的计数总和
+        self._retired: Counter = Counter()
+        # 上次清零时的计数（读取时减去）
+        self._baseline: Dict[str, int] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _counts(self) -> Dict[str, int]:
+        """当前线程的计数字典（第一次计数时登记，线程结束时自动合并）"""
+        holder = _ThreadCounts()
+        thread_id = next(self._ids)
+        with self._lock:
+            self._live[thread_id] = holder.counts
+        # 线程局部数据在线程结束时释放，holder 随之被回收
+        weakref.finalize(holder, self._retire, thread_id)
+        self._local.holder = holder
+        self._local.counts = holder.counts
+        return holder.counts
+
+    def _retire(self, thread_id: int):
+        """线程结束：计数合并到总数"""
+        with self._lock:
+            counts = self._live.pop(thread_id, None)
+            if counts:
+                self._retired.update(counts)
+
+    def increment(self, name: str, value: int = 1):
+        """
+        计数
+
+        Args:
+            name: 指标名
+            value: 增量
+        """
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._counts()
+        counts[name] = counts.get(name, 0) + value
+
+    def _total(self) -> Counter:
+        """所有线程的计数总和（调用方持有锁）"""
+        total = Counter(self._retired)
+        for counts in list(self._live.values()):
+            total.update(counts.copy())
+        return total
+
+    def get(self, name: str) -> int:
+        """读取单个指标"""
+        with self._lock:
+            value = self._retired.get(name, 0)
+            value += sum(counts.get(name, 0) for counts in list(self._live.values()))
+            return value - self._baseline.get(name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """读取所有指标（副本）"""
+        with self._lock:
+            total = self._total()
+            baseline = self._baseline
+        return {name: value - baseline.get(name, 0)
+                for name, value in total.items()
+                if name not in baseline or value != baseline[name]}
+
+    def reset(self):
+        """清零所有指标"""
+        with self._lock:
+            self._baseline = dict(self._total())
+
+    def __repr__(self):
+        return f"Metrics({self.snapshot()})"
+
+
+# 全局指标
+metrics = Metrics()
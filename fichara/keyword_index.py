@@ -0,0 +1,568 @@
+# keyword_index.py
+"""
+世界书关键词索引
+为整本世界书的关键词构建 Aho-Corasick 自动机，扫描一遍文本即可得到所有命中的条目，
+耗时与文本长度成正比，而不是与 条目数 × 关键词数 成正比
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from models import WorldBookEntry
+from instrumentation import get_logger, metrics, INVALID_REGEX_KEYS
+
+logger = get_logger(__name__)
+
+# 正则元字符：不含这些字符的正则关键词等价于普通子串匹配
+_REGEX_METACHARS = frozenset('.^$*+?{}[]\\|()')
+
+# 合并为一个正则的关键词数量上限（过大的合并正则编译慢，命中后逐个复查的代价也更高）
+REGEX_CHUNK_SIZE = 32
+
+
+# re.IGNORECASE 认为相等、但 lower() 后仍不同的字符（与 CPython re 模块的大小写补充表一致），
+# 统一映射到同一个字符
+_IGNORECASE_FOLD = {
+    0x0131: 0x0069, 0x017f: 0x0073, 0x03b9: 0x0345, 0x03bc: 0x00b5, 0x03c3: 0x03c2,
+    0x03d0: 0x03b2, 0x03d1: 0x03b8, 0x03d5: 0x03c6, 0x03d6: 0x03c0, 0x03f0: 0x03ba,
+    0x03f1: 0x03c1, 0x03f5: 0x03b5, 0x1c80: 0x0432, 0x1c81: 0x0434, 0x1c82: 0x043e,
+    0x1c83: 0x0441, 0x1c84: 0x0442, 0x1c85: 0x0442, 0x1c86: 0x044a, 0x1c87: 0x0463,
+    0x1e9b: 0x1e61, 0x1fbe: 0x0345, 0x1fd3: 0x0390, 0x1fe3: 0x03b0, 0xa64b: 0x1c88,
+    0xfb06: 0xfb05,
+}
+
+
+def fold_case(text: str) -> str:
+    """
+    按 re.IGNORECASE 的规则折叠大小写（逐字符映射，长度不变）
+    两个字符串折叠后相等，当且仅当它们在 re.IGNORECASE 下逐字符匹配
+    """
+    # 'İ' 的 lower() 是两个字符，而 re 按简单映射把它当作 'i'
+    return text.replace('\u0130', 'i').lower().translate(_IGNORECASE_FOLD)
+
+
+def _is_word_char(ch: str) -> bool:
+    """与 re 的 \\w 一致（Unicode 字母数字和下划线）"""
+    return ch.isalnum() or ch == '_'
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    """text[index] 之前是否为单词边界（与 re 的 \\b 一致）"""
+    before = index > 0 and _is_word_char(text[index - 1])
+    after = index < len(text) and _is_word_char(text[index])
+    return before != after
+
+
+# 重复次数至少为 1 时，重复体的必需字面量也是整体的必需字面量
+_REPEATS = tuple(getattr(sre_parse, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                 if hasattr(sre_parse, name))
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)  # Python 3.11+
+
+
+def _literal_score(literals: Set[str]) -> Tuple[int, int]:
+    """必需字面量集合的过滤效果：最短的越长越好，其次数量越少越好"""
+    return min(map(len, literals)), -len(literals)
+
+
+def _required_in(items) -> Optional[Set[str]]:
+    """
+    计算一个正则序列的必需字面量
+
+    Returns:
+        字面量集合（任何匹配都至少包含其中一个），无法确定时返回 None
+    """
+    best: Optional[Set[str]] = None
+    run: List[str] = []
+
+    def consider(literals: Optional[Set[str]]):
+        nonlocal best
+        if literals and (best is None or _literal_score(literals) > _literal_score(best)):
+            best = literals
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            consider({''.join(run)})
+            run = []
+
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            # 局部改变标志（如 (?i:...)）时大小写规则不同，跳过
+            if not add_flags and not del_flags:
+                consider(_required_in(sub))
+        elif op is sre_parse.BRANCH:
+            union: Set[str] = set()
+            for branch in av[1]:
+                literals = _required_in(branch)
+                if not literals:
+                    union = set()
+                    break
+                union |= literals
+            consider(union)
+        elif op in _REPEATS:
+            if av[0] >= 1:
+                consider(_required_in(av[2]))
+        elif op is _ATOMIC_GROUP:
+            consider(_required_in(av))
+
+    if run:
+        consider({''.join(run)})
+    return best
+
+
+def required_literals(pattern: str, flags: int = 0) -> Optional[Set[str]]:
+    """
+    提取正则的必需字面量：任何匹配都至少包含其中一个
+    例如 dragon(s)? -> {'dragon'}，魔法|法术 -> {'魔法', '法术'}
+
+    Args:
+        pattern: 正则
+        flags: 编译标志
+
+    Returns:
+        字面量集合，无法确定时返回 None
+    """
+    try:
+        return _required_in(sre_parse.parse(pattern, flags))
+    except Exception:
+        return None
+
+
+class AhoCorasick:
+    """Aho-Corasick 多模式串匹配自动机"""
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        """
+        Args:
+            patterns: 模式串（按顺序分配编号，从 0 开始）
+        """
+        # 每个状态的转移表、失败指针、输出（模式编号）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        self.lengths: List[int] = []
+        self._built = False
+
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern: str) -> int:
+        """
+        添加模式串（必须在第一次匹配之前添加）
+
+        Args:
+            pattern: 非空模式串
+
+        Returns:
+            模式编号
+        """
+        if self._built:
+            raise RuntimeError("自动机已构建，不能再添加模式串")
+        if not pattern:
+            raise ValueError("模式串不能为空")
+
+        goto = self._goto
+        state = 0
+        for ch in pattern:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+
+        pid = len(self.lengths)
+        self.lengths.append(len(pattern))
+        self._out[state] += (pid,)
+        return pid
+
+    def build(self):
+        """计算失败指针（广度优先），并把后缀状态的输出合并进来"""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] += out[fail[nxt]]
+        self._built = True
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def iter_matches(self, text: str) -> Iterable[Tuple[int, int]]:
+        """
+        扫描文本
+
+        Args:
+            text: 文本
+
+        Returns:
+            (结束位置（不含）, 模式编号) 迭代器
+        """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for pid in out[state]:
+                    yield end, pid
+
+    def match_ids(self, text: str) -> Set[int]:
+        """
+        扫描文本，返回出现过的模式编号
+
+        Args:
+            text: 文本
+
+        Returns:
+            模式编号集合
+        """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class KeywordIndex:
+    """
+    世界书关键词索引
+    与逐条目匹配的规则一致（参考实现见 benchmarks/bench_keyword_index.py 的 check_keyword_match）：
+    keys 与 secondary_keys 任意一个命中即视为条目命中
+    """
+
+    def __init__(self, entries: Sequence[WorldBookEntry], indices: Optional[Iterable[int]] = None):
+        """
+        Args:
+            entries: 世界书条目（匹配结果为条目在此序列中的下标）
+            indices: 只登记这些下标的条目（None 为全部）
+        """
+        self.size = len(entries)
+
+        # 三个自动机，分别对应原匹配规则中的三种比较方式：
+        #   _sensitive: 区分大小写，扫描原文
+        #   _lowered:   不区分大小写的普通关键词（子串匹配），扫描 text.lower()
+        #   _folded:    不区分大小写的正则/全词匹配（re.IGNORECASE），扫描 fold_case(text)
+        self._sensitive = AhoCorasick()
+        self._lowered = AhoCorasick()
+        self._folded = AhoCorasick()
+        # 模式编号 -> (条目下标, 是否全词匹配)；下标为负数 ~n 时表示第 n 个预过滤正则的必需字面量
+        self._sensitive_targets: List[Tuple[int, bool]] = []
+        self._lowered_targets: List[Tuple[int, bool]] = []
+        self._folded_targets: List[Tuple[int, bool]] = []
+
+        # 需要真正执行正则的关键词（构建时编译一次）：
+        #   _prefiltered:  有必需字面量的正则，字面量登记到自动机，扫描到字面量时才执行
+        #                  [(条目下标, 已编译的正则), ...]
+        #   _regex_chunks: 可合并的关键词按 flags 分组，每组合并为一个带命名分组的正则
+        #                  (合并正则, [(条目下标, 单独编译的正则), ...])
+        #   _regex_single: 不能合并的关键词（自带捕获分组或全局内联标志）
+        self._prefiltered: List[Tuple[int, re.Pattern]] = []
+        self._regex_chunks: List[Tuple[re.Pattern, List[Tuple[int, re.Pattern]]]] = []
+        self._regex_single: List[Tuple[int, re.Pattern]] = []
+        # 无效的正则关键词：(条目下标, 关键词, 错误信息)，已按普通子串登记
+        self.invalid_keys: List[Tuple[int, str, str]] = []
+
+        combinable: Dict[int, List[Tuple[int, re.Pattern]]] = {}
+        if indices is None:
+            indices = range(len(entries))
+        for index in indices:
+            self._add_entry(index, entries[index], combinable)
+
+        for group in combinable.values():
+            for start in range(0, len(group), REGEX_CHUNK_SIZE):
+                self._add_regex_chunk(group[start:start + REGEX_CHUNK_SIZE])
+
+        self._sensitive.build()
+        self._lowered.build()
+        self._folded.build()
+
+    def _add_entry(self,
+                   index: int,
+                   entry: WorldBookEntry,
+                   combinable: Dict[int, List[Tuple[int, re.Pattern]]]):
+        """
+        登记一个条目的所有关键词
+
+        Args:
+            index: 条目下标
+            entry: 条目
+            combinable: flags -> 可合并的已编译正则（由调用方统一分块合并）
+        """
+        keywords = entry.keys + entry.secondary_keys
+        if not keywords:
+            return
+
+        case_sensitive = bool(entry.extensions.case_sensitive)
+        whole_words = bool(entry.extensions.match_whole_words)
+        flags = 0 if case_sensitive else re.IGNORECASE
+
+        for keyword in keywords:
+            if not keyword.strip():
+                continue
+            if not case_sensitive:
+                keyword = keyword.lower()
+
+            if entry.use_regex:
+                if _REGEX_METACHARS.isdisjoint(keyword):
+                    # 纯文本的正则关键词：等价于子串匹配（正则模式不使用全词匹配）
+                    self._add_literal(index, keyword, case_sensitive, False, True)
+                else:
+                    self._add_regex(index, keyword, flags, case_sensitive, combinable)
+            else:
+                # 全词匹配原本通过 re.IGNORECASE 实现，子串匹配通过 lower() 实现
+                self._add_literal(index, keyword, case_sensitive, whole_words, whole_words)
+
+    def _add_literal(self,
+                     index: int,
+                     keyword: str,
+                     case_sensitive: bool,
+                     whole_words: bool,
+                     ignorecase_rules: bool):
+        """
+        登记普通关键词
+
+        Args:
+            index: 条目下标
+            keyword: 关键词（不区分大小写时已转为小写）
+            case_sensitive: 是否区分大小写
+            whole_words: 是否全词匹配
+            ignorecase_rules: 不区分大小写时按 re.IGNORECASE 规则比较（否则按 lower() 比较）
+        """
+        if case_sensitive:
+            self._sensitive.add(keyword)
+            self._sensitive_targets.append((index, whole_words))
+        elif ignorecase_rules:
+            self._folded.add(fold_case(keyword))
+            self._folded_targets.append((index, whole_words))
+        else:
+            self._lowered.add(keyword)
+            self._lowered_targets.append((index, whole_words))
+
+    def _add_regex(self,
+                   index: int,
+                   keyword: str,
+                   flags: int,
+                   case_sensitive: bool,
+                   combinable: Dict[int, List[Tuple[int, re.Pattern]]]):
+        """
+        编译并登记正则关键词
+
+        Args:
+            index: 条目下标
+            keyword: 正则（不区分大小写时已转为小写）
+            flags: 编译标志
+            case_sensitive: 是否区分大小写
+            combinable: flags -> 可合并的已编译正则
+        """
+        try:
+            compiled = re.compile(keyword, flags)
+        except re.error as e:
+            # 无效正则按普通子串处理（与逐条匹配时的回退一致），只在构建索引时报告一次
+            logger.warning("世界书条目 #%d 的正则关键词无效，按普通文本匹配: %r (%s)", index, keyword, e)
+            metrics.increment(INVALID_REGEX_KEYS)
+            self.invalid_keys.append((index, keyword, str(e)))
+            self._add_literal(index, keyword, case_sensitive, False, False)
+            return
+
+        literals = required_literals(keyword, flags)
+        if literals:
+            rid = len(self._prefiltered)
+            self._prefiltered.append((index, compiled))
+            if compiled.flags & re.IGNORECASE:
+                for literal in literals:
+                    self._folded.add(fold_case(literal))
+                    self._folded_targets.append((~rid, False))
+            else:
+                for literal in literals:
+                    self._sensitive.add(literal)
+                    self._sensitive_targets.append((~rid, False))
+            return
+
+        # 没有必需字面量的正则合并执行；自带捕获分组（编号、反向引用会被合并打乱）或全局内联标志（如 (?x)）的正则不能合并
+        if compiled.groups == 0 and compiled.flags == re.compile('', flags).flags:
+            combinable.setdefault(flags, []).append((index, compiled))
+        else:
+            self._regex_single.append((index, compiled))
+
+    def _add_regex_chunk(self, members: List[Tuple[int, re.Pattern]]):
+        """把一组 flags 相同的正则合并为 (?P<k0>...)|(?P<k1>...)|... 形式"""
+        if len(members) == 1:
+            self._regex_single.extend(members)
+            return
+        pattern = '|'.join(f'(?P<k{i}>{compiled.pattern})' for i, (_, compiled) in enumerate(members))
+        try:
+            combined = re.compile(pattern, members[0][1].flags)
+        except (re.error, OverflowError, RecursionError):
+            self._regex_single.extend(members)
+            return
+        self._regex_chunks.append((combined, members))
+
+    def match(self, text: str, candidates: Optional[Set[int]] = None) -> Set[int]:
+        """
+        查找关键词命中的条目
+
+        Args:
+            text: 扫描文本
+            candidates: 只关心的条目下标（None 为全部）；不在其中的条目可能不会被报告
+
+        Returns:
+            命中条目的下标集合
+        """
+        matched: Set[int] = set()
+        if not text:
+            return matched
+
+        # 自动机扫描时顺带收集必需字面量已出现的预过滤正则
+        hits: Set[int] = set()
+        if len(self._sensitive):
+            self._collect(self._sensitive, self._sensitive_targets, text, text, matched, hits)
+        if len(self._lowered):
+            lowered_text = text.lower()
+            self._collect(self._lowered, self._lowered_targets, lowered_text, lowered_text, matched, hits)
+        if len(self._folded):
+            # 折叠后长度不变，单词边界按原文检查
+            self._collect(self._folded, self._folded_targets, fold_case(text), text, matched, hits)
+
+        for rid in hits:
+            index, compiled = self._prefiltered[rid]
+            if index in matched or (candidates is not None and index not in candidates):
+                continue
+            if compiled.search(text):
+                matched.add(index)
+
+        for combined, members in self._regex_chunks:
+            pending = [(i, member) for i, member in enumerate(members)
+                       if member[0] not in matched and (candidates is None or member[0] in candidates)]
+            if not pending:
+                continue
+            hit = combined.search(text)
+            if hit is None:
+                continue
+            # 合并正则只报告最先命中的分支；在此之前的位置没有任何成员能命中，其余成员从命中位置开始复查
+            # （再用合并正则扫描剩余文本比逐个复查更慢：标准库 re 对分支结构不做首字符预筛）
+            start = hit.start()
+            for i, (index, compiled) in pending:
+                if index not in matched and (f'k{i}' == hit.lastgroup or compiled.search(text, start)):
+                    matched.add(index)
+
+        for index, compiled in self._regex_single:
+            if index in matched or (candidates is not None and index not in candidates):
+                continue
+            if compiled.search(text):
+                matched.add(index)
+
+        return matched
+
+    @staticmethod
+    def _collect(automaton: AhoCorasick,
+                 targets: List[Tuple[int, bool]],
+                 scan_text: str,
+                 boundary_text: str,
+                 matched: Set[int],
+                 hits: Set[int]):
+        """
+        扫描一遍文本，把命中的条目加入 matched
+
+        Args:
+            automaton: 自动机
+            targets: 模式编号 -> (条目下标, 是否全词匹配)
+            scan_text: 扫描的文本
+            boundary_text: 检查单词边界的文本（与 scan_text 位置一一对应）
+            matched: 命中条目下标集合
+            hits: 必需字面量已出现的预过滤正则编号集合
+        """
+        lengths = automaton.lengths
+        for end, pid in automaton.iter_matches(scan_text):
+            index, whole_words = targets[pid]
+            if index < 0:
+                hits.add(~index)
+                continue
+            if index in matched:
+                continue
+            if whole_words and not (_is_boundary(boundary_text, end - lengths[pid])
+                                    and _is_boundary(boundary_text, end)):
+                continue
+            matched.add(index)
+
+
+class HistoryScanner:
+    """
+    聊天历史关键词扫描器（每个会话一个）
+    按消息内容缓存匹配结果：每轮只扫描新出现的消息，移出扫描窗口的消息同时丢弃，
+    扫描窗口再深也不会每轮重新扫描整个窗口
+    """
+
+    def __init__(self):
+        self._index: Optional[KeywordIndex] = None
+        # 消息内容 -> 命中条目下标（只保留当前窗口中的消息）
+        self._matches: Dict[str, Set[int]] = {}
+        # 累计实际扫描的消息数
+        self.scanned = 0
+
+    def scan(self, index: KeywordIndex, messages: Sequence[str]) -> Dict[int, int]:
+        """
+        扫描窗口中的消息
+
+        Args:
+            index: 世界书关键词索引（索引变化时清空缓存）
+            messages: 扫描窗口中的消息内容（从旧到新）
+
+        Returns:
+            条目下标 -> 最近一次命中的消息距离（1 为最后一条消息）
+        """
+        if index is not self._index:
+            self._index = index
+            self._matches = {}
+
+        previous = self._matches
+        current: Dict[str, Set[int]] = {}
+        nearest: Dict[int, int] = {}
+
+        for distance, content in enumerate(reversed(messages), 1):
+            matched = current.get(content)
+            if matched is None:
+                matched = previous.get(content)
+                if matched is None:
+                    matched = index.match(content)
+                    self.scanned += 1
+                current[content] = matched
+            for entry_index in matched:
+                nearest.setdefault(entry_index, distance)
+
+        self._matches = current
+        return nearest
+
+    def clear(self):
+        """清空缓存"""
+        self._index = None
+        self._matches = {}
@@ -4,21 +4,26 @@
 支持 SillyTavern 独立导出的世界书格式
 """
 
+import gc
 import json
 from typing import Dict, Any, List
-from models import CharacterBook, WorldBookEntry, WorldBookEntryExtensions
+from models import CharacterBook, WorldBookEntry, WorldBookEntryExtensions, construct_model
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
 
 
 class LorebookHandler:
     """独立世界书处理器"""
 
     @staticmethod
-    def load_standalone_lorebook(json_path: str) -> CharacterBook:
+    def load_standalone_lorebook(json_path: str, trusted: bool = False) -> CharacterBook:
         """
         加载独立世界书JSON文件
 
         Args:
             json_path: JSON文件路径
+            trusted: 可信数据，跳过 pydantic 校验直接构建
 
         Returns:
             CharacterBook 对象
@@ -26,15 +31,16 @@ class LorebookHandler:
         with open(json_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
 
-        return LorebookHandler.parse_standalone_lorebook(data)
+        return LorebookHandler.parse_standalone_lorebook(data, trusted)
 
     @staticmethod
-    def parse_standalone_lorebook(data: Dict[str, Any]) -> CharacterBook:
+    def parse_standalone_lorebook(data: Dict[str, Any], trusted: bool = False) -> CharacterBook:
         """
         解析独立世界书数据
 
         Args:
             data: 独立世界书数据字典
+            trusted: 可信数据，跳过 pydantic 校验直接构建
 
         Returns:
             CharacterBook 对象
@@ -42,28 +48,41 @@ class LorebookHandler:
         entries_dict = data.get('entries', {})
         entries = []
 
-        # 转换每个条目
-        for uid_str, entry_data in entries_dict.items():
-            entry = LorebookHandler._convert_entry(entry_data)
-            entries.append(entry)
+        # 可信数据批量构建时暂停分代 GC（构建的对象没有循环引用）
+        gc_enabled = trusted and gc.isenabled()
+        if gc_enabled:
+            gc.disable()
+        try:
+            # 转换每个条目
+            for uid_str, entry_data in entries_dict.items():
+                entry = LorebookHandler._convert_entry(entry_data, trusted)
+                entries.append(entry)
+        finally:
+            if gc_enabled:
+                gc.enable()
 
         # 创建 CharacterBook
-        book = CharacterBook(
-            name=data.get('name'),
-            description=data.get('description'),
-            entries=entries
-        )
+        book_fields = {
+            'name': data.get('name'),
+            'description': data.get('description'),
+            'entries': entries
+        }
+        if trusted:
+            book = construct_model(CharacterBook, book_fields)
+        else:
+            book = CharacterBook(**book_fields)
 
-        print(f"✅ 已加载独立世界书: {len(entries)} 个条目")
+        logger.info("已加载独立世界书: %d 个条目", len(entries))
         return book
 
     @staticmethod
-    def _convert_entry(entry_data: Dict[str, Any]) -> WorldBookEntry:
+    def _convert_entry(entry_data: Dict[str, Any], trusted: bool = False) -> WorldBookEntry:
         """
         转换单个条目从独立格式到角色卡格式
 
         Args:
             entry_data: 独立格式的条目数据
+            trusted: 可信数据，跳过 pydantic 校验直接构建
 
         Returns:
             WorldBookEntry 对象
@@ -147,6 +166,10 @@ class LorebookHandler:
             'ignore_budget': get_bool('ignoreBudget', False),
         }
 
+        if trusted:
+            entry_dict['extensions'] = construct_model(WorldBookEntryExtensions, extensions_dict)
+            return construct_model(WorldBookEntry, entry_dict)
+
         entry_dict['extensions'] = WorldBookEntryExtensions(**extensions_dict)
 
         return WorldBookEntry(**entry_dict)
@@ -165,7 +188,7 @@ class LorebookHandler:
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
 
-        print(f"✅ 已保存独立世界书: {output_path}")
+        logger.info("已保存独立世界书: %s", output_path)
 
     @staticmethod
     def to_standalone_format(book: CharacterBook) -> Dict[str, Any]:
@@ -6,20 +6,29 @@
 
 from typing import List, Dict, Optional, Tuple, Callable
 from models import CharacterBook, WorldBookEntry, WorldBookEntryExtensions
+from columnar_lorebook import ColumnarLorebook
 from copy import deepcopy
+from instrumentation import get_logger
+from tokenizer import Tokenizer, cached_tokenizer, count_tokens
+
+logger = get_logger(__name__)
 
 
 class LorebookManager:
     """世界书管理器"""
 
-    def __init__(self, character_book: CharacterBook):
+    def __init__(self, character_book: CharacterBook, tokenizer: Optional[Tokenizer] = None):
         """
         初始化世界书管理器
 
         Args:
-            character_book: 角色世界书对象
+            character_book: 角色世界书对象（也可以是只读的 ColumnarLorebook，
+                            此时查询和统计按列计算，增删改操作抛出 TypeError）
+            tokenizer: 统计 token 数的分词器（自动增加计数缓存；None 时使用默认分词器）
         """
         self.book = character_book
+        self.tokenizer = cached_tokenizer(tokenizer) if tokenizer is not None else None
+        self.columnar = isinstance(character_book, ColumnarLorebook)
 
     # ============ 基础操作 ============
 
@@ -33,12 +42,14 @@ class LorebookManager:
         Returns:
             新条目的ID
         """
+        self._check_writable()
         # 自动分配ID
         if entry.id is None or self.get_entry(entry.id) is not None:
             entry.id = self._get_next_id()
 
         self.book.entries.append(entry)
-        print(f"✅ 已添加条目: {entry.comment} (ID: {entry.id})")
+        self.book.touch()
+        logger.debug("已添加条目: %s (ID: %s)", entry.comment, entry.id)
 
         return entry.id
 
@@ -52,14 +63,16 @@ class LorebookManager:
         Returns:
             是否删除成功
         """
+        self._check_writable()
         original_count = len(self.book.entries)
         self.book.entries = [e for e in self.book.entries if e.id != entry_id]
 
         if len(self.book.entries) < original_count:
-            print(f"✅ 已删除条目 ID: {entry_id}")
+            self.book.touch()
+            logger.debug("已删除条目 ID: %s", entry_id)
             return True
         else:
-            print(f"❌ 未找到条目 ID: {entry_id}")
+            logger.warning("未找到条目 ID: %s", entry_id)
             return False
 
     def get_entry(self, entry_id: int) -> Optional[WorldBookEntry]:
@@ -88,9 +101,10 @@ class LorebookManager:
         Returns:
             是否更新成功
         """
+        self._check_writable()
         entry = self.get_entry(entry_id)
         if not entry:
-            print(f"❌ 未找到条目 ID: {entry_id}")
+            logger.warning("未找到条目 ID: %s", entry_id)
             return False
 
         # 更新字段
@@ -100,9 +114,10 @@ class LorebookManager:
             elif hasattr(entry.extensions, key):
                 setattr(entry.extensions, key, value)
             else:
-                print(f"⚠️ 未知字段: {key}")
+                logger.warning("未知字段: %s", key)
 
-        print(f"✅ 已更新条目 ID: {entry_id}")
+        self.book.touch()
+        logger.debug("已更新条目 ID: %s", entry_id)
         return True
 
     def duplicate_entry(self, entry_id: int) -> Optional[int]:
@@ -115,9 +130,10 @@ class LorebookManager:
         Returns:
             新条目的ID，失败返回None
         """
+        self._check_writable()
         original = self.get_entry(entry_id)
         if not original:
-            print(f"❌ 未找到条目 ID: {entry_id}")
+            logger.warning("未找到条目 ID: %s", entry_id)
             return None
 
         # 深拷贝
@@ -126,7 +142,8 @@ class LorebookManager:
         new_entry.comment = f"{original.comment} (副本)"
 
         self.book.entries.append(new_entry)
-        print(f"✅ 已复制条目: {new_entry.comment} (新ID: {new_entry.id})")
+        self.book.touch()
+        logger.debug("已复制条目: %s (新ID: %s)", new_entry.comment, new_entry.id)
 
         return new_entry.id
 
@@ -184,6 +201,9 @@ class LorebookManager:
         Returns:
             指定类型的条目列表
         """
+        if self.columnar and entry_type in ('green', 'blue', 'vector'):
+            return self.book.find_by_type(entry_type)
+
         if entry_type == 'green':
             return [e for e in self.book.entries
                     if not e.constant and not e.extensions.vectorized]
@@ -192,7 +212,7 @@ class LorebookManager:
         elif entry_type == 'vector':
             return [e for e in self.book.entries if e.extensions.vectorized]
         else:
-            print(f"❌ 未知类型: {entry_type}")
+            logger.warning("未知类型: %s", entry_type)
             return []
 
     def find_by_position(self, position: int) -> List[WorldBookEntry]:
@@ -205,6 +225,8 @@ class LorebookManager:
         Returns:
             指定位置的条目列表
         """
+        if self.columnar:
+            return self.book.find_by_position(position)
         return [e for e in self.book.entries if e.extensions.position == position]
 
     def find_by_role(self, role: int) -> List[WorldBookEntry]:
@@ -217,6 +239,8 @@ class LorebookManager:
         Returns:
             指定角色的条目列表
         """
+        if self.columnar:
+            return self.book.find_by_role(role)
         return [e for e in self.book.entries if e.extensions.role == role]
 
     def find_by_depth(self, min_depth: int = None, max_depth: int = None) -> List[WorldBookEntry]:
@@ -230,6 +254,9 @@ class LorebookManager:
         Returns:
             符合深度范围的条目列表
         """
+        if self.columnar:
+            return self.book.find_by_depth(min_depth, max_depth)
+
         results = []
         for entry in self.book.entries:
             depth = entry.extensions.depth
@@ -312,12 +339,13 @@ class LorebookManager:
         Returns:
             成功更新的数量
         """
+        self._check_writable()
         count = 0
         for entry_id in entry_ids:
             if self.update_entry(entry_id, **kwargs):
                 count += 1
 
-        print(f"✅ 批量更新完成: {count}/{len(entry_ids)}")
+        logger.info("批量更新完成: %d/%d", count, len(entry_ids))
         return count
 
     def batch_delete(self, entry_ids: List[int]) -> int:
@@ -330,25 +358,30 @@ class LorebookManager:
         Returns:
             成功删除的数量
         """
+        self._check_writable()
         count = 0
         for entry_id in entry_ids:
             if self.remove_entry(entry_id):
                 count += 1
 
-        print(f"✅ 批量删除完成: {count}/{len(entry_ids)}")
+        logger.info("批量删除完成: %d/%d", count, len(entry_ids))
         return count
 
     def enable_all(self):
         """启用所有条目"""
+        self._check_writable()
         for entry in self.book.entries:
             entry.enabled = True
-        print(f"✅ 已启用所有 {len(self.book.entries)} 个条目")
+        self.book.touch()
+        logger.info("已启用所有 %d 个条目", len(self.book.entries))
 
     def disable_all(self):
         """禁用所有条目"""
+        self._check_writable()
         for entry in self.book.entries:
             entry.enabled = False
-        print(f"✅ 已禁用所有 {len(self.book.entries)} 个条目")
+        self.book.touch()
+        logger.info("已禁用所有 %d 个条目", len(self.book.entries))
 
     def enable_by_type(self, entry_type: str):
         """
@@ -357,10 +390,12 @@ class LorebookManager:
         Args:
             entry_type: 'green', 'blue', 'vector'
         """
+        self._check_writable()
         entries = self.find_by_type(entry_type)
         for entry in entries:
             entry.enabled = True
-        print(f"✅ 已启用 {len(entries)} 个 {entry_type} 条目")
+        self.book.touch()
+        logger.info("已启用 %d 个 %s 条目", len(entries), entry_type)
 
     def disable_by_type(self, entry_type: str):
         """
@@ -369,10 +404,12 @@ class LorebookManager:
         Args:
             entry_type: 'green', 'blue', 'vector'
         """
+        self._check_writable()
         entries = self.find_by_type(entry_type)
         for entry in entries:
             entry.enabled = False
-        print(f"✅ 已禁用 {len(entries)} 个 {entry_type} 条目")
+        self.book.touch()
+        logger.info("已禁用 %d 个 %s 条目", len(entries), entry_type)
 
     # ============ 排序功能 ============
 
@@ -384,6 +421,7 @@ class LorebookManager:
             by: 排序依据 ('id', 'display_index', 'insertion_order', 'depth', 'comment')
             reverse: 是否倒序
         """
+        self._check_writable()
         if by == "id":
             self.book.entries.sort(key=lambda e: e.id, reverse=reverse)
         elif by == "display_index":
@@ -395,18 +433,21 @@ class LorebookManager:
         elif by == "comment":
             self.book.entries.sort(key=lambda e: e.comment, reverse=reverse)
         else:
-            print(f"❌ 未知排序字段: {by}")
+            logger.warning("未知排序字段: %s", by)
             return
 
-        print(f"✅ 已按 {by} 排序 ({'倒序' if reverse else '正序'})")
+        self.book.touch()
+        logger.info("已按 %s 排序 (%s)", by, '倒序' if reverse else '正序')
 
     def reindex_display_order(self):
         """
         重新分配 display_index（按当前顺序从0开始）
         """
+        self._check_writable()
         for i, entry in enumerate(self.book.entries):
             entry.extensions.display_index = i
-        print(f"✅ 已重新分配显示顺序: 0-{len(self.book.entries) - 1}")
+        self.book.touch()
+        logger.info("已重新分配显示顺序: 0-%d", len(self.book.entries) - 1)
 
     # ============ 合并功能 ============
 
@@ -425,6 +466,7 @@ class LorebookManager:
         Returns:
             新增的条目数量
         """
+        self._check_writable()
         added_count = 0
 
         for entry in other_book.entries:
@@ -450,7 +492,8 @@ class LorebookManager:
                     added_count += 1
                 # keep_original 则不做任何操作
 
-        print(f"✅ 合并完成: 新增 {added_count} 个条目")
+        self.book.touch()
+        logger.info("合并完成: 新增 %d 个条目", added_count)
         return added_count
 
     # ============ 统计功能 ============
@@ -462,6 +505,9 @@ class LorebookManager:
         Returns:
             统计信息字典
         """
+        if self.columnar:
+            return self.book.get_statistics(self.tokenizer)
+
         entries = self.book.entries
 
         green = [e for e in entries if not e.constant and not e.extensions.vectorized]
@@ -503,9 +549,9 @@ class LorebookManager:
             depth = entry.extensions.depth
             depth_distribution[depth] = depth_distribution.get(depth, 0) + 1
 
-        # 计算总token估算（粗略）
+        # 计算总token数（通过分词器）
         total_content_length = sum(len(e.content) for e in entries)
-        estimated_tokens = total_content_length // 4  # 粗略估算
+        estimated_tokens = sum(count_tokens(e.content, self.tokenizer) for e in entries)
 
         return {
             "total": len(entries),
@@ -605,6 +651,11 @@ class LorebookManager:
 
     # ============ 辅助方法 ============
 
+    def _check_writable(self):
+        """列式世界书只读，修改操作直接报错（条目视图是快照，修改不会写回）"""
+        if self.columnar:
+            raise TypeError("ColumnarLorebook 是只读的，请先用 to_book() 转换为 CharacterBook 再修改")
+
     def _get_next_id(self) -> int:
         """获取下一个可用的ID"""
         if not self.book.entries:
@@ -662,6 +713,8 @@ class LorebookManager:
 
     def clear_all(self):
         """清空所有条目（危险操作！）"""
+        self._check_writable()
         count = len(self.book.entries)
         self.book.entries = []
-        print(f"⚠️ 已清空所有 {count} 个条目")
+        self.book.touch()
+        logger.warning("已清空所有 %d 个条目", count)
@@ -1,6 +1,8 @@
 # models.py
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List, Any, Literal
+import gc
+from dataclasses import dataclass
+from pydantic import BaseModel, Field, ConfigDict, PrivateAttr, field_serializer
+from typing import Optional, List, Any, Literal, Callable, Dict, get_args, get_origin
 from enum import IntEnum
 
 
@@ -82,6 +84,103 @@ class WorldBookEntry(BaseModel):
     extensions: WorldBookEntryExtensions = Field(default_factory=WorldBookEntryExtensions)
 
 
+def entry_position(entry: WorldBookEntry) -> EntryPosition:
+    """
+    条目的实际插入位置
+    以 extensions.position 为准；它与 V2 的 position 字符串矛盾时（只修改了字符串），以字符串为准：
+    before_char 对应 0，after_char 对应 1~7
+
+    Args:
+        entry: 世界书条目
+
+    Returns:
+        EntryPosition
+    """
+    position = entry.extensions.position
+    if entry.position == "before_char":
+        return EntryPosition.BEFORE_CHAR
+    if position in EntryPosition._value2member_map_ and position != EntryPosition.BEFORE_CHAR:
+        return EntryPosition(position)
+    return EntryPosition.AFTER_CHAR
+
+
+class LazyEntryList(list):
+    """
+    延迟校验的条目列表
+    内部先保存原始字典，条目在第一次被访问时才校验为 WorldBookEntry
+    """
+
+    def __init__(self, raw_entries=(), trusted: bool = False):
+        """
+        Args:
+            raw_entries: 原始条目字典列表
+            trusted: 是否跳过校验直接构建（数据已校验过时使用）
+        """
+        super().__init__(raw_entries)
+        self.trusted = trusted
+
+    def _entry_at(self, index: int) -> WorldBookEntry:
+        item = list.__getitem__(self, index)
+        if isinstance(item, dict):
+            item = construct_model(WorldBookEntry, item) if self.trusted else WorldBookEntry(**item)
+            list.__setitem__(self, index, item)
+        return item
+
+    def materialize(self) -> List[WorldBookEntry]:
+        """校验所有剩余条目，返回内部列表本身"""
+        for i in range(len(self)):
+            self._entry_at(i)
+        return self
+
+    @property
+    def materialized_count(self) -> int:
+        """已校验的条目数"""
+        return sum(1 for item in list.__iter__(self) if not isinstance(item, dict))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._entry_at(i) for i in range(*index.indices(len(self)))]
+        return self._entry_at(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._entry_at(i)
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self._entry_at(i)
+
+    def pop(self, index: int = -1) -> WorldBookEntry:
+        entry = self._entry_at(index)
+        list.pop(self, index)
+        return entry
+
+    def copy(self) -> List[WorldBookEntry]:
+        return list(self)
+
+    def __repr__(self):
+        return f"LazyEntryList({len(self)} entries, {self.materialized_count} materialized)"
+
+
+def _materialize_first(name: str):
+    """生成先校验全部条目、再调用 list 原方法的包装"""
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.materialize()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+# 这些 list 方法直接读取内部存储，调用前需要先校验全部条目
+for _name in ('sort', 'index', 'count', 'remove', 'reverse',
+              '__contains__', '__eq__', '__ne__', '__add__', '__mul__', '__rmul__'):
+    setattr(LazyEntryList, _name, _materialize_first(_name))
+del _name
+
+
 class CharacterBook(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
@@ -93,6 +192,25 @@ class CharacterBook(BaseModel):
     recursive_scanning: Optional[bool] = Field(None, alias="recursiveScanning")
     entries: List[WorldBookEntry] = []
 
+    # 条目修改计数（不参与序列化），LorebookManager 修改条目时递增，组装器据此重建关键词索引
+    _version: int = PrivateAttr(0)
+
+    @property
+    def version(self) -> int:
+        """条目修改版本号"""
+        return self._version
+
+    def touch(self):
+        """标记条目已被修改（直接修改条目对象后调用，使缓存的关键词索引失效）"""
+        self._version += 1
+
+    @field_serializer('entries', mode='wrap')
+    def _serialize_entries(self, entries, handler):
+        # 延迟列表在序列化前需要先完成校验
+        if isinstance(entries, LazyEntryList):
+            entries.materialize()
+        return handler(entries)
+
 
 # ============ 深度提示词 ============
 
@@ -187,15 +305,282 @@ class CharacterCardV2(BaseModel):
     extensions: dict[str, Any] = {}
 
 
+# ============ 统一视图 ============
+
+# 视图中从角色卡内容读取的字段（V3 从 data 读取）
+_VIEW_FIELDS = (
+    'description', 'personality', 'scenario', 'first_mes', 'mes_example',
+    'creator_notes', 'system_prompt', 'post_history_instructions',
+    'alternate_greetings', 'tags', 'creator', 'character_version', 'character_book',
+)
+
+
+@dataclass(slots=True)
+class CardView:
+    """
+    角色卡统一视图（只读快照）
+    V2/V3 的字段在创建时解析一次，之后直接按属性读取，无需再区分版本
+    """
+    card: Any  # 原始角色卡对象
+    is_v3: bool  # 是否为 V3
+    spec: str
+    spec_version: str
+    name: str
+    description: str
+    personality: str
+    scenario: str
+    first_mes: str
+    mes_example: str
+    creator_notes: str
+    system_prompt: str
+    post_history_instructions: str
+    alternate_greetings: List[str]
+    tags: List[str]
+    creator: str
+    character_version: str
+    character_book: Optional[CharacterBook]
+
+    @classmethod
+    def from_card(cls, card) -> "CardView":
+        """
+        从角色卡创建视图
+
+        Args:
+            card: CharacterCardV2 / CharacterCardV3（已经是视图时直接返回）
+
+        Returns:
+            CardView 对象
+        """
+        if isinstance(card, CardView):
+            return card
+
+        is_v3 = isinstance(card, CharacterCardV3)
+        source = card.data if is_v3 else card
+
+        values = {}
+        for field in _VIEW_FIELDS:
+            value = getattr(source, field, None)
+            # V3 的 data 字段为空时，退回顶层同名字段
+            if not value and is_v3:
+                value = getattr(card, field, None)
+            values[field] = value
+
+        return cls(
+            card=card,
+            is_v3=is_v3,
+            spec=card.spec,
+            spec_version=card.spec_version,
+            name=card.name,
+            description=values['description'] or '',
+            personality=values['personality'] or '',
+            scenario=values['scenario'] or '',
+            first_mes=values['first_mes'] or '',
+            mes_example=values['mes_example'] or '',
+            creator_notes=values['creator_notes'] or '',
+            system_prompt=values['system_prompt'] or '',
+            post_history_instructions=values['post_history_instructions'] or '',
+            alternate_greetings=values['alternate_greetings'] or [],
+            tags=values['tags'] or [],
+            creator=values['creator'] or '',
+            character_version=values['character_version'] or '',
+            character_book=values['character_book'],
+        )
+
+
+def card_view(card) -> CardView:
+    """获取角色卡的统一视图（已经是视图时直接返回）"""
+    return CardView.from_card(card)
+
+
+# ============ 免校验构建 ============
+
+class _ConstructPlan:
+    """模型类的构建计划（默认值、别名、嵌套转换）"""
+    __slots__ = ('defaults', 'factories', 'aliases', 'converters', 'names', 'allow_extra', 'private')
+
+    def __init__(self, model_cls: type):
+        self.defaults = {}  # 按字段顺序排列的默认值，整体复制（可变默认值先占位）
+        self.factories = []  # (字段名, 默认值工厂)，可变默认值每个对象独立生成
+        self.aliases = {}  # 别名 → 字段名
+        self.converters = []  # (字段名, 嵌套转换函数)
+
+        for name, field in model_cls.model_fields.items():
+            if field.alias and field.alias != name:
+                self.aliases[field.alias] = name
+
+            converter = _nested_converter(field.annotation)
+            if converter is not None:
+                self.converters.append((name, converter))
+
+            if field.default_factory is not None:
+                factory = field.default_factory
+                # 嵌套模型的默认值同样免校验构建
+                if isinstance(factory, type) and issubclass(factory, BaseModel):
+                    factory = (lambda cls: lambda: construct_model(cls, {}))(factory)
+                self.factories.append((name, factory))
+                self.defaults[name] = None
+            elif isinstance(field.default, (list, dict, set)):
+                self.factories.append((name, type(field.default)))
+                self.defaults[name] = None
+            else:
+                self.defaults[name] = field.default
+
+        self.names = frozenset(model_cls.model_fields)
+        self.allow_extra = model_cls.model_config.get('extra') == 'allow'
+        # 私有属性的默认值（没有私有属性时为 None，与 model_construct 一致）
+        self.private = {name: attr.get_default() for name, attr in model_cls.__private_attributes__.items()} or None
+
+
+# 模型类 → 构建计划
+_CONSTRUCT_PLANS: Dict[type, _ConstructPlan] = {}
+
+_object_setattr = object.__setattr__
+
+
+def _nested_converter(annotation) -> Optional[Callable[[Any], Any]]:
+    """根据字段类型生成嵌套模型的转换函数，非模型字段返回 None"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return lambda value, owned=False: (
+            construct_model(annotation, value, owned) if isinstance(value, dict) else value
+        )
+
+    origin = get_origin(annotation)
+    args = [a for a in get_args(annotation) if a is not type(None)]
+
+    if origin in (list, List) and args:
+        item_converter = _nested_converter(args[0])
+        if item_converter is not None:
+            return lambda value, owned=False: (
+                [item_converter(v, owned) for v in value] if isinstance(value, list) else value
+            )
+        return None
+
+    # Optional[X] / X | None
+    if len(args) == 1 and origin is not None:
+        return _nested_converter(args[0])
+
+    return None
+
+
+def construct_model(model_cls: type, data: Dict[str, Any], owned: bool = False):
+    """
+    不经校验直接构建模型（递归构建嵌套模型，支持别名，缺失字段使用默认值）
+    供 trusted 解析、快照、列式世界书使用，只能用于已经校验过的可信数据
+
+    Args:
+        model_cls: 模型类
+        data: 字段字典
+        owned: data 及其嵌套字典归调用方独占时可设为 True，
+               字段齐全时直接复用这些字典，不再复制
+
+    Returns:
+        模型对象
+    """
+    plan = _CONSTRUCT_PLANS.get(model_cls)
+    if plan is None:
+        plan = _CONSTRUCT_PLANS[model_cls] = _ConstructPlan(model_cls)
+
+    if plan.aliases:
+        data = {plan.aliases.get(k, k): v for k, v in data.items()}
+
+    extra = None
+    if owned and len(data) == len(plan.names) and data.keys() == plan.names:
+        values = data
+        fields_set = set(data)
+    elif data.keys() <= plan.names:
+        values = {**plan.defaults, **data}
+        fields_set = set(data)
+    else:
+        fields_set = data.keys() & plan.names
+        values = plan.defaults.copy()
+        for name in fields_set:
+            values[name] = data[name]
+        if plan.allow_extra:
+            extra = {k: v for k, v in data.items() if k not in plan.names}
+
+    for name, factory in plan.factories:
+        if name not in fields_set:
+            values[name] = factory()
+
+    for name, converter in plan.converters:
+        if name in fields_set:
+            value = values[name]
+            if value is not None:
+                values[name] = converter(value, owned)
+
+    # 与 BaseModel.model_construct 相同的对象布局，但省去其逐字段的通用处理
+    obj = model_cls.__new__(model_cls)
+    _object_setattr(obj, '__dict__', values)
+    _object_setattr(obj, '__pydantic_fields_set__', fields_set)
+    _object_setattr(obj, '__pydantic_extra__', extra)
+    _object_setattr(obj, '__pydantic_private__', plan.private and dict(plan.private))
+    return obj
+
+
 # ============ 智能解析 ============
 
-def parse_character_card(data: dict) -> CharacterCardV3 | CharacterCardV2:
-    """智能解析角色卡"""
+def parse_character_card(data: dict,
+                         lazy: bool = False,
+                         trusted: bool = False,
+                         as_view: bool = False) -> CharacterCardV3 | CharacterCardV2 | CardView:
+    """
+    智能解析角色卡
+
+    Args:
+        data: 角色卡数据字典
+        lazy: 延迟校验世界书条目（顶层字段立即校验，character_book.entries
+              中的条目在第一次访问时才校验）
+        trusted: 可信数据，跳过 pydantic 校验直接构建（数据必须已经校验过）
+        as_view: 返回统一视图 CardView（原始角色卡在 view.card 中）
+    """
+    if as_view:
+        return CardView.from_card(parse_character_card(data, lazy=lazy, trusted=trusted))
+
     spec = data.get('spec', '')
 
+    if lazy:
+        return _parse_lazy(data, spec, trusted)
+
+    if trusted:
+        model_cls = CharacterCardV3 if spec == 'chara_card_v3' else CharacterCardV2
+        # 构建的对象树没有循环引用，大量分配触发的分代 GC 只是额外开销（大型世界书中占大半耗时）
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return construct_model(model_cls, data)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
     if spec == 'chara_card_v3':
         return CharacterCardV3(**data)
     elif spec == 'chara_card_v2':
         return CharacterCardV2(**data)
     else:
         return CharacterCardV2(**data)
+
+
+def _parse_lazy(data: dict, spec: str, trusted: bool = False) -> CharacterCardV3 | CharacterCardV2:
+    """延迟解析：先校验不含条目的角色卡，再挂上延迟条目列表"""
+    is_v3 = spec == 'chara_card_v3'
+    container = data.get('data') if is_v3 else data
+
+    raw_entries = None
+    if isinstance(container, dict) and isinstance(container.get('character_book'), dict):
+        book_data = dict(container['character_book'])
+        raw_entries = book_data.pop('entries', None)
+        if isinstance(raw_entries, list):
+            # 复制路径上的字典，不修改调用方的数据
+            container = {**container, 'character_book': book_data}
+            data = {**data, 'data': container} if is_v3 else container
+        else:
+            raw_entries = None
+
+    model_cls = CharacterCardV3 if is_v3 else CharacterCardV2
+    card = construct_model(model_cls, data) if trusted else model_cls(**data)
+
+    if raw_entries is not None:
+        book = card.data.character_book if is_v3 else card.character_book
+        book.entries = LazyEntryList(raw_entries, trusted=trusted)
+
+    return card
@@ -1,10 +1,172 @@
 import base64
+import os
+import shutil
+import struct
+import tempfile
+import zlib
 
 from PIL import Image,PngImagePlugin
-from typing import Any
+from typing import Any, BinaryIO, Iterator, Optional
 
 import json
 
+from instrumentation import get_logger
+
+logger = get_logger(__name__)
+
+# PNG 文件签名
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# 角色卡元数据关键字（按优先级排列）
+CARD_KEYWORDS = ('ccv3', 'chara')
+
+# 可以携带角色卡数据的文本块类型
+TEXT_CHUNK_TYPES = (b'tEXt', b'iTXt', b'zTXt')
+
+
+def iter_png_chunks(stream: BinaryIO) -> Iterator[tuple[bytes, int, int]]:
+    """
+    遍历 PNG 块结构（不读取块数据）
+    :param stream: 已打开的二进制文件对象，位于文件开头
+    :return: (块类型, 数据长度, 数据起始偏移) 的迭代器，读到 IEND 为止
+    """
+    if stream.read(8) != PNG_SIGNATURE:
+        raise ValueError("不是有效的 PNG 文件")
+
+    offset = 8
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            raise ValueError("PNG 文件不完整：缺少 IEND 块")
+        length, chunk_type = struct.unpack('>I4s', header)
+        data_offset = offset + 8
+        yield chunk_type, length, data_offset
+        if chunk_type == b'IEND':
+            return
+        # 跳过数据和 CRC（调用方可能已经读取了部分数据，因此使用绝对偏移）
+        offset = data_offset + length + 4
+        stream.seek(offset)
+
+
+def _parse_text_chunk(chunk_type: bytes, data: bytes) -> tuple[str, str]:
+    """
+    解析文本块
+    :param chunk_type: tEXt / iTXt / zTXt
+    :param data: 块数据
+    :return: (关键字, 文本)
+    """
+    keyword, _, rest = data.partition(b'\x00')
+    keyword = keyword.decode('latin-1')
+
+    if chunk_type == b'tEXt':
+        return keyword, rest.decode('latin-1')
+
+    if chunk_type == b'zTXt':
+        # 压缩方法(1字节) + zlib 数据
+        return keyword, zlib.decompress(rest[1:]).decode('latin-1')
+
+    # iTXt: 压缩标志(1) + 压缩方法(1) + 语言标签\0 + 翻译关键字\0 + 文本
+    compressed = rest[0]
+    _, _, rest = rest[2:].partition(b'\x00')
+    _, _, text = rest.partition(b'\x00')
+    if compressed:
+        text = zlib.decompress(text)
+    return keyword, text.decode('utf-8')
+
+
+def _read_chunk_keyword(stream: BinaryIO, length: int) -> bytes:
+    """
+    读取文本块的关键字部分（关键字最长 79 字节）
+    :param stream: 位于块数据起始处的文件对象
+    :param length: 块数据长度
+    :return: 关键字字节串
+    """
+    head = stream.read(min(length, 80))
+    return head.partition(b'\x00')[0]
+
+
+def find_card_chunk(stream: BinaryIO,
+                    keywords: tuple[str, ...] = CARD_KEYWORDS) -> Optional[tuple[bytes, int, int]]:
+    """
+    查找携带角色卡数据的文本块（只读取关键字，不读取文本内容）
+    遇到最高优先级关键字立即返回，否则读到 IEND 后返回已找到的次优结果
+    :param stream: 已打开的二进制文件对象，位于文件开头
+    :param keywords: 要查找的关键字，按优先级排列
+    :return: (块类型, 数据长度, 数据起始偏移)，未找到则返回 None
+    """
+    wanted = {k.encode('latin-1'): i for i, k in enumerate(keywords)}
+    best_rank = len(keywords)
+    best_chunk = None
+
+    for chunk_type, length, data_offset in iter_png_chunks(stream):
+        if chunk_type not in TEXT_CHUNK_TYPES:
+            continue
+
+        # 只读取关键字，不是角色卡数据的块直接跳过
+        rank = wanted.get(_read_chunk_keyword(stream, length))
+        if rank is None or rank >= best_rank:
+            continue
+
+        best_rank, best_chunk = rank, (chunk_type, length, data_offset)
+        if rank == 0:
+            break
+
+    return best_chunk
+
+
+def read_card_text(image_path: str, keywords: tuple[str, ...] = CARD_KEYWORDS) -> Optional[str]:
+    """
+    直接遍历 PNG 块读取角色卡文本（不解码像素数据）
+    :param image_path: 图片地址
+    :param keywords: 要查找的关键字，按优先级排列
+    :return: 原始 base64 文本，未找到则返回 None
+    """
+    with open(image_path, 'rb') as f:
+        chunk = find_card_chunk(f, keywords)
+        if chunk is None:
+            return None
+
+        chunk_type, length, data_offset = chunk
+        f.seek(data_offset)
+        return _parse_text_chunk(chunk_type, f.read(length))[1]
+
+
+def _load_card_text_with_pillow(image_path: str) -> str:
+    """
+    使用 Pillow 读取角色卡文本（会解码整张图片，仅用于非 PNG 文件）
+    :param image_path: 图片地址
+    :return: 原始 base64 文本
+    """
+    with Image.open(image_path) as image:
+        image.load()
+        info = image.info
+        if 'ccv3' in info:
+            return info['ccv3']
+        elif 'chara' in info:
+            return info['chara']
+        else:
+            raise ValueError("图片中未找到 chara 或 ccv3 元数据")
+
+
+def read_card_data(image_path: str) -> dict[str, Any]:
+    """
+    读取图片的角色卡数据（失败时抛出异常）
+    :param image_path: 图片地址
+    :return: 角色卡数据字典
+    """
+    with open(image_path, 'rb') as f:
+        is_png = f.read(8) == PNG_SIGNATURE
+
+    if is_png:
+        raw_b64 = read_card_text(image_path)
+        if raw_b64 is None:
+            raise ValueError("图片中未找到 chara 或 ccv3 元数据")
+    else:
+        raw_b64 = _load_card_text_with_pillow(image_path)
+
+    return json.loads(base64.b64decode(raw_b64).decode('utf-8'))
+
+
 def load_card_data(image_path:str) -> dict[str,Any]:
     """
     读取图片的角色卡数据
@@ -12,24 +174,76 @@ def load_card_data(image_path:str) -> dict[str,Any]:
     :return:
     """
     try:
-        with Image.open(image_path) as image:
-            image.load()
-            info = image.info
-            raw_b64 = None
-            if 'ccv3' in info:
-                raw_b64 = info['ccv3']
-            elif 'chara' in info:
-                raw_b64 = info['chara']
-            else:
-                raise ValueError("图片中未找到 chara 或 ccv3 元数据")
-            return json.loads(base64.b64decode(raw_b64).decode('utf-8'))
+        return read_card_data(image_path)
     except Exception as e:
-        print(f'读取失败：{e}')
+        logger.warning("读取失败：%s", e)
         return {}
 
+
+def make_text_chunk(keyword: str, text: str) -> bytes:
+    """
+    构造 tEXt 块（含长度和 CRC）
+    :param keyword: 关键字
+    :param text: 文本（latin-1 可编码）
+    :return: 完整的块字节串
+    """
+    body = b'tEXt' + keyword.encode('latin-1') + b'\x00' + text.encode('latin-1')
+    return struct.pack('>I', len(body) - 4) + body + struct.pack('>I', zlib.crc32(body))
+
+
+def _copy_bytes(src: BinaryIO, dst: BinaryIO, length: int, block_size: int = 1 << 20):
+    """
+    按块复制指定长度的字节
+    :param src: 源文件
+    :param dst: 目标文件
+    :param length: 复制长度
+    :param block_size: 每次读取的字节数
+    """
+    while length > 0:
+        block = src.read(min(block_size, length))
+        if not block:
+            raise ValueError("PNG 文件不完整")
+        dst.write(block)
+        length -= len(block)
+
+
+def splice_card_chunks(image_path: str, output_path: str, text_chunks: dict[str, str]):
+    """
+    将文本块写入 PNG（逐字节复制其它块，不重新编码图片）
+    同名的旧文本块会被移除，新块紧跟在 IHDR 之后插入
+    :param image_path: 源 PNG 地址
+    :param output_path: 输出地址（可以与源地址相同）
+    :param text_chunks: {关键字: 文本}
+    """
+    replaced = {k.encode('latin-1') for k in text_chunks}
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.png', dir=output_dir)
+    try:
+        with open(image_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            dst.write(PNG_SIGNATURE)
+            for chunk_type, length, data_offset in iter_png_chunks(src):
+                if chunk_type in TEXT_CHUNK_TYPES and _read_chunk_keyword(src, length) in replaced:
+                    continue
+
+                # 原样复制：长度 + 类型 + 数据 + CRC
+                src.seek(data_offset - 8)
+                _copy_bytes(src, dst, length + 12)
+
+                if chunk_type == b'IHDR':
+                    for keyword, text in text_chunks.items():
+                        dst.write(make_text_chunk(keyword, text))
+        shutil.copymode(image_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 def save_card_data(image_path:str,output_path:str,card_data:dict[str,Any]):
     """
     将角色卡数据写入图片
+    PNG 图片只替换 chara/ccv3 文本块，其它块逐字节复制；其它格式使用 Pillow 转换为 PNG
     :param image_path: 图片地址
     :param output_path: 输出地址
     :param card_data: 角色卡数据
@@ -37,12 +251,19 @@ def save_card_data(image_path:str,output_path:str,card_data:dict[str,Any]):
     """
     json_str = json.dumps(card_data)
     base64_str = base64.b64encode(json_str.encode('utf-8')).decode('utf-8')
-    metadata = PngImagePlugin.PngInfo()
-    metadata.add_text("chara",base64_str)
-    metadata.add_text("ccv3",base64_str)
     try:
+        with open(image_path, 'rb') as f:
+            is_png = f.read(8) == PNG_SIGNATURE
+
+        if is_png:
+            splice_card_chunks(image_path, output_path, {"chara": base64_str, "ccv3": base64_str})
+            return
+
+        metadata = PngImagePlugin.PngInfo()
+        metadata.add_text("chara",base64_str)
+        metadata.add_text("ccv3",base64_str)
         with Image.open(image_path) as image:
             image.save(output_path,"PNG",pnginfo=metadata)
     except Exception as e:
-        print(f"写入失败：{e}")
+        logger.error("写入失败：%s", e)
         raise e
@@ -4,12 +4,17 @@
 支持角色分离、变量替换（含宏套宏）
 """
 
-import re
-from dataclasses import dataclass
-from typing import List, Dict, Optional
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Sequence, Tuple
 
-from models import CharacterCardV2, CharacterCardV3, WorldBookEntry
+from models import WorldBookEntry, EntryPosition, card_view, entry_position
 from variable_replacer import VariableReplacer
+from keyword_index import KeywordIndex, HistoryScanner
+from tokenizer import Tokenizer, cached_tokenizer, get_default_tokenizer
+from instrumentation import get_logger, metrics, ENTRIES_ACTIVATED
+
+logger = get_logger(__name__)
 
 
 @dataclass
@@ -31,6 +36,92 @@ class Message:
     name: Optional[str] = None  # 可选的名称字段
 
 
+@dataclass
+class WorldInfoActivation:
+    """
+    一次组装的世界书激活结果
+    整本世界书只筛选、匹配一次，激活的条目按实际插入位置（EntryPosition）分桶，各输出位置都从这里读取
+    """
+    # 激活的条目 [(条目下标, 条目, 插入位置), ...]，保持世界书中的原始顺序
+    activated: List[Tuple[int, WorldBookEntry, EntryPosition]] = field(default_factory=list)
+    # 出口内容 {outlet_name: 内容}（OUTLET 条目不插入提示词，由调用方自行使用）
+    outlets: Dict[str, str] = field(default_factory=dict)
+    # 因超出 token 预算而未插入的条目 [(条目下标, 条目), ...]
+    over_budget: List[Tuple[int, WorldBookEntry]] = field(default_factory=list)
+    # 激活条目占用的 token 数（估算）
+    tokens: int = 0
+
+    def get(self, *positions: EntryPosition) -> List[WorldBookEntry]:
+        """
+        取若干插入位置的条目
+
+        Args:
+            positions: 插入位置（多个位置的条目合并）
+
+        Returns:
+            条目列表（按 insertion_order 稳定排序）
+        """
+        entries = [entry for _, entry, position in self.activated if position in positions]
+        entries.sort(key=lambda e: e.insertion_order)
+        return entries
+
+    @property
+    def buckets(self) -> Dict[EntryPosition, List[WorldBookEntry]]:
+        """插入位置 -> 条目列表（按 insertion_order 排序）"""
+        return {position: self.get(position)
+                for position in EntryPosition
+                if any(p == position for _, _, p in self.activated)}
+
+    def __len__(self) -> int:
+        return len(self.activated)
+
+
+class _WorldInfoPlan:
+    """
+    世界书激活计划：绿灯条目的关键词索引和按条目标志预先划分的下标
+    与关键词索引一起按世界书版本缓存，组装时只需遍历命中的条目和常驻条目
+    """
+    __slots__ = ('index', 'constant', 'candidate_count', 'delayed',
+                 'exclude_recursion', 'prevent_recursion', 'scan_depths', 'uses_book_depth')
+
+    def __init__(self, entries: Sequence[WorldBookEntry]):
+        constant = []
+        candidates = []
+        self.delayed = set()  # 延迟到递归的绿灯条目（只能由递归激活）
+        self.exclude_recursion = set()  # 不能被递归激活的绿灯条目
+        self.prevent_recursion = set()  # 内容不参与递归扫描的已启用条目
+        self.scan_depths: Dict[int, int] = {}  # 自带扫描深度的绿灯条目 -> 扫描深度
+        self.uses_book_depth = False  # 是否有使用世界书扫描深度的绿灯条目
+
+        for i, entry in enumerate(entries):
+            if not entry.enabled:
+                continue
+            ext = entry.extensions
+            if ext.prevent_recursion:
+                self.prevent_recursion.add(i)
+            if entry.constant:
+                constant.append(i)
+                continue
+            if ext.vectorized:
+                continue
+
+            candidates.append(i)
+            if ext.exclude_recursion:
+                self.exclude_recursion.add(i)
+            if ext.delay_until_recursion:
+                self.delayed.add(i)
+            elif ext.scan_depth is not None:
+                self.scan_depths[i] = ext.scan_depth
+            else:
+                self.uses_book_depth = True
+
+        # 常驻条目（蓝灯）的下标，按原始顺序
+        self.constant: List[int] = constant
+        self.candidate_count = len(candidates)
+        # 索引只登记绿灯条目，匹配结果不需要再按条目标志过滤
+        self.index = KeywordIndex(entries, candidates)
+
+
 class PromptBuilder:
     """提示词组装器"""
 
@@ -50,6 +141,13 @@ class PromptBuilder:
         "post_history_instructions": 12
     }
 
+    # 世界书条目插入位置对应的输出位置：作者注释前后的条目没有单独的位置，与角色定义之后的条目合并
+    WORLD_INFO_BEFORE = (EntryPosition.BEFORE_CHAR,)
+    WORLD_INFO_AFTER = (EntryPosition.AFTER_CHAR, EntryPosition.BEFORE_AUTHOR_NOTE, EntryPosition.AFTER_AUTHOR_NOTE)
+
+    # 按深度插入的条目的消息角色（extensions.role）
+    ENTRY_ROLES = {0: "system", 1: "user", 2: "assistant"}
+
     def __init__(self,
                  card,
                  main_prompt: Optional[str] = None,
@@ -59,12 +157,14 @@ class PromptBuilder:
                  persona_description: str = "",
                  user_name: str = "User",
                  enable_variable_replacement: bool = True,
-                 max_variable_depth: int = 5):
+                 max_variable_depth: int = 5,
+                 max_recursion_steps: int = 10,
+                 tokenizer: Optional[Tokenizer] = None):
         """
         初始化提示词组装器
 
         Args:
-            card: 角色卡对象 (CharacterCardV2 或 CharacterCardV3)
+            card: 角色卡对象 (CharacterCardV2、CharacterCardV3 或 CardView)
             main_prompt: 自定义主提示词（如果为None，使用角色卡的system_prompt）
             enhance_definitions: 自定义增强定义
             auxiliary_prompt: 自定义辅助提示词
@@ -73,22 +173,22 @@ class PromptBuilder:
             user_name: 用户名
             enable_variable_replacement: 是否启用变量替换
             max_variable_depth: 最大变量嵌套深度（防止无限递归）
+            max_recursion_steps: 世界书递归激活的最大步数（世界书开启 recursive_scanning 时生效）
+            tokenizer: 计算 token 数的分词器（None 时使用默认分词器，见 tokenizer.set_default_tokenizer）
         """
-        self.card = card
+        # 统一视图：V2/V3 字段在这里解析一次，之后的组装过程不再区分版本
+        self.view = card_view(card)
+        self.card = self.view.card
         self.persona_description = persona_description
         self.enable_variable_replacement = enable_variable_replacement
         self.max_variable_depth = max_variable_depth
-
-        # 获取角色卡数据
-        if isinstance(card, CharacterCardV3):
-            self.data = card.data
-        else:
-            self.data = card
+        self.max_recursion_steps = max_recursion_steps
+        self.tokenizer = cached_tokenizer(tokenizer) if tokenizer is not None else None
 
         # 创建变量替换器
         self.variable_replacer = VariableReplacer(
             user_name=user_name,
-            char_name=card.name
+            char_name=self.view.name
         )
 
         # 处理 Main Prompt（优先使用自定义，否则使用角色卡的system_prompt）
@@ -96,7 +196,7 @@ class PromptBuilder:
             self.main_prompt = main_prompt
             self.main_prompt_source = "custom"
         else:
-            self.main_prompt = getattr(self.data, 'system_prompt', '')
+            self.main_prompt = self.view.system_prompt
             self.main_prompt_source = "card"
 
         # 处理 Post-History Instructions（优先使用自定义，否则使用角色卡的）
@@ -104,29 +204,76 @@ class PromptBuilder:
             self.post_history_instructions = post_history_instructions
             self.post_history_source = "custom"
         else:
-            self.post_history_instructions = getattr(self.data, 'post_history_instructions', '')
+            self.post_history_instructions = self.view.post_history_instructions
             self.post_history_source = "card"
 
         # 自定义字段（这些不从角色卡获取）
         self.enhance_definitions = enhance_definitions or ""
         self.auxiliary_prompt = auxiliary_prompt or ""
 
-    def register_variable(self, var_name: str, callback):
+        # 静态段落缓存：{原文: 替换结果}，只保存仅依赖 pure 变量（user、char 等）的段落
+        # 标记 (替换器版本, 用户名, 角色名, 最大深度) 变化时整体失效
+        self._section_cache: Dict[str, str] = {}
+        self._section_stamp: Optional[tuple] = None
+
+        # 世界书条目内容的 token 数缓存 {内容: token 数}，预算检查时不必每轮重新计算（分词器变化时失效）
+        self._entry_tokens: Dict[str, int] = {}
+        self._entry_tokens_owner: Optional[Tokenizer] = None
+
+        # 聊天历史的 token 前缀和：_history_prefix[i] 为前 i 条消息的 token 数之和，
+        # 每轮只计算新追加的消息（分词器变化时失效）
+        self._history_contents: List[str] = []
+        self._history_prefix: List[int] = [0]
+        self._history_tokens_owner: Optional[Tokenizer] = None
+
+        # 世界书激活计划（含关键词索引；世界书、条目列表或版本号变化时重建）
+        self._world_info_plan: Optional[_WorldInfoPlan] = None
+        self._world_info_plan_key: Optional[tuple] = None
+        # 聊天历史扫描器（按消息缓存匹配结果，每轮只扫描新消息）
+        self._history_scanner = HistoryScanner()
+
+        # 最近一次组装的世界书激活结果（包括出口内容）
+        self.last_activation: Optional[WorldInfoActivation] = None
+
+    def refresh(self):
+        """
+        角色卡内容被修改后重新读取
+        （视图在初始化时创建；来自角色卡的主提示词和历史后指令也会一并更新）
+        """
+        self.view = card_view(self.card)
+        self._world_info_plan = None
+        self._history_scanner.clear()
+        self._entry_tokens.clear()
+        if self.main_prompt_source == "card":
+            self.main_prompt = self.view.system_prompt
+        if self.post_history_source == "card":
+            self.post_history_instructions = self.view.post_history_instructions
+
+    def register_variable(self,
+                          var_name: str,
+                          callback,
+                          scope: str = "volatile",
+                          timeout: Optional[float] = None,
+                          fallback: Optional[str] = None):
         """
         注册自定义变量
 
         Args:
             var_name: 变量名
-            callback: 回调函数
+            callback: 回调函数（可以是 async 函数，需要使用 abuild_messages）
+            scope: 作用域（"pure" / "render" / "volatile"，见 VariableReplacer.register_variable）
+            timeout: 异步回调的超时时间（秒）
+            fallback: 回调失败或超时时的替换值
         """
-        self.variable_replacer.register_variable(var_name, callback)
+        self.variable_replacer.register_variable(var_name, callback, scope, timeout, fallback)
 
     def build_messages(self,
                        chat_history: List[Dict[str, str]] = None,
                        user_message: str = "",
                        include_world_info: bool = True,
                        include_examples: bool = True,
-                       max_history_messages: int = 20) -> List[Message]:
+                       max_history_messages: int = 20,
+                       max_history_tokens: Optional[int] = None) -> List[Message]:
         """
         构建消息列表（按角色分离）
 
@@ -136,18 +283,116 @@ class PromptBuilder:
             include_world_info: 是否包含世界书
             include_examples: 是否包含对话示例
             max_history_messages: 最大历史消息数
+            max_history_tokens: 聊天历史的最大 token 数（保留能放下的最近消息，None 为不限制）
 
         Returns:
             消息列表 [Message(role="system", content="..."), ...]
         """
+        # 一次组装是一个渲染作用域：render 变量（时间、日期等）在所有段落中只计算一次
+        with self.variable_replacer.render_scope():
+            activation, recent_history = self._prepare_build(
+                chat_history,
+                user_message,
+                include_world_info,
+                max_history_messages,
+                max_history_tokens
+            )
+            return self._build_messages(activation, recent_history, user_message, include_examples)
+
+    async def abuild_messages(self,
+                              chat_history: List[Dict[str, str]] = None,
+                              user_message: str = "",
+                              include_world_info: bool = True,
+                              include_examples: bool = True,
+                              max_history_messages: int = 20,
+                              max_history_tokens: Optional[int] = None) -> List[Message]:
+        """
+        构建消息列表（异步版本）
+        先激活世界书、截取聊天历史，再并发计算实际进入提示词的文本中出现的异步变量
+        （各自带超时和替换值），然后同步组装，总耗时取决于最慢的一个变量，而不是所有变量之和
+
+        Args:
+            与 build_messages 相同
+
+        Returns:
+            消息列表
+        """
+        with self.variable_replacer.render_scope():
+            activation, recent_history = self._prepare_build(
+                chat_history,
+                user_message,
+                include_world_info,
+                max_history_messages,
+                max_history_tokens
+            )
+            if self.enable_variable_replacement:
+                await self.variable_replacer.aprefetch(
+                    self._iter_template_texts(activation, recent_history, user_message, include_examples)
+                )
+            return self._build_messages(activation, recent_history, user_message, include_examples)
+
+    def _iter_template_texts(self,
+                             activation: WorldInfoActivation,
+                             recent_history: List[Dict[str, str]],
+                             user_message: str,
+                             include_examples: bool):
+        """
+        实际进入提示词、需要变量替换的文本（用于预先计算异步变量）
+        只包含激活的世界书条目和截取后的聊天历史，未触发的条目中的变量不会被计算
+        """
+        yield self.main_prompt
+        yield self.persona_description
+        yield self.view.description
+        yield self.view.personality
+        yield self.view.scenario
+        yield self.enhance_definitions
+        yield self.auxiliary_prompt
+        yield self.post_history_instructions
+        yield user_message
+
+        if include_examples:
+            yield self.view.mes_example
+
+        for _, entry, _ in activation.activated:
+            yield entry.content
+
+        for msg in recent_history:
+            yield msg.get("content", "")
+
+    def _prepare_build(self,
+                       chat_history: Optional[List[Dict[str, str]]],
+                       user_message: str,
+                       include_world_info: bool,
+                       max_history_messages: int,
+                       max_history_tokens: Optional[int]) -> Tuple[WorldInfoActivation, List[Dict[str, str]]]:
+        """
+        确定进入提示词的内容（不做变量替换）：激活世界书、截取聊天历史
+
+        Returns:
+            (激活结果, 截取后的聊天历史)
+        """
         chat_history = chat_history or []
 
+        # 世界书只激活一次，各位置从结果中读取
+        if include_world_info:
+            activation = self._activate_world_info(user_message, chat_history)
+        else:
+            activation = WorldInfoActivation()
+
+        recent_history = self._recent_history(chat_history, max_history_messages, max_history_tokens)
+        return activation, recent_history
+
+    def _build_messages(self,
+                        activation: WorldInfoActivation,
+                        recent_history: List[Dict[str, str]],
+                        user_message: str,
+                        include_examples: bool) -> List[Message]:
+        """构建消息列表（在渲染作用域内调用）"""
+        self._render_outlets(activation)
+        self.last_activation = activation
+
         # 构建系统提示词
-        system_content = self._build_system_prompt(
-            user_message,
-            include_world_info,
-            include_examples
-        )
+        system_content = self._build_system_prompt(activation)
 
         messages = []
 
@@ -158,24 +403,28 @@ class PromptBuilder:
                 content=system_content
             ))
 
-        # 2. 对话示例（转换为消息格式）
-        if include_examples and self.data.mes_example:
-            example_messages = self._parse_chat_examples(self.data.mes_example)
+        # 2. 对话示例（转换为消息格式），前后是示例前/后的世界书条目
+        before_examples = self._render_world_info(activation.get(EntryPosition.BEFORE_EXAMPLES))
+        if before_examples:
+            messages.append(Message(role="system", content=before_examples))
+
+        if include_examples and self.view.mes_example:
+            example_messages = self._parse_chat_examples(self.view.mes_example)
             messages.extend(example_messages)
 
-        # 3. 聊天历史
-        if chat_history:
-            history_messages = self._format_chat_history_as_messages(
-                chat_history,
-                max_history_messages
-            )
-            messages.extend(history_messages)
+        after_examples = self._render_world_info(activation.get(EntryPosition.AFTER_EXAMPLES))
+        if after_examples:
+            messages.append(Message(role="system", content=after_examples))
+
+        # 3. 聊天历史（按深度插入的世界书条目插在其中）
+        history_messages = self._format_chat_history_as_messages(recent_history)
+        messages.extend(self._insert_depth_entries(history_messages, activation.get(EntryPosition.AT_DEPTH)))
 
         # 4. Post-History Instructions（作为最后的系统消息）
         if self.post_history_instructions:
             post_content = self.post_history_instructions
             if self.enable_variable_replacement:
-                post_content = self._replace_variables_recursive(post_content)
+                post_content = self._render_section(post_content)
 
             if post_content.strip():
                 messages.append(Message(
@@ -217,10 +466,7 @@ class PromptBuilder:
 
         return result
 
-    def _build_system_prompt(self,
-                             user_message: str,
-                             include_world_info: bool,
-                             include_examples: bool) -> str:
+    def _build_system_prompt(self, activation: WorldInfoActivation) -> str:
         """构建系统提示词部分"""
         sections = []
 
@@ -228,201 +474,380 @@ class PromptBuilder:
         if self.main_prompt:
             content = self.main_prompt
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 2. World Info (before)
-        if include_world_info:
-            world_before = self._get_world_info_content("before_char", user_message)
-            if world_before:
-                sections.append(world_before)
+        world_before = self._render_world_info(activation.get(*self.WORLD_INFO_BEFORE))
+        if world_before:
+            sections.append(world_before)
 
         # 3. Persona Description
         if self.persona_description:
             content = self.persona_description
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 4. Char Description
-        if self.data.description:
-            content = self.data.description
+        if self.view.description:
+            content = self.view.description
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 5. Char Personality
-        if self.data.personality:
-            content = self.data.personality
+        if self.view.personality:
+            content = self.view.personality
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 6. Scenario
-        if self.data.scenario:
-            content = self.data.scenario
+        if self.view.scenario:
+            content = self.view.scenario
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 7. Enhance Definitions
         if self.enhance_definitions:
             content = self.enhance_definitions
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 8. Auxiliary Prompt
         if self.auxiliary_prompt:
             content = self.auxiliary_prompt
             if self.enable_variable_replacement:
-                content = self._replace_variables_recursive(content)
+                content = self._render_section(content)
             sections.append(content)
 
         # 9. World Info (after)
-        if include_world_info:
-            world_after = self._get_world_info_content("after_char", user_message)
-            if world_after:
-                sections.append(world_after)
+        world_after = self._render_world_info(activation.get(*self.WORLD_INFO_AFTER))
+        if world_after:
+            sections.append(world_after)
 
         # 拼接所有部分
         return "\n\n".join(s.strip() for s in sections if s.strip())
 
-    def _replace_variables_recursive(self, text: str, depth: int = 0) -> str:
+    def _render_section(self, text: str) -> str:
         """
-        递归替换变量（支持宏套宏）
+        替换角色卡段落中的变量（结果只依赖 pure 变量时缓存）
+        段落文本、注册的变量、用户名/角色名都不变时直接返回上次的结果
 
         Args:
-            text: 原始文本
-            depth: 当前递归深度
+            text: 段落原文
 
         Returns:
             替换后的文本
         """
-        if depth >= self.max_variable_depth:
-            print(f"⚠️ 达到最大变量嵌套深度 {self.max_variable_depth}，停止递归")
-            return text
+        replacer = self.variable_replacer
+        stamp = (replacer.version, replacer.user_name, replacer.char_name, self.max_variable_depth)
+        if stamp != self._section_stamp:
+            self._section_cache.clear()
+            self._section_stamp = stamp
+
+        cached = self._section_cache.get(text)
+        if cached is not None:
+            return cached
+
+        dynamic_reads = replacer.dynamic_reads
+        content = self._replace_variables_recursive(text)
+        if replacer.dynamic_reads == dynamic_reads:
+            self._section_cache[text] = content
+        return content
 
-        # 第一次替换
-        replaced = self.variable_replacer.replace(text)
-
-        if replaced == text:
-            return replaced
+    def _replace_variables_recursive(self, text: str, depth: int = 0) -> str:
+        """
+        替换变量并展开嵌套变量（支持宏套宏）
 
-            # 只有当文本发生变化，且看起来还有变量时，才继续递归
-        if re.search(r'\{\{[^}]+}}', replaced):
-            return self._replace_variables_recursive(replaced, depth + 1)
+        Args:
+            text: 原始文本
+            depth: 已经展开的深度
 
-        return replaced
+        Returns:
+            替换后的文本
+        """
+        return self.variable_replacer.expand(text, max_depth=self.max_variable_depth - depth)
 
-    def _get_world_info_content(self, position: str, user_message: str) -> str:
+    def _activate_world_info(self,
+                             user_message: str,
+                             chat_history: Optional[List[Dict[str, str]]] = None) -> WorldInfoActivation:
         """
-        获取指定位置的世界书内容
+        激活世界书（每次组装一次，覆盖所有插入位置）
         实现常驻触发（蓝灯）和关键词触发（绿灯）
 
         Args:
-            position: 'before_char' 或 'after_char'
             user_message: 用户消息（用于关键词匹配）
+            chat_history: 聊天历史（扫描最近 scan_depth 条消息；条目的 extensions.scan_depth
+                          优先于世界书的 scan_depth，都未设置时只扫描用户消息）
+
+        Returns:
+            激活结果
         """
+        activation = WorldInfoActivation()
+
         # 获取世界书
-        lorebook = None
-        if isinstance(self.card, CharacterCardV3):
-            lorebook = self.data.character_book
-        elif isinstance(self.card, CharacterCardV2):
-            lorebook = self.card.character_book
+        lorebook = self.view.character_book
 
         if not lorebook or not lorebook.entries:
-            return ""
+            return activation
+
+        entries = lorebook.entries
+        plan = self._get_world_info_plan(lorebook)
+
+        # 绿灯条目通过关键词索引一次性匹配（延迟到递归的条目只能由递归激活）
+        matched = set()
+        if plan.candidate_count:
+            index = plan.index
+            if user_message:
+                matched = index.match(user_message) - plan.delayed
+            if chat_history:
+                matched |= self._scan_history(lorebook, plan, matched, chat_history)
+
+            # 递归激活：已激活条目的内容继续触发其它条目
+            if lorebook.recursive_scanning:
+                matched |= self._recurse_world_info(lorebook, plan, matched.union(plan.constant))
+
+        # 1. 蓝灯条目（常驻触发）；2. 向量条目（暂时跳过）；3. 绿灯条目（关键词触发）
+        triggered = [(i, entries[i]) for i in sorted(matched.union(plan.constant))]
+
+        # token 预算：按优先级依次纳入，超出预算后不再纳入（ignore_budget 的条目总是纳入）
+        admitted = self._apply_token_budget(lorebook, triggered, activation)
+
+        for i, entry in triggered:
+            if i in admitted:
+                activation.activated.append((i, entry, entry_position(entry)))
+
+        if not activation.activated:
+            return activation
+
+        metrics.increment(ENTRIES_ACTIVATED, len(activation.activated))
+        return activation
+
+    def _render_outlets(self, activation: WorldInfoActivation):
+        """出口条目按名称汇总（替换变量），不插入提示词"""
+        outlet_entries: Dict[str, List[WorldBookEntry]] = {}
+        for entry in activation.get(EntryPosition.OUTLET):
+            outlet_entries.setdefault(entry.extensions.outlet_name, []).append(entry)
+        for name, entries in outlet_entries.items():
+            content = self._render_world_info(entries)
+            if content:
+                activation.outlets[name] = content
+
+    def _apply_token_budget(self,
+                            lorebook,
+                            triggered: List[Tuple[int, WorldBookEntry]],
+                            activation: WorldInfoActivation) -> set:
+        """
+        按世界书的 token_budget 选择纳入的条目
+        优先级：蓝灯条目优先，其次 insertion_order 大的优先（与 SillyTavern 一致），相同时按原始顺序；
+        第一个放不下的条目之后不再纳入其它条目，ignore_budget 的条目不受限制（但仍计入用量）
 
-        # 筛选指定位置的条目
-        position_entries = [e for e in lorebook.entries
-                            if e.position == position and e.enabled]
+        Args:
+            lorebook: 世界书
+            triggered: 被激活的条目 [(条目下标, 条目), ...]
+            activation: 激活结果（记录用量和超出预算的条目）
 
-        if not position_entries:
-            return ""
+        Returns:
+            纳入的条目下标
+        """
+        budget = lorebook.token_budget
+        if not budget or budget <= 0:
+            activation.tokens = sum(self._entry_token_count(entry) for _, entry in triggered)
+            return {i for i, _ in triggered}
+
+        ordered = sorted(triggered, key=lambda item: (not item[1].constant, -item[1].insertion_order, item[0]))
+
+        admitted = set()
+        used = 0
+        exhausted = False
+        for i, entry in ordered:
+            tokens = self._entry_token_count(entry)
+            if not entry.extensions.ignore_budget:
+                if exhausted or used + tokens > budget:
+                    exhausted = True
+                    activation.over_budget.append((i, entry))
+                    continue
+            admitted.add(i)
+            used += tokens
+
+        activation.over_budget.sort(key=lambda item: item[0])
+        activation.tokens = used
+        return admitted
+
+    def _entry_token_count(self, entry: WorldBookEntry) -> int:
+        """条目内容的 token 数（按内容缓存；按原文计算，不做变量替换）"""
+        tokenizer = self.get_tokenizer()
+        if tokenizer is not self._entry_tokens_owner:
+            self._entry_tokens.clear()
+            self._entry_tokens_owner = tokenizer
+
+        content = entry.content
+        tokens = self._entry_tokens.get(content)
+        if tokens is None:
+            tokens = self._estimate_tokens(content.strip())
+            self._entry_tokens[content] = tokens
+        return tokens
+
+    def _recurse_world_info(self,
+                            lorebook,
+                            plan: _WorldInfoPlan,
+                            activated: set) -> set:
+        """
+        递归激活（工作表算法）
+        每一步只扫描上一步新激活的条目内容，每个条目的内容最多扫描一次
 
-        # 分类条目
-        triggered_entries = []
+        条目标志：
+            exclude_recursion: 不能被递归激活
+            prevent_recursion: 内容不参与递归扫描
+            delay_until_recursion: 只能在第 n 步及以后被递归激活
 
-        for entry in position_entries:
-            # 1. 蓝灯条目（常驻触发）
-            if entry.constant:
-                triggered_entries.append(entry)
-                continue
+        Args:
+            lorebook: 世界书
+            plan: 激活计划
+            activated: 已激活的条目下标
 
-            # 2. 向量条目（暂时跳过）
-            if entry.extensions.vectorized:
-                continue
+        Returns:
+            递归激活的条目下标
+        """
+        entries = lorebook.entries
+        index = plan.index
+        # 已激活或已命中（等待延迟步数）的条目不再重复处理
+        seen = activated | plan.exclude_recursion
+        pending = [i for i in sorted(activated) if i not in plan.prevent_recursion]
+        deferred: Dict[int, int] = {}  # 已命中但还未到延迟步数的条目 -> 激活的步数
+        found = set()
+
+        step = 0
+        while pending or deferred:
+            if step >= self.max_recursion_steps:
+                logger.warning("世界书递归激活达到最大步数 %d，停止递归", self.max_recursion_steps)
+                break
+            step += 1
+
+            hits = set()
+            for i in pending:
+                if entries[i].content:
+                    hits |= index.match(entries[i].content) - seen
+            seen |= hits
+            for i in hits:
+                deferred[i] = max(entries[i].extensions.delay_until_recursion, step)
+
+            ready = sorted(i for i, level in deferred.items() if level <= step)
+            for i in ready:
+                del deferred[i]
+            found.update(ready)
+            pending = [i for i in ready if i not in plan.prevent_recursion]
+
+        return found
+
+    def _scan_history(self,
+                      lorebook,
+                      plan: _WorldInfoPlan,
+                      matched: set,
+                      chat_history: List[Dict[str, str]]) -> set:
+        """
+        在聊天历史中匹配关键词
 
-            # 3. 绿灯条目（关键词触发）
-            if self._check_keyword_match(entry, user_message):
-                triggered_entries.append(entry)
+        Args:
+            lorebook: 世界书
+            plan: 激活计划
+            matched: 已经命中的条目下标
+            chat_history: 聊天历史
 
-        if not triggered_entries:
-            return ""
+        Returns:
+            在各自扫描深度内命中的条目下标
+        """
+        book_depth = lorebook.scan_depth or 0
+        window_size = max(plan.scan_depths.values(), default=0)
+        if plan.uses_book_depth:
+            window_size = max(window_size, book_depth)
+        if window_size <= 0:
+            return set()
+
+        window = [msg.get("content", "") for msg in chat_history[-window_size:]]
+        nearest = self._history_scanner.scan(plan.index, window)
+
+        scan_depths = plan.scan_depths
+        delayed = plan.delayed
+        found = set()
+        for i, distance in nearest.items():
+            if i in matched or i in delayed:
+                continue
+            if distance <= scan_depths.get(i, book_depth):
+                found.add(i)
+        return found
+
+    def _render_world_info(self, entries: List[WorldBookEntry]) -> str:
+        """
+        组装世界书条目内容（并替换变量）
 
-        # 按 insertion_order 排序
-        triggered_entries.sort(key=lambda e: e.insertion_order)
+        Args:
+            entries: 已排序的条目
 
-        # 组装内容（并替换变量）
+        Returns:
+            以空行分隔的内容
+        """
         parts = []
-        for entry in triggered_entries:
+        for entry in entries:
             if entry.content.strip():
                 content = entry.content.strip()
                 if self.enable_variable_replacement:
-                    content = self._replace_variables_recursive(content)
+                    content = self._render_section(content)
                 parts.append(content)
 
         return "\n\n".join(parts)
 
-    def _check_keyword_match(self, entry: WorldBookEntry, user_message: str) -> bool:
-        """检查关键词是否匹配"""
-        if not user_message:
-            return False
-
-        all_keywords = entry.keys + entry.secondary_keys
-
-        if not all_keywords:
-            return False
-
-        search_text = user_message
+    def _insert_depth_entries(self,
+                              history_messages: List[Message],
+                              entries: List[WorldBookEntry]) -> List[Message]:
+        """
+        把按深度插入的世界书条目插入聊天历史
+        深度 0 在最后一条历史消息之后，深度 n 在倒数第 n 条之前；深度和角色相同的条目合并为一条消息
 
-        case_sensitive = entry.extensions.case_sensitive
-        if case_sensitive is None:
-            case_sensitive = False
+        Args:
+            history_messages: 聊天历史消息
+            entries: 已排序的 AT_DEPTH 条目
 
-        if not case_sensitive:
-            search_text = search_text.lower()
-            all_keywords = [k.lower() for k in all_keywords]
+        Returns:
+            插入后的消息列表
+        """
+        if not entries:
+            return history_messages
 
-        use_regex = entry.use_regex
-        match_whole_words = entry.extensions.match_whole_words
-        if match_whole_words is None:
-            match_whole_words = False
+        groups: Dict[Tuple[int, str], List[WorldBookEntry]] = {}
+        for entry in entries:
+            key = (max(entry.extensions.depth, 0), self.ENTRY_ROLES.get(entry.extensions.role, "system"))
+            groups.setdefault(key, []).append(entry)
 
-        for keyword in all_keywords:
-            if not keyword.strip():
-                continue
+        count = len(history_messages)
+        inserts: Dict[int, List[Message]] = {}
+        for (depth, role), group in groups.items():
+            content = self._render_world_info(group)
+            if content:
+                inserts.setdefault(max(count - depth, 0), []).append(Message(role=role, content=content))
 
-            if use_regex:
-                try:
-                    flags = 0 if case_sensitive else re.IGNORECASE
-                    if re.search(keyword, user_message, flags):
-                        return True
-                except re.error:
-                    if keyword in search_text:
-                        return True
-            else:
-                if match_whole_words:
-                    pattern = r'\b' + re.escape(keyword) + r'\b'
-                    flags = 0 if case_sensitive else re.IGNORECASE
-                    if re.search(pattern, user_message, flags):
-                        return True
-                else:
-                    if keyword in search_text:
-                        return True
+        result = []
+        for i, message in enumerate(history_messages):
+            result.extend(inserts.get(i, ()))
+            result.append(message)
+        result.extend(inserts.get(count, ()))
+        return result
 
-        return False
+    def _get_world_info_plan(self, lorebook) -> _WorldInfoPlan:
+        """
+        获取世界书激活计划（首次使用时构建，包含关键词索引）
+        条目列表被替换、条目数变化或世界书版本号变化（LorebookManager 修改条目、调用 touch()）时自动重建
+        """
+        entries = lorebook.entries
+        key = (id(lorebook), id(entries), len(entries), lorebook.version)
+        if self._world_info_plan is None or self._world_info_plan_key != key:
+            self._world_info_plan = _WorldInfoPlan(entries)
+            self._world_info_plan_key = key
+        return self._world_info_plan
 
     def _parse_chat_examples(self, mes_example: str) -> List[Message]:
         """
@@ -442,7 +867,7 @@ class PromptBuilder:
 
             # 替换变量
             if self.enable_variable_replacement:
-                example = self._replace_variables_recursive(example)
+                example = self._render_section(example)
 
             # 解析对话（简单实现：按行分割，识别 User: 和 Char:）
             lines = example.split('\n')
@@ -455,7 +880,7 @@ class PromptBuilder:
                 if line.startswith('{{user}}:') or line.startswith('User:'):
                     content = line.split(':', 1)[1].strip()
                     messages.append(Message(role="user", content=content))
-                elif line.startswith('{{char}}:') or line.startswith(f'{self.card.name}:'):
+                elif line.startswith('{{char}}:') or line.startswith(f'{self.view.name}:'):
                     content = line.split(':', 1)[1].strip()
                     messages.append(Message(role="assistant", content=content))
                 else:
@@ -464,12 +889,38 @@ class PromptBuilder:
 
         return messages
 
-    def _format_chat_history_as_messages(self,
-                                         chat_history: List[Dict[str, str]],
-                                         max_messages: int) -> List[Message]:
-        """格式化聊天历史为消息列表"""
-        recent_history = chat_history[-max_messages:] if max_messages > 0 else chat_history
+    def _recent_history(self,
+                        chat_history: List[Dict[str, str]],
+                        max_messages: int,
+                        max_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        截取进入提示词的聊天历史
+
+        Args:
+            chat_history: 聊天历史
+            max_messages: 最大消息数（0 为不限制）
+            max_tokens: 最大 token 数（None 为不限制）
+
+        Returns:
+            最近的、同时满足两个限制的消息
+        """
+        if not chat_history:
+            return []
+        start = max(len(chat_history) - max_messages, 0) if max_messages > 0 else 0
+        if max_tokens is not None:
+            start = max(start, self._history_token_start(chat_history, max_tokens))
+        return chat_history[start:]
+
+    def _format_chat_history_as_messages(self, recent_history: List[Dict[str, str]]) -> List[Message]:
+        """
+        格式化聊天历史为消息列表
+
+        Args:
+            recent_history: 截取后的聊天历史
 
+        Returns:
+            消息列表
+        """
         messages = []
         for msg in recent_history:
             role = msg.get("role", "user")
@@ -486,11 +937,51 @@ class PromptBuilder:
 
         return messages
 
+    def _history_token_start(self, chat_history: List[Dict[str, str]], max_tokens: int) -> int:
+        """
+        在 token 限制内能保留的最早一条消息的下标
+        与上一轮相同的前缀直接复用前缀和，只计算新消息，再二分查找最长的后缀
+
+        Args:
+            chat_history: 聊天历史
+            max_tokens: 最大 token 数
+
+        Returns:
+            消息下标（等于消息数时表示一条也放不下）
+        """
+        tokenizer = self.get_tokenizer()
+        contents = self._history_contents
+        prefix = self._history_prefix
+        if tokenizer is not self._history_tokens_owner:
+            contents.clear()
+            del prefix[1:]
+            self._history_tokens_owner = tokenizer
+
+        # 找到与上一轮相同的前缀（通常是全部旧消息）
+        common = 0
+        limit = min(len(contents), len(chat_history))
+        while common < limit and contents[common] == chat_history[common].get("content", ""):
+            common += 1
+        del contents[common:]
+        del prefix[common + 1:]
+
+        for msg in chat_history[common:]:
+            content = msg.get("content", "")
+            contents.append(content)
+            prefix.append(prefix[-1] + self._estimate_tokens(content))
+
+        # 最小的 start 使 prefix[n] - prefix[start] <= max_tokens
+        return bisect_left(prefix, prefix[-1] - max(max_tokens, 0))
+
+    def get_tokenizer(self) -> Tokenizer:
+        """当前使用的分词器"""
+        return self.tokenizer if self.tokenizer is not None else get_default_tokenizer()
+
     def _estimate_tokens(self, text: str) -> int:
-        """估算 Token 数"""
+        """计算 Token 数（通过分词器，结果按文本缓存）"""
         if not text:
             return 0
-        return len(text) // 3
+        return self.get_tokenizer().count(text)
 
     def get_total_tokens(self, messages: List[Message]) -> int:
         """计算总 Token 数"""
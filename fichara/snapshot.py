@@ -0,0 +1,159 @@
+# snapshot.py
+"""
+二进制快照
+把已解析的角色卡/世界书保存为紧凑的二进制格式，加载时免校验直接构建模型
+
+格式（整数均为小端）:
+    头部:  魔数 b'FCSN' | 结构版本 u16 | marshal 版本 u8 | 保留 u8 | 记录数 u32
+    记录:  类型 u8 | 长度 u32 | CRC32 u32 | marshal 编码的字段字典
+
+结构版本、marshal 版本不一致或校验和不符的快照一律拒绝加载（抛出 ValueError）
+"""
+
+import gc
+import marshal
+import struct
+import zlib
+from typing import List, Sequence, Union
+
+from models import CharacterBook, CharacterCardV2, CharacterCardV3, construct_model
+
+SNAPSHOT_MAGIC = b'FCSN'
+
+# 模型结构变化时递增，旧版本快照将被拒绝加载
+SNAPSHOT_SCHEMA_VERSION = 2
+
+_HEADER = struct.Struct('<4sHBBI')
+_RECORD = struct.Struct('<BII')
+
+# 记录类型编号
+_KINDS = {
+    CharacterCardV2: 1,
+    CharacterCardV3: 2,
+    CharacterBook: 3,
+}
+_MODELS = {kind: model_cls for model_cls, kind in _KINDS.items()}
+
+SnapshotObject = Union[CharacterCardV2, CharacterCardV3, CharacterBook]
+
+
+def dumps_snapshot(objects: Union[SnapshotObject, Sequence[SnapshotObject]]) -> bytes:
+    """
+    序列化为二进制快照
+
+    Args:
+        objects: 单个对象或对象列表（CharacterCardV2 / CharacterCardV3 / CharacterBook）
+
+    Returns:
+        快照字节串
+    """
+    if isinstance(objects, (CharacterCardV2, CharacterCardV3, CharacterBook)):
+        objects = [objects]
+
+    parts = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_SCHEMA_VERSION, marshal.version, 0, len(objects))]
+    for obj in objects:
+        kind = _KINDS.get(type(obj))
+        if kind is None:
+            raise TypeError(f"不支持的快照对象类型: {type(obj).__name__}")
+        payload = marshal.dumps(obj.model_dump())
+        parts.append(_RECORD.pack(kind, len(payload), zlib.crc32(payload)))
+        parts.append(payload)
+
+    return b''.join(parts)
+
+
+def loads_snapshot(data: bytes) -> List[SnapshotObject]:
+    """
+    从二进制快照加载（不经过 pydantic 校验）
+
+    Args:
+        data: 快照字节串
+
+    Returns:
+        对象列表
+
+    Raises:
+        ValueError: 快照无效、版本不匹配或数据损坏
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("快照数据不完整")
+
+    magic, schema_version, marshal_version, _, count = _HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("不是有效的快照文件")
+    if schema_version != SNAPSHOT_SCHEMA_VERSION:
+        raise ValueError(f"快照结构版本不匹配: {schema_version}（当前 {SNAPSHOT_SCHEMA_VERSION}）")
+    if marshal_version != marshal.version:
+        raise ValueError(f"快照 marshal 版本不匹配: {marshal_version}（当前 {marshal.version}）")
+
+    view = memoryview(data)
+    offset = _HEADER.size
+    objects = []
+
+    # 批量创建大量对象时，分代 GC 反复遍历新对象图的开销比构建本身还大
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _load_records(data, view, offset, count, objects)
+    except ValueError:
+        raise
+    except Exception as e:
+        # marshal/构建过程中的任何错误都视为数据损坏，调用方只需处理 ValueError
+        raise ValueError(f"快照数据损坏: {e!r}") from e
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return objects
+
+
+def _load_records(data: bytes, view: memoryview, offset: int, count: int, objects: list):
+    """逐条解码快照记录"""
+    for _ in range(count):
+        if offset + _RECORD.size > len(data):
+            raise ValueError("快照数据不完整")
+        kind, length, checksum = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        model_cls = _MODELS.get(kind)
+        if model_cls is None:
+            raise ValueError(f"未知的快照记录类型: {kind}")
+        if offset + length > len(data):
+            raise ValueError("快照数据不完整")
+
+        payload = view[offset:offset + length]
+        if zlib.crc32(payload) != checksum:
+            raise ValueError("快照校验和不匹配")
+        fields = marshal.loads(payload)
+        if not isinstance(fields, dict):
+            raise ValueError("快照记录不是字段字典")
+        objects.append(construct_model(model_cls, fields, owned=True))
+        offset += length
+
+    if offset != len(data):
+        raise ValueError("快照末尾有多余数据")
+
+
+def save_snapshot(objects: Union[SnapshotObject, Sequence[SnapshotObject]], output_path: str):
+    """
+    保存快照文件
+
+    Args:
+        objects: 单个对象或对象列表
+        output_path: 输出路径
+    """
+    with open(output_path, 'wb') as f:
+        f.write(dumps_snapshot(objects))
+
+
+def load_snapshot(snapshot_path: str) -> List[SnapshotObject]:
+    """
+    加载快照文件
+
+    Args:
+        snapshot_path: 快照路径
+
+    Returns:
+        对象列表
+    """
+    with open(snapshot_path, 'rb') as f:
+        return loads_snapshot(f.read())
@@ -0,0 +1,317 @@
+# tokenizer.py
+"""
+Token 计数
+提供统一的分词器接口：默认使用区分中日韩文字的估算器，也可以从本地词表/合并规则文件加载 BPE 分词器；
+计数结果按文本哈希缓存（LRU），重复计算相同文本时不再重新分词
+"""
+
+import hashlib
+import json
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class Tokenizer(ABC):
+    """分词器接口（只计数）"""
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """
+        计算 token 数
+
+        Args:
+            text: 文本
+
+        Returns:
+            token 数
+        """
+
+
+class EncodingTokenizer(Tokenizer):
+    """可以编码为 token id 的分词器接口"""
+
+    @abstractmethod
+    def encode(self, text: str) -> List[int]:
+        """
+        编码为 token id 列表
+
+        Args:
+            text: 文本
+
+        Returns:
+            token id 列表
+        """
+
+
+# ============ 估算 ============
+
+# 中日韩文字、假名、谚文、全角符号：大多数分词器中约 1 个字符 1 个 token
+_CJK_PATTERN = re.compile(
+    '[\u2e80-\u2fdf\u3000-\u303f\u3040-\u30ff\u3100-\u312f\u3400-\u4dbf\u4e00-\u9fff'
+    '\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef\U00020000-\U0002fa1f]'
+)
+
+
+class EstimateTokenizer(Tokenizer):
+    """
+    估算分词器（不需要词表）
+    中日韩字符按每个字符 1 个 token 计算，其余文本按每 chars_per_token 个字符 1 个 token 计算
+    """
+
+    def __init__(self, chars_per_token: float = 4.0):
+        """
+        Args:
+            chars_per_token: 非中日韩文本每个 token 的平均字符数
+        """
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cjk = len(_CJK_PATTERN.findall(text))
+        other = len(text) - cjk
+        return cjk + int(-(-other // self.chars_per_token))
+
+
+# ============ BPE ============
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    """字节 -> 可见字符（与 GPT-2 的字节级 BPE 一致）"""
+    printable = (list(range(0x21, 0x7e + 1))
+                 + list(range(0xa1, 0xac + 1))
+                 + list(range(0xae, 0xff + 1)))
+    mapping = {b: chr(b) for b in printable}
+    extra = 0
+    for b in range(256):
+        if b not in mapping:
+            mapping[b] = chr(256 + extra)
+            extra += 1
+    return mapping
+
+
+_BYTE_ENCODER = _bytes_to_unicode()
+
+# 预分词（GPT-2 规则的标准库 re 写法：字母串、数字串、符号串、空白）
+_PRETOKENIZE_PATTERN = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?(?:[^\s\w]|_)+|\s+(?!\S)|\s+""")
+
+
+class BPETokenizer(EncodingTokenizer):
+    """字节级 BPE 分词器（GPT-2 格式的 vocab.json + merges.txt）"""
+
+    # 单词分词结果缓存的最大条目数（超出时清空）
+    WORD_CACHE_SIZE = 65536
+
+    def __init__(self,
+                 vocab: Dict[str, int],
+                 merges: Sequence[Tuple[str, str]],
+                 unk_id: Optional[int] = None):
+        """
+        Args:
+            vocab: 词表 {token: id}
+            merges: 合并规则（按优先级从高到低）
+            unk_id: 词表中没有的 token 使用的 id（None 时抛出异常）
+        """
+        self.vocab = vocab
+        self.ranks: Dict[Tuple[str, str], int] = {tuple(pair): i for i, pair in enumerate(merges)}
+        self.unk_id = unk_id
+        self._word_cache: Dict[str, Tuple[str, ...]] = {}
+
+    @classmethod
+    def from_files(cls, vocab_path: str, merges_path: str, unk_id: Optional[int] = None) -> "BPETokenizer":
+        """
+        从本地文件加载
+
+        Args:
+            vocab_path: 词表文件（JSON，{token: id}）
+            merges_path: 合并规则文件（每行 "a b"，可以有 #version 开头的注释行）
+            unk_id: 词表中没有的 token 使用的 id
+
+        Returns:
+            BPETokenizer 对象
+        """
+        with open(vocab_path, 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+
+        merges = []
+        with open(merges_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if not line or line.startswith('#'):
+                    continue
+                pair = line.split(' ')
+                if len(pair) != 2:
+                    raise ValueError(f"无效的合并规则: {line!r}")
+                merges.append((pair[0], pair[1]))
+
+        return cls(vocab, merges, unk_id)
+
+    def _bpe(self, word: str) -> Tuple[str, ...]:
+        """对一个预分词片段（已转为字节字符）执行合并"""
+        cached = self._word_cache.get(word)
+        if cached is not None:
+            return cached
+
+        parts = list(word)
+        ranks = self.ranks
+        while len(parts) > 1:
+            # 找到优先级最高的相邻对
+            best_rank = None
+            best_pair = None
+            for pair in zip(parts, parts[1:]):
+                rank = ranks.get(pair)
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_pair = rank, pair
+            if best_pair is None:
+                break
+
+            first, second = best_pair
+            merged = []
+            i = 0
+            while i < len(parts):
+                if i < len(parts) - 1 and parts[i] == first and parts[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(parts[i])
+                    i += 1
+            parts = merged
+
+        result = tuple(parts)
+        if len(self._word_cache) >= self.WORD_CACHE_SIZE:
+            self._word_cache.clear()
+        self._word_cache[word] = result
+        return result
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        分词
+
+        Args:
+            text: 文本
+
+        Returns:
+            token 字符串列表（字节级表示）
+        """
+        tokens = []
+        for piece in _PRETOKENIZE_PATTERN.findall(text):
+            word = ''.join(_BYTE_ENCODER[b] for b in piece.encode('utf-8', 'surrogatepass'))
+            tokens.extend(self._bpe(word))
+        return tokens
+
+    def encode(self, text: str) -> List[int]:
+        ids = []
+        for token in self.tokenize(text):
+            token_id = self.vocab.get(token, self.unk_id)
+            if token_id is None:
+                raise ValueError(f"词表中没有 token: {token!r}")
+            ids.append(token_id)
+        return ids
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self.tokenize(text))
+
+
+# ============ 缓存 ============
+
+class CachedTokenizer(Tokenizer):
+    """
+    为分词器增加计数缓存（LRU，按文本哈希索引，不保存原文）
+    只缓存计数；需要编码时使用被包装的分词器（self.tokenizer.encode）
+    """
+
+    def __init__(self, tokenizer: Tokenizer, max_size: int = 65536):
+        """
+        Args:
+            tokenizer: 实际的分词器
+            max_size: 最大缓存条目数
+        """
+        self.tokenizer = tokenizer
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+
+        # 默认分词器由所有线程共享。每一步都是单个 C 调用，但两步之间另一个线程可能已经
+        # 淘汰了这个键或清空了缓存，因此 move_to_end / popitem 的 KeyError 直接忽略（不加锁，不影响命中路径）
+        key = self._key(text)
+        counts = self._counts
+        cached = counts.get(key)
+        if cached is not None:
+            try:
+                counts.move_to_end(key)
+            except KeyError:
+                pass
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        result = self.tokenizer.count(text)
+        counts[key] = result
+        while len(counts) > self.max_size:
+            try:
+                counts.popitem(last=False)
+            except KeyError:
+                break
+        return result
+
+    def clear(self):
+        """清空缓存"""
+        self._counts.clear()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+def cached_tokenizer(tokenizer: Tokenizer, max_size: int = 65536) -> CachedTokenizer:
+    """为分词器增加计数缓存（已经带缓存时直接返回）"""
+    if isinstance(tokenizer, CachedTokenizer):
+        return tokenizer
+    return CachedTokenizer(tokenizer, max_size)
+
+
+# ============ 默认分词器 ============
+
+_default_tokenizer: CachedTokenizer = CachedTokenizer(EstimateTokenizer())
+
+
+def get_default_tokenizer() -> CachedTokenizer:
+    """获取默认分词器（未指定分词器的组装器、世界书统计都使用它）"""
+    return _default_tokenizer
+
+
+def set_default_tokenizer(tokenizer: Tokenizer):
+    """
+    设置默认分词器
+
+    Args:
+        tokenizer: 分词器（会自动增加计数缓存）
+    """
+    global _default_tokenizer
+    _default_tokenizer = cached_tokenizer(tokenizer)
+
+
+def count_tokens(text: str, tokenizer: Optional[Tokenizer] = None) -> int:
+    """
+    计算 token 数
+
+    Args:
+        text: 文本
+        tokenizer: 分词器（None 为默认分词器）
+
+    Returns:
+        token 数
+    """
+    # CachedTokenizer 定义了 __len__，缓存为空时为假值，不能用 or
+    return (tokenizer if tokenizer is not None else _default_tokenizer).count(text)
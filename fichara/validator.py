@@ -5,7 +5,7 @@
 """
 
 from typing import Union, List, Tuple
-from models import CharacterCardV2, CharacterCardV3, WorldBookEntry
+from models import CharacterCardV2, CharacterCardV3, WorldBookEntry, card_view
 
 
 class ValidationError:
@@ -49,12 +49,9 @@ class CharacterCardValidator:
         errors.extend(CharacterCardValidator._validate_basic_fields(card))
 
         # 2. 验证世界书
-        if isinstance(card, CharacterCardV3):
-            if card.data.character_book:
-                errors.extend(CharacterCardValidator._validate_lorebook(card.data.character_book))
-        elif isinstance(card, CharacterCardV2):
-            if card.character_book:
-                errors.extend(CharacterCardValidator._validate_lorebook(card.character_book))
+        lorebook = card_view(card).character_book
+        if lorebook:
+            errors.extend(CharacterCardValidator._validate_lorebook(lorebook))
 
         # 3. 验证标签
         errors.extend(CharacterCardValidator._validate_tags(card))
@@ -190,12 +187,9 @@ class CharacterCardValidator:
             card.first_mes = ""
 
         # 2. 修复世界书
-        if isinstance(card, CharacterCardV3):
-            if card.data.character_book:
-                CharacterCardValidator._fix_lorebook(card.data.character_book)
-        elif isinstance(card, CharacterCardV2):
-            if card.character_book:
-                CharacterCardValidator._fix_lorebook(card.character_book)
+        lorebook = card_view(card).character_book
+        if lorebook:
+            CharacterCardValidator._fix_lorebook(lorebook)
 
         return card
 
@@ -4,15 +4,99 @@
 支持内置变量和自定义变量，使用回调函数机制
 """
 
-from typing import Callable, Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import inspect
 import re
 from datetime import datetime
 import random
 
+from instrumentation import (
+    get_logger, metrics,
+    UNKNOWN_VARIABLES, VARIABLE_ERRORS, VARIABLE_DEPTH_LIMIT, VARIABLE_CACHE_HITS,
+    TEMPLATE_CACHE_HITS, TEMPLATE_CACHE_MISSES,
+)
+
+logger = get_logger(__name__)
+
+# 变量语法 {{variable}}
+VARIABLE_PATTERN = re.compile(r'\{\{([^}]+)\}\}')
+
+# 变量作用域
+SCOPE_PURE = "pure"          # 只依赖替换器状态（用户名、角色名等），结果跨渲染缓存
+SCOPE_RENDER = "render"      # 每次渲染（一次 build_messages）最多计算一次
+SCOPE_VOLATILE = "volatile"  # 每次出现都重新计算
+VARIABLE_SCOPES = (SCOPE_PURE, SCOPE_RENDER, SCOPE_VOLATILE)
+
+
+def _is_async_callable(callback: Callable) -> bool:
+    """回调是否为协程函数（包括定义了 async __call__ 的对象）"""
+    return (inspect.iscoroutinefunction(callback)
+            or inspect.iscoroutinefunction(getattr(callback, '__call__', None)))
+
+
+class CompiledTemplate:
+    """
+    预编译模板
+    文本只在编译时扫描一次，拆分为 文本/变量 交替的片段，渲染时只做拼接
+    """
+
+    __slots__ = ('text', 'parts')
+
+    def __init__(self, text: str):
+        """
+        Args:
+            text: 原始文本
+        """
+        self.text = text
+        # 偶数位为文本片段，奇数位为变量名（已去除两端空白）
+        parts = VARIABLE_PATTERN.split(text)
+        for i in range(1, len(parts), 2):
+            parts[i] = parts[i].strip()
+        self.parts: Tuple[str, ...] = tuple(parts)
+
+    @property
+    def has_variables(self) -> bool:
+        """是否包含变量"""
+        return len(self.parts) > 1
+
+    @property
+    def variables(self) -> Tuple[str, ...]:
+        """模板中出现的变量名（按出现顺序，可能重复）"""
+        return self.parts[1::2]
+
+    def render(self, resolve: Callable[[str], str]) -> str:
+        """
+        渲染模板
+
+        Args:
+            resolve: 变量名 -> 替换值
+
+        Returns:
+            渲染后的文本
+        """
+        parts = self.parts
+        if len(parts) == 1:
+            return parts[0]
+
+        out = list(parts)
+        for i in range(1, len(out), 2):
+            out[i] = resolve(out[i])
+        return ''.join(out)
+
+    def __repr__(self):
+        return f"CompiledTemplate(segments={len(self.parts)}, variables={list(self.variables)})"
+
 
 class VariableReplacer:
     """变量替换器"""
 
+    # 编译缓存的最大模板数
+    TEMPLATE_CACHE_SIZE = 4096
+
     # 内置变量的默认回调
     BUILTIN_VARIABLES = {
         "user": lambda ctx: ctx.get("user_name", "User"),
@@ -24,6 +108,17 @@ class VariableReplacer:
         "newline": lambda ctx: "\n",
     }
 
+    # 内置变量的作用域
+    BUILTIN_SCOPES = {
+        "user": SCOPE_PURE,
+        "char": SCOPE_PURE,
+        "time": SCOPE_RENDER,
+        "date": SCOPE_RENDER,
+        "datetime": SCOPE_RENDER,
+        "random": SCOPE_VOLATILE,
+        "newline": SCOPE_PURE,
+    }
+
     def __init__(self,
                  user_name: str = "User",
                  char_name: str = "Character"):
@@ -39,6 +134,38 @@ class VariableReplacer:
 
         # 变量回调函数字典
         self.variable_callbacks: Dict[str, Callable[[Dict[str, Any]], str]] = {}
+        # 变量作用域（未登记的按 volatile 处理）
+        self.variable_scopes: Dict[str, str] = {}
+        # 异步变量（回调为协程函数）
+        self.async_variables: Set[str] = set()
+        # 异步变量超时时间（秒）
+        self.variable_timeouts: Dict[str, float] = {}
+        # 回调失败/超时时使用的替换值（未设置时保留原样）
+        self.variable_fallbacks: Dict[str, str] = {}
+
+        # 版本号：pure 变量的结果可能变化时（注册/注销变量、修改用户名/角色名）递增
+        self.version = 0
+        # 非 pure 变量（render/volatile/异步/回调失败）的读取次数，
+        # 一次替换前后不变说明结果只依赖 pure 变量，可以缓存
+        self.dynamic_reads = 0
+
+        # 基础上下文与 pure 变量缓存（用户名/角色名变化时重建）
+        self._base_key: Optional[Tuple[str, str]] = None
+        self._base_context: Dict[str, Any] = {}
+        self._pure_cache: Dict[str, str] = {}
+
+        # 当前渲染作用域内的 render 变量结果（不在渲染作用域内时为 None）
+        # 按上下文保存：每个线程、每个 asyncio 任务各自的渲染作用域互不影响
+        self._render_memo: ContextVar[Optional[Dict[str, str]]] = ContextVar(
+            f'render_memo_{id(self):x}', default=None
+        )
+
+        # 编译缓存（按文本内容缓存，LRU 淘汰）
+        self._templates: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        # 模板中变量的作用域概况: 文本 -> (是否只含 pure 变量, 是否含 render 变量)
+        self._template_scopes: Dict[str, Tuple[bool, bool]] = {}
+        # 只含 pure 变量的模板的替换结果（无额外上下文时）
+        self._rendered: Dict[str, str] = {}
 
         # 注册内置变量
         self._register_builtin_variables()
@@ -47,25 +174,57 @@ class VariableReplacer:
         """注册内置变量"""
         for var_name, callback in self.BUILTIN_VARIABLES.items():
             self.variable_callbacks[var_name] = callback
+            self.variable_scopes[var_name] = self.BUILTIN_SCOPES.get(var_name, SCOPE_VOLATILE)
 
     def register_variable(self,
                           var_name: str,
-                          callback: Callable[[Dict[str, Any]], str]):
+                          callback: Callable[[Dict[str, Any]], str],
+                          scope: str = SCOPE_VOLATILE,
+                          timeout: Optional[float] = None,
+                          fallback: Optional[str] = None):
         """
         注册自定义变量
 
         Args:
             var_name: 变量名（不含{{}}）
-            callback: 回调函数，接受上下文字典，返回替换值
+            callback: 回调函数，接受上下文字典，返回替换值（可以是 async 函数）
+            scope: 作用域
+                - "pure": 结果只依赖替换器状态，跨渲染缓存
+                - "render": 每次渲染最多调用一次（适合查询数据库等耗时回调）
+                - "volatile": 每次出现都调用（默认）
+            timeout: 异步回调的超时时间（秒），None 为不限制
+            fallback: 回调失败或超时时的替换值，None 为保留原样
 
         Example:
             replacer.register_variable(
                 "weather",
                 lambda ctx: "sunny"
             )
+            replacer.register_variable("persona_mood", load_mood, scope="render")
+            replacer.register_variable("news", fetch_news, timeout=0.5, fallback="")
         """
+        if scope not in VARIABLE_SCOPES:
+            raise ValueError(f"未知的变量作用域: {scope}")
+
         self.variable_callbacks[var_name] = callback
-        print(f"✅ 已注册变量: {{{{{{var_name}}}}}}")
+        self.variable_scopes[var_name] = scope
+
+        if _is_async_callable(callback):
+            self.async_variables.add(var_name)
+        else:
+            self.async_variables.discard(var_name)
+
+        if timeout is not None:
+            self.variable_timeouts[var_name] = timeout
+        else:
+            self.variable_timeouts.pop(var_name, None)
+        if fallback is not None:
+            self.variable_fallbacks[var_name] = fallback
+        else:
+            self.variable_fallbacks.pop(var_name, None)
+
+        self._invalidate()
+        logger.debug("已注册变量: {{%s}}", var_name)
 
     def unregister_variable(self, var_name: str):
         """
@@ -76,9 +235,72 @@ class VariableReplacer:
         """
         if var_name in self.variable_callbacks:
             del self.variable_callbacks[var_name]
-            print(f"✅ 已注销变量: {{{{{{var_name}}}}}}")
+            self.variable_scopes.pop(var_name, None)
+            self.async_variables.discard(var_name)
+            self.variable_timeouts.pop(var_name, None)
+            self.variable_fallbacks.pop(var_name, None)
+            self._invalidate()
+            logger.debug("已注销变量: {{%s}}", var_name)
         else:
-            print(f"⚠️ 变量不存在: {{{{{{var_name}}}}}}")
+            logger.warning("变量不存在: {{%s}}", var_name)
+
+    def _invalidate(self):
+        """清空 pure 变量缓存并递增版本号"""
+        self._pure_cache.clear()
+        self._template_scopes.clear()
+        self._rendered.clear()
+        memo = self._render_memo.get()
+        if memo:
+            memo.clear()
+        self.version += 1
+
+    @contextmanager
+    def render_scope(self) -> Iterator[Dict[str, str]]:
+        """
+        渲染作用域
+        作用域内 render 变量最多计算一次；嵌套使用时共享最外层的作用域。
+        作用域按上下文（线程、asyncio 任务）区分，并发的组装各自独立
+
+        Example:
+            with replacer.render_scope():
+                a = replacer.replace(description)
+                b = replacer.replace(scenario)  # {{time}} 与上面一致
+        """
+        memo = self._render_memo.get()
+        if memo is not None:
+            yield memo
+            return
+
+        memo = {}
+        token = self._render_memo.set(memo)
+        try:
+            yield memo
+        finally:
+            self._render_memo.reset(token)
+
+    def compile(self, text: str) -> CompiledTemplate:
+        """
+        编译模板（同一文本只编译一次）
+
+        Args:
+            text: 原始文本
+
+        Returns:
+            CompiledTemplate 对象
+        """
+        templates = self._templates
+        template = templates.get(text)
+        if template is not None:
+            templates.move_to_end(text)
+            metrics.increment(TEMPLATE_CACHE_HITS)
+            return template
+
+        metrics.increment(TEMPLATE_CACHE_MISSES)
+        template = CompiledTemplate(text)
+        templates[text] = template
+        if len(templates) > self.TEMPLATE_CACHE_SIZE:
+            templates.popitem(last=False)
+        return template
 
     def replace(self, text: str, context: Optional[Dict[str, Any]] = None) -> str:
         """
@@ -96,29 +318,277 @@ class VariableReplacer:
 
         # 准备上下文
         ctx = self._prepare_context(context)
+        use_rendered = ctx is self._base_context
+        if use_rendered:
+            result = self._rendered.get(text)
+            if result is not None:
+                return result
+
+        template = self.compile(text)
+        if not template.has_variables:
+            if use_rendered:
+                self._store_rendered(text, text)
+            return text
 
-        # 查找所有变量 {{variable}}
-        pattern = r'\{\{([^}]+)\}\}'
+        pure_only, needs_scope = self._scopes_of(template)
+        if needs_scope and self._render_memo.get() is None:
+            with self.render_scope():
+                return self._render(template, ctx)
 
-        def replace_match(match):
-            var_name = match.group(1).strip()
-            return self._get_variable_value(var_name, ctx)
+        dynamic_reads = self.dynamic_reads
+        result = self._render(template, ctx)
+        # 只含 pure 变量且回调全部成功时，结果在版本号变化前不会改变
+        if pure_only and use_rendered and self.dynamic_reads == dynamic_reads:
+            self._store_rendered(text, result)
+        return result
 
-        result = re.sub(pattern, replace_match, text)
+    def _store_rendered(self, text: str, result: str):
+        """缓存替换结果（超出上限时整体清空）"""
+        if len(self._rendered) >= self.TEMPLATE_CACHE_SIZE:
+            self._rendered.clear()
+        self._rendered[text] = result
 
-        return result
+    def _scopes_of(self, template: CompiledTemplate) -> Tuple[bool, bool]:
+        """
+        模板中变量的作用域概况（按版本号缓存，注册/注销变量时清空）
+
+        Returns:
+            (是否只含同步的 pure 变量, 是否含 render 变量)
+        """
+        scopes = self._template_scopes.get(template.text)
+        if scopes is None:
+            pure_only = True
+            needs_scope = False
+            for var_name in template.variables:
+                scope = self.variable_scopes.get(var_name, SCOPE_VOLATILE)
+                if (scope != SCOPE_PURE or var_name in self.async_variables
+                        or var_name not in self.variable_callbacks):
+                    pure_only = False
+                if scope == SCOPE_RENDER:
+                    needs_scope = True
+            if len(self._template_scopes) >= self.TEMPLATE_CACHE_SIZE:
+                self._template_scopes.clear()
+            scopes = self._template_scopes[template.text] = (pure_only, needs_scope)
+        return scopes
+
+    def _render(self, template: CompiledTemplate, ctx: Dict[str, Any]) -> str:
+        """渲染模板（与 CompiledTemplate.render 相同，但直接调用取值方法，不创建闭包）"""
+        out = list(template.parts)
+        get_value = self._get_variable_value
+        # 同步 pure 变量直接读缓存，命中数最后一次性计入指标
+        pure_cache = self._pure_cache if ctx is self._base_context else {}
+        async_variables = self.async_variables
+        hits = 0
+        for i in range(1, len(out), 2):
+            var_name = out[i]
+            value = pure_cache.get(var_name)
+            if value is None or (async_variables and var_name in async_variables):
+                out[i] = get_value(var_name, ctx)
+            else:
+                out[i] = value
+                hits += 1
+        if hits:
+            metrics.increment(VARIABLE_CACHE_HITS, hits)
+        return ''.join(out)
+
+    def expand(self,
+               text: str,
+               context: Optional[Dict[str, Any]] = None,
+               max_depth: int = 5) -> str:
+        """
+        替换变量并展开嵌套变量（宏套宏）
+        变量值中的变量在同一遍中用工作栈展开，每段文本只扫描一次
+
+        Args:
+            text: 原始文本
+            context: 上下文字典（可选）
+            max_depth: 最大嵌套深度（1 表示只替换原文中的变量，不展开变量值）
+
+        Returns:
+            替换后的文本
+        """
+        if not text or max_depth <= 0:
+            return text
+
+        root = self.compile(text)
+        if not root.has_variables:
+            return text
+
+        with self.render_scope():
+            return self._expand(root, self._prepare_context(context), max_depth)
+
+    def _expand(self, root: CompiledTemplate, ctx: Dict[str, Any], max_depth: int) -> str:
+        """工作栈展开（调用方已准备上下文和渲染作用域）"""
+        out = []
+        # 帧: [片段, 下一个片段位置, 深度, 正在展开的变量名]
+        stack = [[root.parts, 0, 0, None]]
+        # 正在展开的变量（用于检测循环引用）
+        active = set()
+        depth_limited = False
+
+        while stack:
+            frame = stack[-1]
+            parts, i, depth, name = frame
+            if i >= len(parts):
+                stack.pop()
+                active.discard(name)
+                continue
+            frame[1] = i + 1
+
+            if not i % 2:
+                out.append(parts[i])
+                continue
+
+            var_name = parts[i]
+            literal = f"{{{{{var_name}}}}}"
+            if var_name in active:
+                # 循环引用，保留原样
+                out.append(literal)
+                continue
+
+            value = self._get_variable_value(var_name, ctx)
+            if value == literal:
+                # 未知变量或回调失败
+                out.append(value)
+                continue
+
+            template = self.compile(value)
+            if not template.has_variables:
+                out.append(value)
+            elif depth + 1 >= max_depth:
+                depth_limited = True
+                out.append(value)
+            else:
+                active.add(var_name)
+                stack.append([template.parts, 0, depth + 1, var_name])
+
+        if depth_limited:
+            metrics.increment(VARIABLE_DEPTH_LIMIT)
+            logger.warning("达到最大变量嵌套深度 %d，停止递归", max_depth)
+
+        return ''.join(out)
+
+    # ============ 异步变量 ============
+
+    async def aprefetch(self,
+                        texts: Iterable[str],
+                        context: Optional[Dict[str, Any]] = None):
+        """
+        并发计算文本中出现的所有异步变量，结果写入当前渲染作用域
+        之后在同一作用域内的 replace / expand 直接使用这些结果
+        （必须在 render_scope 内调用）
+
+        Args:
+            texts: 将要渲染的文本
+            context: 上下文字典（可选）
+        """
+        memo = self._render_memo.get()
+        if memo is None:
+            raise RuntimeError("aprefetch 必须在 render_scope 内调用")
+        if not self.async_variables:
+            return
+
+        ctx = self._prepare_context(context)
+        use_pure_cache = ctx is self._base_context
+
+        names = []
+        seen = set()
+        for text in texts:
+            if not text:
+                continue
+            for var_name in self.compile(text).variables:
+                if var_name in seen or var_name not in self.async_variables:
+                    continue
+                seen.add(var_name)
+                if var_name in memo:
+                    continue
+                if use_pure_cache and var_name in self._pure_cache:
+                    continue
+                names.append(var_name)
+
+        if not names:
+            return
+
+        values = await asyncio.gather(*(self._resolve_async(name, ctx) for name in names))
+        for var_name, value in zip(names, values):
+            if value is None:
+                # 失败：本次渲染使用替换值或保留原样，不写入跨渲染缓存
+                memo[var_name] = self.variable_fallbacks.get(var_name, f"{{{{{var_name}}}}}")
+                continue
+            memo[var_name] = value
+            if use_pure_cache and self.variable_scopes.get(var_name) == SCOPE_PURE:
+                self._pure_cache[var_name] = value
+
+    async def _resolve_async(self, var_name: str, context: Dict[str, Any]) -> Optional[str]:
+        """
+        调用异步回调（带超时）
+
+        Returns:
+            变量值，失败或超时返回 None
+        """
+        timeout = self.variable_timeouts.get(var_name)
+        try:
+            value = await asyncio.wait_for(self.variable_callbacks[var_name](context), timeout)
+            return str(value)
+        except asyncio.TimeoutError:
+            logger.warning("变量 {{%s}} 回调超时（%ss）", var_name, timeout)
+        except Exception as e:
+            logger.warning("变量 {{%s}} 回调执行失败: %s", var_name, e)
+        metrics.increment(VARIABLE_ERRORS)
+        return None
+
+    async def areplace(self, text: str, context: Optional[Dict[str, Any]] = None) -> str:
+        """
+        替换文本中的所有变量（异步变量并发计算）
+
+        Args:
+            text: 原始文本
+            context: 上下文字典（可选）
+
+        Returns:
+            替换后的文本
+        """
+        with self.render_scope():
+            await self.aprefetch([text], context)
+            return self.replace(text, context)
+
+    async def aexpand(self,
+                      text: str,
+                      context: Optional[Dict[str, Any]] = None,
+                      max_depth: int = 5) -> str:
+        """
+        替换变量并展开嵌套变量（异步变量并发计算）
+        只有直接出现在文本中的异步变量会被预先计算，出现在其它变量值中的异步变量使用替换值
+
+        Args:
+            text: 原始文本
+            context: 上下文字典（可选）
+            max_depth: 最大嵌套深度
+
+        Returns:
+            替换后的文本
+        """
+        with self.render_scope():
+            await self.aprefetch([text], context)
+            return self.expand(text, context, max_depth)
 
     def _prepare_context(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-        """准备上下文"""
-        ctx = {
-            "user_name": self.user_name,
-            "char_name": self.char_name,
-        }
+        """
+        准备上下文
+        基础上下文只在用户名/角色名变化时重建；没有额外上下文时直接复用（回调不应修改上下文）
+        """
+        key = (self.user_name, self.char_name)
+        if key != self._base_key:
+            self._base_key = key
+            self._base_context = {
+                "user_name": self.user_name,
+                "char_name": self.char_name,
+            }
+            self._invalidate()
 
         if context:
-            ctx.update(context)
-
-        return ctx
+            return {**self._base_context, **context}
+        return self._base_context
 
     def _get_variable_value(self, var_name: str, context: Dict[str, Any]) -> str:
         """
@@ -131,18 +601,59 @@ class VariableReplacer:
         Returns:
             变量值
         """
+        # 异步变量只能使用预先计算的结果
+        if var_name in self.async_variables:
+            self.dynamic_reads += 1
+            return self._get_prefetched_value(var_name, context)
+
         # 检查是否有回调函数
         if var_name in self.variable_callbacks:
+            scope = self.variable_scopes.get(var_name, SCOPE_VOLATILE)
+            if scope != SCOPE_PURE or context is not self._base_context:
+                self.dynamic_reads += 1
+
+            if scope == SCOPE_PURE:
+                # 传入了额外上下文时结果可能不同，不使用缓存
+                cache = self._pure_cache if context is self._base_context else None
+            elif scope == SCOPE_RENDER:
+                cache = self._render_memo.get()
+            else:
+                cache = None
+
+            if cache is not None:
+                value = cache.get(var_name)
+                if value is not None:
+                    metrics.increment(VARIABLE_CACHE_HITS)
+                    return value
+
             try:
-                return str(self.variable_callbacks[var_name](context))
+                value = str(self.variable_callbacks[var_name](context))
             except Exception as e:
-                print(f"⚠️ 变量 {{{{{{var_name}}}}}} 回调执行失败: {e}")
-                return f"{{{{{var_name}}}}}"  # 保留原样
+                self.dynamic_reads += 1
+                metrics.increment(VARIABLE_ERRORS)
+                logger.warning("变量 {{%s}} 回调执行失败: %s", var_name, e)
+                return self.variable_fallbacks.get(var_name, f"{{{{{var_name}}}}}")  # 保留原样
+
+            if cache is not None:
+                cache[var_name] = value
+            return value
         else:
             # 未知变量，保留原样
-            print(f"⚠️ 未知变量: {{{{{{var_name}}}}}}")
+            metrics.increment(UNKNOWN_VARIABLES)
+            logger.debug("未知变量: {{%s}}", var_name)
             return f"{{{{{var_name}}}}}"
 
+    def _get_prefetched_value(self, var_name: str, context: Dict[str, Any]) -> str:
+        """获取异步变量已计算的结果（未计算时使用替换值）"""
+        memo = self._render_memo.get()
+        if memo is not None and var_name in memo:
+            return memo[var_name]
+        if context is self._base_context and var_name in self._pure_cache:
+            return self._pure_cache[var_name]
+
+        logger.warning("异步变量 {{%s}} 未预先计算，请使用 areplace / aexpand", var_name)
+        return self.variable_fallbacks.get(var_name, f"{{{{{var_name}}}}}")
+
     def list_variables(self):
         """列出所有已注册的变量"""
         print("\n" + "=" * 60)
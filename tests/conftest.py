@@ -0,0 +1,10 @@
+# conftest.py
+"""
+测试配置
+fichara 内部模块使用平级导入，测试时把包目录加入 sys.path
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'fichara'))
@@ -0,0 +1,52 @@
+# test_card_cache.py
+"""
+CardCache 测试
+"""
+
+from PIL import Image
+
+import card_loader
+from card_cache import CardCache
+from card_loader import load_card, load_cards
+from png_handler import save_card_data
+
+
+def write_card(path, name: str):
+    if not path.exists():
+        Image.new('RGB', (1, 1)).save(path)
+    save_card_data(str(path), str(path), {'spec': 'chara_card_v2', 'spec_version': '2.0', 'name': name})
+
+
+def test_put_skips_file_changed_after_read(tmp_path):
+    path = tmp_path / 'card.png'
+    write_card(path, 'A')
+    result = load_card(path)
+    write_card(path, 'B')
+
+    cache = CardCache(':memory:')
+    assert cache.put(result.path, result.card, result.identity) is False
+    assert cache.get(path) is None
+    assert cache.load(path).name == 'B'
+    assert cache.get(path).name == 'B'
+
+
+def test_cached_bulk_load_does_not_store_stale_parse(tmp_path, monkeypatch):
+    path = tmp_path / 'card.png'
+    write_card(path, 'A')
+    parse = card_loader.parse_character_card
+
+    def parse_then_rewrite(data):
+        # 解析完成之后、写入缓存之前文件被改写
+        card = parse(data)
+        write_card(path, 'B')
+        return card
+
+    monkeypatch.setattr(card_loader, 'parse_character_card', parse_then_rewrite)
+    cache = CardCache(':memory:')
+    results = list(load_cards([path], workers=1, cache=cache))
+    monkeypatch.undo()
+
+    assert [r.card.name for r in results] == ['A']
+    assert cache.get(path) is None
+    assert [r.card.name for r in load_cards([path], workers=1, cache=cache)] == ['B']
+    assert cache.get(path).name == 'B'
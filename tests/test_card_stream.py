@@ -0,0 +1,81 @@
+# test_card_stream.py
+"""
+JsonArrayStreamer 测试
+"""
+
+import json
+
+import pytest
+
+from card_stream import JsonArrayStreamer
+
+CARD = {
+    'spec': 'chara_card_v3',
+    'data': {
+        'name': '引号"和\\反斜杠',
+        'first_mes': 'x' * 50 + '\\',
+        'character_book': {
+            'scan_depth': 12345,
+            'entries': [
+                {'id': 1, 'keys': ['"猫"', 'a\\'], 'content': '他说："喵\\"', 'order': -1.5e3},
+                {'id': 22, 'keys': [], 'content': '\\\\', 'extensions': {'depth': 4, 'list': [1, [2, {}]]}},
+                {'id': 333, 'enabled': False, 'comment': None, 'content': '  \t ü'},
+            ],
+        },
+    },
+}
+
+
+def stream(text: str, pieces, target_paths=None):
+    streamer = JsonArrayStreamer() if target_paths is None else JsonArrayStreamer(target_paths)
+    items = []
+    for piece in pieces:
+        items.extend(streamer.feed(piece))
+    items.extend(streamer.close())
+    return items
+
+
+def split_at(text: str, *offsets):
+    bounds = [0, *offsets, len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_split_at_every_offset(indent):
+    text = json.dumps(CARD, ensure_ascii=False, indent=indent)
+    # 确保存在转义引号和紧跟在反斜杠之后的切分位置
+    assert '\\"' in text and '\\\\"' in text
+    expected = json.loads(text)['data']['character_book']['entries']
+
+    for i in range(len(text) + 1):
+        assert stream(text, split_at(text, i)) == expected, i
+    assert stream(text, text) == expected
+
+
+def test_split_at_two_offsets_inside_entries():
+    text = json.dumps(CARD, ensure_ascii=False)
+    expected = CARD['data']['character_book']['entries']
+    start = text.index('"entries"')
+
+    for i in range(start, len(text)):
+        for j in range(i, min(i + 12, len(text))):
+            assert stream(text, split_at(text, i, j)) == expected, (i, j)
+
+
+def test_numbers_split_across_feeds():
+    text = '{"nums": [12345, -1.5e+30, 0, true, null, 7]}'
+
+    for i in range(len(text) + 1):
+        for j in range(i, len(text) + 1):
+            assert stream(text, split_at(text, i, j), [('nums',)]) == [12345, -1.5e+30, 0, True, None, 7], (i, j)
+
+
+def test_v2_top_level_entries():
+    text = json.dumps({'name': 'A', 'character_book': {'entries': [{'id': 0}, {'id': 1}]}})
+    assert stream(text, text) == [{'id': 0}, {'id': 1}]
+
+
+def test_incomplete_json_raises():
+    text = json.dumps(CARD)
+    with pytest.raises(ValueError):
+        stream(text, [text[:-3]])
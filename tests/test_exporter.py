@@ -0,0 +1,43 @@
+# test_exporter.py
+"""
+CharacterCardExporter 测试
+"""
+
+from exporter import CharacterCardExporter
+from models import card_view, parse_character_card
+
+
+def make_v3_card():
+    return parse_character_card({
+        'spec': 'chara_card_v3',
+        'spec_version': '3.0',
+        'name': 'Alice',
+        'description': '顶层描述',
+        'first_mes': '顶层开场白',
+        'tags': ['顶层标签'],
+        'data': {
+            'name': 'Alice',
+            'description': 'data 描述',
+            'personality': 'data 性格',
+            'first_mes': '',
+            'tags': ['data 标签'],
+            'creator': '作者',
+            'system_prompt': '系统提示词',
+        },
+    })
+
+
+def test_markdown_reads_v3_base_fields_from_top_level():
+    card = make_v3_card()
+    markdown = CharacterCardExporter.to_markdown(card)
+
+    # 顶层有的基础字段以顶层为准（顶层为空时不退回 data）
+    assert '顶层描述' in markdown and 'data 描述' not in markdown
+    assert '> 顶层开场白' in markdown
+    assert '顶层标签' in markdown and 'data 标签' not in markdown
+    assert 'data 性格' not in markdown
+    # 只存在于 data 的字段从 data 读取
+    assert '- **作者**: 作者' in markdown
+    assert '系统提示词' in markdown
+    # 传入视图时结果相同
+    assert CharacterCardExporter.to_markdown(card_view(card)) == markdown
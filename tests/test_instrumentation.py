@@ -0,0 +1,82 @@
+# test_instrumentation.py
+"""
+指标计数测试
+"""
+
+import threading
+import time
+
+from instrumentation import Metrics
+
+
+def test_counts_from_all_threads_are_merged():
+    metrics = Metrics()
+
+    def work():
+        for _ in range(1000):
+            metrics.increment("a")
+        metrics.increment("b", 5)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.increment("a")
+
+    # 线程结束后计数仍然保留
+    assert metrics.get("a") == 8001
+    assert metrics.snapshot() == {"a": 8001, "b": 40}
+
+
+def test_reset():
+    metrics = Metrics()
+    metrics.increment("a", 3)
+    metrics.reset()
+    assert metrics.get("a") == 0
+    metrics.increment("a")
+    assert metrics.snapshot() == {"a": 1}
+
+
+def test_exited_threads_are_folded_into_total():
+    metrics = Metrics()
+
+    def work():
+        metrics.increment("a")
+
+    for _ in range(200):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+    # 线程结束后计数字典合并到总数，不会随线程数量增长
+    deadline = time.monotonic() + 5
+    while metrics._live and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not metrics._live
+    assert metrics.get("a") == 200
+
+
+def test_reset_does_not_touch_other_threads_counts():
+    metrics = Metrics()
+    counted, resumed = threading.Event(), threading.Event()
+    seen = []
+
+    def work():
+        metrics.increment("a", 5)
+        counted.set()
+        resumed.wait()
+        seen.append(dict(metrics._local.counts))
+        metrics.increment("a")
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    counted.wait()
+    metrics.reset()
+    resumed.set()
+    thread.join()
+
+    # 清零只记录基准值，正在运行的线程自己的计数字典保持不变
+    assert seen == [{"a": 5}]
+    assert metrics.get("a") == 1
+    assert metrics.snapshot() == {"a": 1}
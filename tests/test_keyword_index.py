@@ -0,0 +1,41 @@
+# test_keyword_index.py
+"""
+KeywordIndex 测试
+"""
+
+from keyword_index import KeywordIndex
+from models import WorldBookEntry
+
+
+def make_entries(*keys):
+    return [WorldBookEntry(id=i, keys=[key]) for i, key in enumerate(keys)]
+
+
+def test_shadowed_chunk_members_still_match():
+    # 没有必需字面量的正则会合并执行；\d+ 在同一位置先命中并消耗整段数字，后面的成员被遮住
+    entries = make_entries(r'\d+', r'\d\d', r'\d{3}', r'[a-z]\d')
+    index = KeywordIndex(entries)
+    assert index._regex_chunks
+
+    assert index.match('123') == {0, 1, 2}
+    assert index.match('x1') == {0, 3}
+    assert index.match('没有数字') == set()
+
+
+def test_chunk_recheck_sees_text_before_hit():
+    # 其余成员从合并正则的命中位置开始复查，后顾断言仍然要能看到命中位置之前的文本
+    entries = make_entries(r'\d{3}', r'(?<=x)\d', r'\b\d')
+    index = KeywordIndex(entries)
+    assert index._regex_chunks
+
+    assert index.match('x123') == {0, 1}
+    assert index.match('y123') == {0}
+    assert index.match('y 123') == {0, 2}
+
+
+def test_chunk_respects_candidates():
+    entries = make_entries(r'\d+', r'\d\d', r'[a-z]\d')
+    index = KeywordIndex(entries)
+
+    assert index.match('a12', candidates={1}) >= {1}
+    assert 2 in index.match('a12', candidates={2})
@@ -0,0 +1,50 @@
+# test_lorebook_manager.py
+"""
+LorebookManager 测试
+"""
+
+import pytest
+
+from columnar_lorebook import ColumnarLorebook
+from lorebook_manager import LorebookManager
+from models import CharacterBook, WorldBookEntry, WorldBookEntryExtensions
+
+
+def make_book() -> CharacterBook:
+    entries = [
+        WorldBookEntry(id=i, keys=[] if i == 3 else [f'key{i}'], content='' if i == 2 else f'内容 {i}',
+                       constant=i % 4 == 0,
+                       extensions=WorldBookEntryExtensions(depth=i, role=i % 3, position=i % 2,
+                                                           vectorized=i == 5))
+        for i in range(8)
+    ]
+    return CharacterBook(name='book', entries=entries)
+
+
+def test_columnar_update_entry_raises():
+    manager = LorebookManager(ColumnarLorebook.from_book(make_book()))
+    with pytest.raises(TypeError):
+        manager.update_entry(1, content='新内容')
+    assert manager.get_entry(1).content == '内容 1'
+
+
+def test_columnar_add_entry_raises():
+    columnar = ColumnarLorebook.from_book(make_book())
+    manager = LorebookManager(columnar)
+    with pytest.raises(TypeError):
+        manager.add_entry(manager.create_entry('新条目', '内容'))
+    assert len(columnar) == 8
+
+
+def test_columnar_queries_match_book():
+    book = make_book()
+    manager = LorebookManager(book)
+    columnar = LorebookManager(ColumnarLorebook.from_book(book))
+
+    ids = lambda entries: [e.id for e in entries]
+    for entry_type in ('green', 'blue', 'vector'):
+        assert ids(columnar.find_by_type(entry_type)) == ids(manager.find_by_type(entry_type))
+    assert ids(columnar.find_by_role(1)) == ids(manager.find_by_role(1))
+    assert ids(columnar.find_by_position(1)) == ids(manager.find_by_position(1))
+    assert ids(columnar.find_by_depth(2, 5)) == ids(manager.find_by_depth(2, 5))
+    assert columnar.get_statistics() == manager.get_statistics()
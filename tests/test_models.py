@@ -0,0 +1,48 @@
+# test_models.py
+"""
+模型解析测试
+"""
+
+import gc
+
+from lorebook_handler import LorebookHandler
+from models import parse_character_card
+
+CARD = {
+    'spec': 'chara_card_v3',
+    'spec_version': '3.0',
+    'name': 'Alice',
+    'data': {
+        'name': 'Alice',
+        'description': '描述',
+        'character_book': {'name': 'book', 'entries': [
+            {'id': i, 'keys': [f'key{i}'], 'content': f'内容 {i}',
+             'extensions': {'position': i % 2, 'depth': i, 'scan_depth': 3 if i else None}}
+            for i in range(5)
+        ]},
+    },
+}
+
+STANDALONE = {
+    'name': 'book',
+    'entries': {str(i): {'uid': i, 'key': [f'key{i}'], 'content': f'内容 {i}', 'disable': i == 2}
+                for i in range(5)},
+}
+
+
+def test_trusted_parse_matches_validated():
+    card = parse_character_card(CARD).model_dump(by_alias=True)
+    validated = parse_character_card(card)
+    trusted = parse_character_card(card, trusted=True)
+    assert type(trusted) is type(validated)
+    assert trusted.model_dump() == validated.model_dump()
+    assert parse_character_card(card, lazy=True, trusted=True).model_dump() == validated.model_dump()
+    assert gc.isenabled()
+
+
+def test_trusted_standalone_matches_validated():
+    validated = LorebookHandler.parse_standalone_lorebook(STANDALONE)
+    trusted = LorebookHandler.parse_standalone_lorebook(STANDALONE, trusted=True)
+    assert trusted.model_dump() == validated.model_dump()
+    assert [e.enabled for e in trusted.entries] == [True, True, False, True, True]
+    assert gc.isenabled()
@@ -0,0 +1,105 @@
+# test_png_handler.py
+"""
+PNG 文本块读写测试
+"""
+
+import base64
+import io
+import json
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from png_handler import PNG_SIGNATURE, iter_png_chunks, read_card_data, save_card_data
+
+CARD = {'spec': 'chara_card_v2', 'spec_version': '2.0', 'name': '小雪', 'data': {'description': '描述 ü'}}
+CARD_TEXT = base64.b64encode(json.dumps(CARD).encode('utf-8')).decode('ascii')
+
+
+def chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def text_chunk(chunk_type: bytes, keyword: str, text: str) -> bytes:
+    key = keyword.encode('latin-1') + b'\x00'
+    if chunk_type == b'tEXt':
+        return chunk(chunk_type, key + text.encode('latin-1'))
+    if chunk_type == b'zTXt':
+        return chunk(chunk_type, key + b'\x00' + zlib.compress(text.encode('latin-1')))
+    # iTXt: 压缩标志 + 压缩方法 + 语言标签\0 + 翻译关键字\0 + 文本
+    return chunk(chunk_type, key + b'\x01\x00zh\x00\xe8\xa7\x92\xe8\x89\xb2\x00' + zlib.compress(text.encode('utf-8')))
+
+
+def split_chunks(data: bytes) -> list:
+    """拆分为完整块字节串列表（不含签名）"""
+    chunks = []
+    for _, length, data_offset in iter_png_chunks(io.BytesIO(data)):
+        chunks.append(data[data_offset - 8:data_offset + length + 4])
+    return chunks
+
+
+def make_png(*extra: bytes) -> bytes:
+    """1x1 PNG，额外的块插在 IHDR 之后"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    ihdr, *rest = split_chunks(buffer.getvalue())
+    return PNG_SIGNATURE + ihdr + b''.join(extra) + b''.join(rest)
+
+
+@pytest.mark.parametrize('chunk_type', [b'tEXt', b'zTXt', b'iTXt'])
+def test_read_text_chunk_types(tmp_path, chunk_type):
+    path = tmp_path / 'card.png'
+    path.write_bytes(make_png(text_chunk(chunk_type, 'chara', CARD_TEXT)))
+
+    assert read_card_data(str(path)) == CARD
+    # 与 Pillow 的解析结果一致
+    with Image.open(path) as image:
+        image.load()
+        assert image.info['chara'] == CARD_TEXT
+
+
+def test_ccv3_takes_priority_over_chara(tmp_path):
+    path = tmp_path / 'card.png'
+    old = base64.b64encode(json.dumps({'name': '旧'}).encode('utf-8')).decode('ascii')
+    path.write_bytes(make_png(text_chunk(b'tEXt', 'chara', old), text_chunk(b'iTXt', 'ccv3', CARD_TEXT)))
+
+    assert read_card_data(str(path)) == CARD
+
+
+def test_save_in_place_keeps_other_chunks(tmp_path):
+    path = tmp_path / 'card.png'
+    comment = text_chunk(b'tEXt', 'Comment', 'hello')
+    private = chunk(b'prIv', b'\x00\x01\x02')
+    path.write_bytes(make_png(comment, text_chunk(b'zTXt', 'chara', 'b2xk'), private))
+    before = split_chunks(path.read_bytes())
+
+    save_card_data(str(path), str(path), CARD)
+    after = split_chunks(path.read_bytes())
+
+    # IHDR 仍然是第一个块，新的文本块紧跟其后
+    assert after[0] == before[0]
+    assert after[1:3] == [text_chunk(b'tEXt', 'chara', CARD_TEXT), text_chunk(b'tEXt', 'ccv3', CARD_TEXT)]
+    # 旧的 chara 块被移除，其它块逐字节保留
+    assert after[3:] == [before[1]] + before[3:]
+    assert read_card_data(str(path)) == CARD
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_truncated_file_raises(tmp_path):
+    data = make_png(text_chunk(b'tEXt', 'chara', CARD_TEXT))
+    path = tmp_path / 'card.png'
+
+    # 缺少 IEND：找不到 ccv3 时会继续读到文件末尾
+    path.write_bytes(data[:-12])
+    with pytest.raises(ValueError):
+        read_card_data(str(path))
+
+    # 块数据被截断：写入失败，原文件保持不变，不留下临时文件
+    truncated = data[:-20]
+    path.write_bytes(truncated)
+    with pytest.raises(ValueError):
+        save_card_data(str(path), str(path), CARD)
+    assert path.read_bytes() == truncated
+    assert list(tmp_path.iterdir()) == [path]
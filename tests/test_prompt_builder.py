@@ -0,0 +1,259 @@
+# test_prompt_builder.py
+"""
+PromptBuilder 世界书激活测试
+"""
+
+import asyncio
+
+from lorebook_manager import LorebookManager
+from models import parse_character_card
+from prompt_builder import PromptBuilder
+from tokenizer import Tokenizer
+
+
+def make_card():
+    return parse_character_card({
+        'spec': 'chara_card_v3',
+        'spec_version': '3.0',
+        'name': 'Alice',
+        'data': {
+            'name': 'Alice',
+            'character_book': {'entries': [
+                {'id': 0, 'keys': ['猫'], 'content': '猫的设定'},
+                {'id': 1, 'keys': ['狗'], 'content': '狗的设定'},
+            ]},
+        },
+    })
+
+
+def card_with_entries(entries, **book):
+    return parse_character_card({
+        'spec': 'chara_card_v3',
+        'spec_version': '3.0',
+        'name': 'Alice',
+        'data': {'name': 'Alice', 'character_book': {**book, 'entries': entries}},
+    })
+
+
+def activated_ids(builder: PromptBuilder, message: str, chat_history=None):
+    return [entry.id for _, entry, _ in builder._activate_world_info(message, chat_history).activated]
+
+
+def chat(*contents):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': c} for i, c in enumerate(contents)]
+
+
+def test_keyword_edits_rebuild_index():
+    card = make_card()
+    builder = PromptBuilder(card)
+    assert activated_ids(builder, "我养了一只猫") == [0]
+
+    manager = LorebookManager(card.data.character_book)
+    manager.update_entry(0, keys=['鸟'])
+    assert activated_ids(builder, "我养了一只猫") == []
+    assert activated_ids(builder, "我养了一只鸟") == [0]
+
+
+def test_in_place_key_edit_with_touch():
+    card = make_card()
+    builder = PromptBuilder(card)
+    assert activated_ids(builder, "狗在叫") == [1]
+
+    book = card.data.character_book
+    book.entries[1].keys.append('狼')
+    book.touch()
+    assert activated_ids(builder, "狼在叫") == [1]
+
+
+def test_toggle_enabled_through_manager():
+    card = make_card()
+    builder = PromptBuilder(card)
+    manager = LorebookManager(card.data.character_book)
+    assert activated_ids(builder, "猫和狗") == [0, 1]
+
+    manager.update_entry(1, enabled=False)
+    assert activated_ids(builder, "猫和狗") == [0]
+
+
+def test_async_prefetch_skips_untriggered_entries_and_trimmed_history():
+    card = card_with_entries([
+        {'id': 0, 'keys': ['猫'], 'content': '猫: {{fast}}'},
+        {'id': 1, 'keys': ['狗'], 'content': '狗: {{slow}}'},
+    ])
+    builder = PromptBuilder(card)
+    calls = []
+
+    def make_callback(name, value):
+        async def callback(ctx):
+            calls.append(name)
+            return value
+        return callback
+
+    for name, value in (('fast', '快'), ('slow', '慢'), ('old', '旧'), ('new', '新')):
+        builder.register_variable(name, make_callback(name, value))
+
+    history = [
+        {'role': 'user', 'content': '很早的消息 {{old}}'},
+        {'role': 'assistant', 'content': '最近的消息 {{new}}'},
+    ]
+    messages = asyncio.run(builder.abuild_messages(chat_history=history, user_message='猫',
+                                                   max_history_messages=1))
+
+    assert sorted(calls) == ['fast', 'new']
+    contents = [m.content for m in messages]
+    assert any('猫: 快' in c for c in contents)
+    assert '最近的消息 新' in contents
+
+
+def test_scan_depth_limits_history_scan():
+    card = card_with_entries([
+        {'id': 0, 'keys': ['猫'], 'content': '猫的设定'},
+        {'id': 1, 'keys': ['狗'], 'content': '狗的设定', 'extensions': {'scan_depth': 3}},
+        {'id': 2, 'keys': ['鸟'], 'content': '鸟的设定', 'extensions': {'scan_depth': 0}},
+    ], scan_depth=2)
+    builder = PromptBuilder(card)
+
+    # 世界书的 scan_depth 为 2：只扫描最近两条消息；条目自带的扫描深度优先
+    assert activated_ids(builder, '', chat('猫 狗', '你好')) == [0, 1]
+    assert activated_ids(builder, '', chat('猫 狗', '你好', '嗯')) == [1]
+    assert activated_ids(builder, '', chat('猫 狗', '你好', '嗯', '好')) == []
+    # 扫描深度为 0 的条目只匹配用户消息
+    assert activated_ids(builder, '', chat('鸟')) == []
+    assert activated_ids(builder, '鸟', chat('你好')) == [2]
+
+
+def test_scan_depth_after_new_turns():
+    card = card_with_entries([
+        {'id': 0, 'keys': ['猫'], 'content': '猫的设定'},
+        {'id': 1, 'keys': ['狗'], 'content': '狗的设定'},
+    ], scan_depth=2)
+    builder = PromptBuilder(card)
+
+    history = chat('猫')
+    assert activated_ids(builder, '', history) == [0]
+    history += chat('狗')
+    assert activated_ids(builder, '', history) == [0, 1]
+    # 新的回合把旧消息推出扫描范围
+    history += chat('你好')
+    assert activated_ids(builder, '', history) == [1]
+    history += chat('再见')
+    assert activated_ids(builder, '', history) == []
+    # 没有设置 scan_depth 时只扫描用户消息
+    builder = PromptBuilder(make_card())
+    assert activated_ids(builder, '狗', chat('猫')) == [1]
+
+
+def chain_card(recursive=True, **flags):
+    """A -> B -> C 的递归链；flags 为 {条目名: extensions}"""
+    return card_with_entries([
+        {'id': 0, 'keys': ['A'], 'content': '提到 B', 'extensions': flags.get('a', {})},
+        {'id': 1, 'keys': ['B'], 'content': '提到 C', 'extensions': flags.get('b', {})},
+        {'id': 2, 'keys': ['C'], 'content': '结束', 'extensions': flags.get('c', {})},
+    ], recursive_scanning=recursive)
+
+
+def test_recursive_activation():
+    assert activated_ids(PromptBuilder(chain_card()), 'A') == [0, 1, 2]
+    assert activated_ids(PromptBuilder(chain_card(recursive=False)), 'A') == [0]
+
+
+def test_exclude_recursion():
+    builder = PromptBuilder(chain_card(b={'exclude_recursion': True}))
+    # B 不能被递归激活，链条在 A 处中断；用户消息仍然可以直接激活 B
+    assert activated_ids(builder, 'A') == [0]
+    assert activated_ids(builder, 'A B') == [0, 1, 2]
+
+
+def test_prevent_recursion():
+    builder = PromptBuilder(chain_card(b={'prevent_recursion': True}))
+    # B 被激活，但它的内容不再参与扫描
+    assert activated_ids(builder, 'A') == [0, 1]
+    assert activated_ids(builder, 'B') == [1]
+    assert activated_ids(builder, 'A C') == [0, 1, 2]
+
+
+def test_delay_until_recursion():
+    builder = PromptBuilder(chain_card(c={'delay_until_recursion': 2}))
+    assert activated_ids(builder, 'C') == []
+    assert activated_ids(builder, 'B') == [1, 2]
+    assert activated_ids(builder, 'A') == [0, 1, 2]
+
+
+def test_recursion_stops_at_max_steps():
+    entries = [{'id': i, 'keys': [f'k{i}'], 'content': f'k{i + 1}'} for i in range(6)]
+    builder = PromptBuilder(card_with_entries(entries, recursive_scanning=True), max_recursion_steps=3)
+    assert activated_ids(builder, 'k0') == [0, 1, 2, 3]
+
+
+class WordTokenizer(Tokenizer):
+    """按空白分词计数"""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def test_token_budget_constants_first_and_stops_at_first_miss():
+    card = card_with_entries([
+        {'id': 0, 'keys': ['猫'], 'content': 'k1 k2 k3', 'insertion_order': 300},
+        {'id': 1, 'keys': [], 'content': 'c1 c2', 'constant': True, 'insertion_order': 1},
+        {'id': 2, 'keys': ['猫'], 'content': 'w1 w2 w3 w4 w5 w6', 'insertion_order': 200},
+        {'id': 3, 'keys': ['猫'], 'content': 'x1', 'insertion_order': 100},
+        {'id': 4, 'keys': ['猫'], 'content': 'i1 i2 i3', 'insertion_order': 50,
+         'extensions': {'ignore_budget': True}},
+    ], token_budget=6)
+    builder = PromptBuilder(card, tokenizer=WordTokenizer())
+
+    activation = builder._activate_world_info('猫')
+    # 蓝灯条目先纳入，其次 insertion_order 大的；条目 2 放不下之后，更小的条目 3 也不再纳入
+    assert [entry.id for _, entry, _ in activation.activated] == [0, 1, 4]
+    assert [entry.id for _, entry in activation.over_budget] == [2, 3]
+    # ignore_budget 的条目总是纳入，但计入用量
+    assert activation.tokens == 8
+
+
+def test_no_token_budget_admits_everything():
+    card = card_with_entries([
+        {'id': 0, 'keys': ['猫'], 'content': 'a b c'},
+        {'id': 1, 'keys': [], 'content': 'd e', 'constant': True},
+    ])
+    activation = PromptBuilder(card, tokenizer=WordTokenizer())._activate_world_info('猫')
+    assert [entry.id for _, entry, _ in activation.activated] == [0, 1]
+    assert activation.over_budget == []
+    assert activation.tokens == 5
+
+
+def expected_recent(history, max_tokens):
+    """逐条累加的参考实现：保留总 token 数不超过 max_tokens 的最长后缀"""
+    used = 0
+    start = len(history)
+    while start > 0:
+        tokens = len(history[start - 1]['content'].split())
+        if used + tokens > max_tokens:
+            break
+        used += tokens
+        start -= 1
+    return history[start:]
+
+
+def test_history_token_trim_after_edits():
+    builder = PromptBuilder(make_card(), tokenizer=WordTokenizer())
+    history = chat('a', 'b b', 'c c c', 'd', 'e e e e')
+
+    def check():
+        for max_tokens in range(0, 14):
+            assert builder._recent_history(history, 0, max_tokens) == expected_recent(history, max_tokens), max_tokens
+
+    check()
+    # 追加消息：复用旧消息的前缀和
+    history += chat('f f', 'g')
+    check()
+    # 删除最后几条消息（重新生成回复）
+    del history[-2:]
+    check()
+    # 删除中间的消息、修改已有消息
+    del history[1]
+    check()
+    history[0] = {'role': 'user', 'content': 'a a a a a'}
+    check()
+    # 同时受消息数限制
+    assert builder._recent_history(history, 2, 100) == history[-2:]
@@ -0,0 +1,85 @@
+# test_snapshot.py
+"""
+二进制快照测试
+"""
+
+import marshal
+import zlib
+
+import pytest
+
+import snapshot
+from card_cache import CardCache
+from models import CharacterBook, WorldBookEntry, parse_character_card
+from snapshot import dumps_snapshot, loads_snapshot
+
+
+def make_card():
+    return parse_character_card({
+        'spec': 'chara_card_v3',
+        'spec_version': '3.0',
+        'name': 'Alice',
+        'data': {
+            'name': 'Alice',
+            'description': '描述',
+            'character_book': {'entries': [{'id': 1, 'keys': ['猫'], 'content': '猫很可爱'}]},
+        },
+    })
+
+
+def test_round_trip():
+    card = make_card()
+    book = CharacterBook(name='book', entries=[WorldBookEntry(id=2, keys=['k'], content='c')])
+    loaded = loads_snapshot(dumps_snapshot([card, book]))
+    assert [obj.model_dump() for obj in loaded] == [card.model_dump(), book.model_dump()]
+
+
+def test_marshal_version_mismatch_rejected():
+    data = bytearray(dumps_snapshot(make_card()))
+    data[6] = marshal.version + 1
+    with pytest.raises(ValueError):
+        loads_snapshot(bytes(data))
+
+
+def test_corrupted_payload_rejected():
+    data = bytearray(dumps_snapshot(make_card()))
+    data[-5] ^= 0xFF
+    with pytest.raises(ValueError):
+        loads_snapshot(bytes(data))
+
+
+@pytest.mark.parametrize('size', [snapshot._HEADER.size, snapshot._HEADER.size + 3, -1])
+def test_truncated_snapshot_rejected(size):
+    data = dumps_snapshot(make_card())
+    with pytest.raises(ValueError):
+        loads_snapshot(data[:size])
+
+
+def make_snapshot(payload: bytes, kind: int = 2) -> bytes:
+    header = snapshot._HEADER.pack(snapshot.SNAPSHOT_MAGIC, snapshot.SNAPSHOT_SCHEMA_VERSION, marshal.version, 0, 1)
+    return header + snapshot._RECORD.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+@pytest.mark.parametrize('payload', [
+    b'\xff\x00',                           # 无效的 marshal 数据
+    marshal.dumps([1, 2]),                  # 不是字段字典
+    marshal.dumps({'name': 'Alice'})[:-2],  # 截断的 marshal 数据（EOFError）
+])
+def test_decode_errors_become_value_error(payload):
+    # 校验和正确，解码或构建失败也只抛出 ValueError
+    with pytest.raises(ValueError):
+        loads_snapshot(make_snapshot(payload))
+
+
+def test_card_cache_treats_corrupted_snapshot_as_miss(tmp_path):
+    path = tmp_path / 'card.png'
+    path.write_bytes(b'png')
+    cache = CardCache(':memory:')
+    cache.put(str(path), make_card())
+
+    payload = bytearray(cache._conn.execute("SELECT payload FROM cards").fetchone()[0])
+    payload[-5] ^= 0xFF
+    cache._conn.execute("UPDATE cards SET payload = ?", (bytes(payload),))
+
+    assert cache.get(str(path)) is None
+    assert cache._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0] == 0
@@ -0,0 +1,73 @@
+# test_tokenizer.py
+"""
+分词器测试
+"""
+
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from lorebook_manager import LorebookManager
+from models import CharacterBook, WorldBookEntry
+from tokenizer import (
+    BPETokenizer, CachedTokenizer, EncodingTokenizer, EstimateTokenizer, Tokenizer,
+)
+
+
+def test_interfaces():
+    # 估算分词器只计数，不需要实现 encode
+    estimate = EstimateTokenizer()
+    assert estimate.count('你好 hello') == 4
+    assert not isinstance(estimate, EncodingTokenizer)
+    assert isinstance(BPETokenizer({}, []), EncodingTokenizer)
+
+    class Incomplete(EncodingTokenizer):
+        def count(self, text: str) -> int:
+            return 0
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        Tokenizer()
+
+
+def test_lorebook_manager_caches_counts():
+    book = CharacterBook(entries=[WorldBookEntry(id=i, keys=['k'], content='相同的内容') for i in range(3)])
+    manager = LorebookManager(book, tokenizer=EstimateTokenizer())
+    assert isinstance(manager.tokenizer, CachedTokenizer)
+
+    stats = manager.get_statistics()
+    assert stats['content']['estimated_tokens'] == 15
+    assert manager.tokenizer.misses == 1
+    assert manager.tokenizer.hits == 2
+
+    # 已经带缓存的分词器不再重复包装
+    cached = CachedTokenizer(EstimateTokenizer())
+    assert LorebookManager(book, tokenizer=cached).tokenizer is cached
+    assert LorebookManager(book).tokenizer is None
+
+
+
+def test_cached_tokenizer_eviction_from_another_thread():
+    cached = CachedTokenizer(EstimateTokenizer(), max_size=1)
+    assert cached.count('第一段') == 3
+    others = []
+
+    class InterleavedCounts(OrderedDict):
+        """在 get 和 move_to_end 之间让另一个线程写入并淘汰"""
+
+        def get(self, key, default=None):
+            value = super().get(key, default)
+            if value is not None and not others:
+                other = threading.Thread(target=cached.count, args=('另一段文本',))
+                others.append(other)
+                other.start()
+                other.join(0.2)
+            return value
+
+    cached._counts = InterleavedCounts(cached._counts)
+    assert cached.count('第一段') == 3
+    others[0].join()
+    assert len(cached) == 1
+    assert (cached.hits, cached.misses) == (1, 2)
@@ -0,0 +1,105 @@
+# test_variable_replacer.py
+"""
+VariableReplacer 测试
+"""
+
+import asyncio
+
+from instrumentation import metrics, UNKNOWN_VARIABLES
+from variable_replacer import VariableReplacer, SCOPE_PURE, SCOPE_RENDER
+
+
+def test_pure_result_follows_name_changes():
+    replacer = VariableReplacer(user_name="小明", char_name="爱丽丝")
+    text = "{{char}} 和 {{user}}"
+    assert replacer.replace(text) == "爱丽丝 和 小明"
+    assert replacer.replace(text) == "爱丽丝 和 小明"
+
+    replacer.user_name = "小红"
+    assert replacer.replace(text) == "爱丽丝 和 小红"
+
+
+def test_pure_result_follows_registration():
+    replacer = VariableReplacer()
+    text = "天气: {{weather}}"
+    replacer.register_variable("weather", lambda ctx: "晴", scope=SCOPE_PURE)
+    assert replacer.replace(text) == "天气: 晴"
+
+    replacer.register_variable("weather", lambda ctx: "雨", scope=SCOPE_PURE)
+    assert replacer.replace(text) == "天气: 雨"
+
+    replacer.unregister_variable("weather")
+    assert replacer.replace(text) == "天气: {{weather}}"
+
+
+def test_context_bypasses_cached_result():
+    replacer = VariableReplacer()
+    replacer.register_variable("mood", lambda ctx: ctx.get("mood", "平静"), scope=SCOPE_PURE)
+    assert replacer.replace("{{mood}}") == "平静"
+    assert replacer.replace("{{mood}}", {"mood": "开心"}) == "开心"
+    assert replacer.replace("{{mood}}") == "平静"
+
+
+def test_failed_pure_callback_is_not_cached():
+    replacer = VariableReplacer()
+    calls = []
+
+    def flaky(ctx):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("暂时失败")
+        return "成功"
+
+    replacer.register_variable("flaky", flaky, scope=SCOPE_PURE, fallback="")
+    assert replacer.replace("[{{flaky}}]") == "[]"
+    assert replacer.replace("[{{flaky}}]") == "[成功]"
+
+
+def test_render_and_volatile_scopes():
+    replacer = VariableReplacer()
+    counter = iter(range(100))
+    replacer.register_variable("tick", lambda ctx: next(counter), scope=SCOPE_RENDER)
+    replacer.register_variable("roll", lambda ctx: next(counter))
+
+    # render 变量在一次 replace 内只计算一次，volatile 变量每次出现都计算
+    assert replacer.replace("{{tick}} {{tick}}") == "0 0"
+    assert replacer.replace("{{tick}}") == "1"
+    assert replacer.replace("{{roll}} {{roll}}") == "2 3"
+
+    with replacer.render_scope():
+        assert replacer.replace("{{tick}}") == "4"
+        assert replacer.replace("{{tick}} {{char}}") == "4 Character"
+
+
+def test_unknown_variable_counted_every_call():
+    replacer = VariableReplacer()
+    before = metrics.get(UNKNOWN_VARIABLES)
+    for _ in range(3):
+        assert replacer.replace("{{nope}}") == "{{nope}}"
+    assert metrics.get(UNKNOWN_VARIABLES) - before == 3
+
+
+def test_concurrent_render_scopes_are_independent():
+    replacer = VariableReplacer()
+    delays = iter([0.0, 0.05])
+
+    async def news(ctx):
+        await asyncio.sleep(next(delays))
+        return "头条"
+
+    replacer.register_variable("news", news)
+
+    async def render():
+        with replacer.render_scope() as memo:
+            await replacer.aprefetch(["{{news}}"])
+            await asyncio.sleep(0)
+            return replacer.replace("新闻: {{news}}"), memo
+
+    async def main():
+        return await asyncio.gather(render(), render())
+
+    (first, first_memo), (second, second_memo) = asyncio.run(main())
+    # 先结束的任务退出作用域不影响另一个任务，两个任务也不共享预先计算的结果
+    assert first == second == "新闻: 头条"
+    assert first_memo is not second_memo
+    assert replacer._render_memo.get() is None